@@ -8,27 +8,119 @@ If accelerometer not detected, program will exit.
 Install Blinka and LIS3DH support with:
 sudo pip3 install adafruit-circuitpython-lis3dh
 sudo pip3 install adafruit-circuitpython-busdevice
+(These aren't needed with --source=tilt or --source=replay:FILE, which
+drive the sand without a sensor; see accelsource.py.)
 """
 
-# pylint: disable=import-error
+# pylint: disable=import-error, too-many-locals, too-many-branches, too-many-statements
 
-import board
-import busio
-import adafruit_lis3dh
+from contextlib import ExitStack
+from PIL import Image
 from spectrobase import SpectroBase
-from pixeldust import PixelDust
+from accelsource import open_source
+from pixeldust import ENGINES, SAND, WATER, FixedTimestep
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+def parse_color(text):
+    """Return (R, G, B) tuple from hex string, e.g. '0096FA'."""
+    value = int(text.lstrip("#"), 16)
+    return ((value >> 16) & 0xFF, (value >> 8) & 0xFF, value & 0xFF)
+
+class SandRenderer(object):
+    """Draws all grains of a NumpyPixelDust at once: each grain's color
+       index is looked up in a palette (a list of (R, G, B), up to 256)
+       and the results scattered into a NumPy frame over a background
+       image (or black), which is uploaded to the canvas with one
+       SetImage() call."""
+
+    def __init__(self, width, height, palette, background=None):
+        self.width = width
+        self.palette = np.array(palette, dtype=np.uint8)
+        if background is not None:
+            self.background = np.array(background.convert("RGB"))
+        else:
+            self.background = np.zeros((height, width, 3), dtype=np.uint8)
+        self.frame = self.background.copy()
+        self.pixels = self.frame.reshape(-1, 3)  # View, one row per pixel
+
+    def render(self, canvas, dust):
+        """Draw dust's grains into canvas."""
+        self.frame[:] = self.background
+        position_x, position_y = dust.get_positions()
+        index = position_y.astype(np.intp) * self.width
+        index += position_x.astype(np.intp)
+        self.pixels[index] = self.palette[dust.color]
+        canvas.SetImage(Image.fromarray(self.frame))
 
 class AccelSand(SpectroBase):
     """LIS3DH accelerometer-based "LED sand" for Adafruit Spectro."""
 
     def __init__(self, *args, **kwargs):
         super(AccelSand, self).__init__(*args, **kwargs)
+        self.accelerometer = None
+        self.dust = None
+        self.timestep = None
+        self.renderer = None
+        self.background = None
+        self.palette = None
+        # Frame slots at the simulation rate (--hz, set in run()) unless
+        # --fps is given, but frames are only drawn when an iteration ran
+        # (see needs_redraw())
+        self.on_change = True
 
         self.parser.add_argument(
             "-e", "--elasticity", help="Elasticity (bounce) 0.0 to 1.0",
             default=0.1)
         self.parser.add_argument(
             "-g", "--grains", help="Number of grains")
+        self.parser.add_argument(
+            "--engine", help="Simulation engine: 'numpy' (grains as "
+            "arrays, default if NumPy is installed) or 'reference' "
+            "(original grain-at-a-time version)", choices=sorted(ENGINES),
+            default="numpy" if np is not None else "reference")
+        self.parser.add_argument(
+            "--obstacles", help="Image file (scaled to the matrix size) "
+            "whose non-black pixels are obstacles, drawn behind the sand")
+        self.parser.add_argument(
+            "--colors", help="Sand colors, as comma-separated hex RGB; "
+            "grains get one of these at random (numpy engine only). "
+            "Default: 0096FA", default="0096FA")
+        self.parser.add_argument(
+            "--water", help="Fraction of grains that are water, which "
+            "flows and levels out (numpy engine only). Default: 0",
+            default=0.0, type=float)
+        self.parser.add_argument(
+            "--water-color", help="Water color, hex RGB. Default: 1030FF",
+            default="1030FF")
+        self.parser.add_argument(
+            "--hz", help="Simulation iterations per second, whatever the "
+            "frame rate. Default: 60", default=60.0, type=float)
+        self.parser.add_argument(
+            "--max-steps", help="Most iterations to run per frame when "
+            "catching up; beyond this the sand slows down. Default: 4",
+            default=4, type=int)
+        self.parser.add_argument(
+            "--seed", help="Random seed, for a repeatable simulation",
+            type=int)
+        self.parser.add_argument(
+            "--source", help="Accelerometer: 'lis3dh[:ADDRESS]' (I2C "
+            "sensor), 'tilt[:SECONDS]' (scripted, gravity turning) or "
+            "'replay:FILE' (from --record). Default: lis3dh",
+            default="lis3dh")
+        self.parser.add_argument(
+            "--sample-rate", help="Accelerometer readings per second, "
+            "taken by a background thread. Default: 200", default=200.0,
+            type=float)
+        self.parser.add_argument(
+            "--filter", help="Accelerometer smoothing: 'none', "
+            "'lowpass[:ALPHA]' or 'median[:N]'. Default: none",
+            default="none")
+        self.parser.add_argument(
+            "--record", help="Write raw accelerometer readings to this "
+            "file, for --source replay:FILE")
 
     def run(self):
 
@@ -44,39 +136,77 @@ class AccelSand(SpectroBase):
         else:
             elasticity = 0.1
 
-        i2c = busio.I2C(board.SCL, board.SDA)
-        accelerometer = adafruit_lis3dh.LIS3DH_I2C(i2c, address=0x18)
-        accelerometer.range = adafruit_lis3dh.RANGE_4_G
-        acceleration = (0.0, 9.8, 0.0)
-
-        # Create offscreen buffer for graphics
-        double_buffer = self.matrix.CreateFrameCanvas()
-
-        # Create pixeldust object
-        dust = PixelDust(self.matrix.width, self.matrix.height, elasticity)
-
-        # Initialize with random sand
-        dust.randomize(num_grains)
-
-        while True:
-            try:
-                acceleration = accelerometer.acceleration
-                # If using a non-default orientation for the accelerometer,
-                # you can swap or invert axes as needed here:
-                # acceleration = (-acceleration[2], acceleration[1],
-                #                acceleration[0])
-            except OSError:
-                # Keep last value
-                pass
-            dust.iterate(acceleration)
-
-            # Render sand
-            double_buffer.Clear()
-            for i in range(num_grains):
-                position_x, position_y = dust.get_position(i)
-                double_buffer.SetPixel(position_x, position_y, 0, 150, 250)
-
-            double_buffer = self.matrix.SwapOnVSync(double_buffer)
+        # Everything acquired below is released, newest first, when the
+        # loop ends or if any step of setup fails.
+        with ExitStack() as cleanup:
+            # The accelerometer is read by its own thread, so I2C latency
+            # and errors never hold up a frame; each frame takes the latest
+            # value.
+            record = None
+            if self.args.record:
+                record = cleanup.enter_context(open(self.args.record, "w"))
+            self.accelerometer = open_source(
+                self.args.source, self.args.sample_rate, self.args.filter,
+                record=record)
+            if self.stats is not None:
+                self.stats.counters["accel"] = self.accelerometer.counters
+
+            # Create pixeldust object
+            self.dust = ENGINES[self.args.engine](
+                self.matrix.width, self.matrix.height, elasticity,
+                self.args.seed)
+            cleanup.callback(self.dust.close)
+            self.timestep = FixedTimestep(self.dust, self.args.hz,
+                                          self.args.max_steps)
+
+            # Load obstacles, if any, then initialize with random sand
+            self.background = None
+            if self.args.obstacles:
+                self.background = Image.open(
+                    self.args.obstacles).convert("RGB").resize(
+                        (self.matrix.width, self.matrix.height))
+                self.dust.set_obstacles(self.background)
+            self.dust.randomize(num_grains)
+
+            # Grain colors & materials: palette holds the sand colors, then
+            # water's
+            self.palette = [parse_color(color) for color in
+                            self.args.colors.split(",")]
+            self.renderer = None
+            if self.args.engine == "numpy":
+                dust = self.dust
+                water = dust.random.random(dust.num_grains) < self.args.water
+                dust.set_colors(np.where(
+                    water, len(self.palette),
+                    dust.random.integers(len(self.palette),
+                                         size=dust.num_grains)))
+                dust.set_materials(np.where(water, WATER, SAND))
+                self.palette.append(parse_color(self.args.water_color))
+                self.renderer = SandRenderer(
+                    self.matrix.width, self.matrix.height, self.palette,
+                    self.background)
+
+            self.fps = self.args.hz
+            self.accelerometer.start()
+            cleanup.callback(self.accelerometer.stop)
+            self.run_frames()  # Calls needs_redraw() & render() each frame
+
+    def needs_redraw(self):
+        """Advance the simulation by the iterations due (see --hz); the
+           sand only needs redrawing if it moved."""
+        return self.timestep.advance(self.accelerometer.latest()) > 0
+
+    def render(self, canvas):
+        if self.renderer is not None:
+            self.renderer.render(canvas, self.dust)
+        else:  # Reference engine, one grain at a time, 1st color
+            if self.background is not None:
+                canvas.SetImage(self.background)
+            else:
+                canvas.Clear()
+            for i in range(self.dust.num_grains):
+                position_x, position_y = self.dust.get_position(i)
+                canvas.SetPixel(position_x, position_y, *self.palette[0])
 
 if __name__ == "__main__":
     MY_APP = AccelSand()  # Instantiate class, calls __init__() above
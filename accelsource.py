@@ -0,0 +1,275 @@
+#!/usr/bin/env python
+
+"""
+Accelerometer sources for accel.py. Sampling runs independently of the
+display: each source's thread polls the sensor at its own rate, filters
+the readings and stores the newest in a single latest-value slot, which
+the renderer reads whenever it draws a frame without waiting on the bus.
+Counters track sensor reads, read errors (after which the last good value
+is kept) and stale frames (drawn with no new reading since the last).
+
+Sources are chosen with a spec string (see open_source()):
+  lis3dh           LIS3DH on I2C at address 0x18, via Blinka
+  lis3dh:ADDR      LIS3DH at another I2C address, e.g. lis3dh:0x19
+  tilt             scripted: gravity circling once every 10 seconds, so
+                   sand can be tested on a machine without a sensor
+  tilt:SECONDS     as above, one turn every SECONDS
+  replay:FILE      readings recorded with accel.py --record, looped
+
+Readings can be smoothed with a filter spec (see open_filter()):
+  none             raw readings
+  lowpass[:ALPHA]  exponential moving average, new = ALPHA (default 0.2)
+                   of the reading plus the rest of the previous value
+  median[:N]       per-axis median of the last N readings (default 5),
+                   which rejects occasional glitches without lag on steps
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, import-error
+
+import math
+import time
+import threading
+from collections import deque
+
+class LowPassFilter(object):
+    """Exponential moving average of (X, Y, Z) readings."""
+
+    def __init__(self, alpha=0.2):
+        self.alpha = alpha
+        self.value = None
+
+    def apply(self, reading):
+        """Add a reading, return the filtered value."""
+        if self.value is None:
+            self.value = reading
+        else:
+            self.value = tuple(old + self.alpha * (new - old)
+                               for old, new in zip(self.value, reading))
+        return self.value
+
+class MedianFilter(object):
+    """Per-axis median of the last 'size' (X, Y, Z) readings."""
+
+    def __init__(self, size=5):
+        self.history = deque(maxlen=size)
+
+    def apply(self, reading):
+        """Add a reading, return the filtered value."""
+        self.history.append(reading)
+        middle = len(self.history) // 2
+        return tuple(sorted(axis)[middle] for axis in zip(*self.history))
+
+class AccelSource(object):
+    """Base class for accelerometer sources. Subclasses implement read()
+       (and open()/close() if there's a device to open). If realtime, a
+       thread calls read() 'rate' times per second; otherwise each
+       latest() reads once itself, which makes offline runs
+       deterministic. Readings pass through 'filter' (see open_filter(),
+       None for raw) into 'value', and if 'record' is an open file, raw
+       readings are also written to it for ReplaySource."""
+
+    def __init__(self, rate=200.0, filter=None, realtime=True, record=None):
+        # pylint: disable=redefined-builtin
+        self.rate = rate
+        self.filter = filter
+        self.realtime = realtime
+        self.record = record
+        # Latest filtered (X, Y, Z) in m/s^2. Replaced whole (one
+        # reference assignment, atomic in Python) so readers never see a
+        # partial update and never need a lock. Until the first reading,
+        # gravity straight down the display.
+        self.value = (0.0, 9.8, 0.0)
+        self.reads = 0           # Successful sensor reads
+        self.errors = 0          # Failed sensor reads (OSError)
+        self.stale = 0           # latest() calls with no new reading
+        self.read_count = 0      # reads at last latest()
+        self.start_time = None   # time.monotonic() at start()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def read(self):
+        """Override in subclass: return one (X, Y, Z) reading in m/s^2.
+           May raise OSError (e.g. I2C error), which is counted."""
+        raise NotImplementedError()
+
+    def open(self):
+        """Override in subclass to open the sensor, called from start()."""
+
+    def close(self):
+        """Override in subclass to release the sensor, from stop()."""
+
+    def start(self):
+        """Open the sensor and (if realtime) begin sampling."""
+        self.open()
+        self.start_time = time.monotonic()
+        if self.realtime:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.sample_loop)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def stop(self):
+        """Stop sampling and release the sensor."""
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.close()
+
+    def sample(self):
+        """Take one reading, filter and store it."""
+        try:
+            reading = tuple(float(axis) for axis in self.read())
+        except OSError:
+            self.errors += 1  # Keep last value
+            return
+        if self.record is not None:
+            self.record.write("%.4f,%.4f,%.4f,%.4f\n" % (
+                (time.monotonic() - self.start_time,) + reading))
+        if self.filter is not None:
+            reading = self.filter.apply(reading)
+        self.value = reading
+        self.reads += 1
+
+    def sample_loop(self):
+        """Real-time thread body."""
+        period = 1.0 / self.rate
+        deadline = time.monotonic()
+        while not self.stopped.is_set():
+            self.sample()
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self.stopped.wait(delay)
+            elif delay < -period:  # Fell behind (slow bus), don't rush
+                deadline = time.monotonic()
+
+    def latest(self):
+        """Return the most recent filtered (X, Y, Z) reading, never
+           waiting on the sensor, counting it stale if there's been no new
+           reading since the last call."""
+        if not self.realtime:
+            self.sample()
+        if self.reads == self.read_count:
+            self.stale += 1
+        self.read_count = self.reads
+        return self.value
+
+    def elapsed(self):
+        """Seconds since start() (or, if not realtime, 1/rate per reading
+           taken, so scripted and replayed motion is independent of the
+           frame rate)."""
+        if self.realtime:
+            return time.monotonic() - self.start_time
+        return (self.reads + self.errors) / float(self.rate)
+
+    def counters(self):
+        """Return dict of sampling statistics (for FrameStats reports)."""
+        return {"reads": self.reads, "errors": self.errors,
+                "stale": self.stale}
+
+class LIS3DHSource(AccelSource):
+    """LIS3DH accelerometer on the Pi's I2C pins, 4 G range."""
+
+    def __init__(self, address=0x18, **kwargs):
+        super(LIS3DHSource, self).__init__(**kwargs)
+        self.address = address
+        self.i2c = None
+        self.sensor = None
+
+    def open(self):
+        import board  # Only needed for the real sensor
+        import busio
+        import adafruit_lis3dh
+        self.i2c = busio.I2C(board.SCL, board.SDA)
+        try:
+            self.sensor = adafruit_lis3dh.LIS3DH_I2C(self.i2c,
+                                                     address=self.address)
+            self.sensor.range = adafruit_lis3dh.RANGE_4_G
+        except (OSError, ValueError, RuntimeError):  # No sensor found
+            self.close()
+            raise
+
+    def close(self):
+        self.sensor = None
+        if self.i2c is not None:
+            self.i2c.deinit()
+            self.i2c = None
+
+    def read(self):
+        # If using a non-default orientation for the accelerometer,
+        # you can swap or invert axes as needed here, e.g.:
+        # x, y, z = self.sensor.acceleration
+        # return (-z, y, x)
+        return self.sensor.acceleration
+
+class TiltSource(AccelSource):
+    """Scripted motion: 1 G of gravity circling in the display plane once
+       every 'seconds', as if the display were slowly turned."""
+
+    def __init__(self, seconds=10.0, **kwargs):
+        super(TiltSource, self).__init__(**kwargs)
+        self.seconds = seconds
+
+    def read(self):
+        angle = 2.0 * math.pi * self.elapsed() / self.seconds
+        return (9.8 * math.sin(angle), 9.8 * math.cos(angle), 1.0)
+
+class ReplaySource(AccelSource):
+    """Plays back readings from a file written with 'record': one
+       'seconds,x,y,z' line per reading. Each read() returns the last
+       recorded reading at or before the elapsed time, looping at the
+       end."""
+
+    def __init__(self, path, **kwargs):
+        super(ReplaySource, self).__init__(**kwargs)
+        self.times = []
+        self.readings = []
+        with open(path) as lines:
+            for line in lines:
+                if line.strip():
+                    fields = [float(field) for field in line.split(",")]
+                    self.times.append(fields[0])
+                    self.readings.append(tuple(fields[1:4]))
+        if not self.readings:
+            raise ValueError("%s: no accelerometer readings" % path)
+        self.index = 0
+
+    def read(self):
+        now = self.elapsed() % (self.times[-1] or 1.0)
+        if now < self.times[self.index]:  # Looped around
+            self.index = 0
+        while (self.index + 1 < len(self.times) and
+               self.times[self.index + 1] <= now):
+            self.index += 1
+        return self.readings[self.index]
+
+def open_filter(spec):
+    """Return a filter (or None) from a spec string as in this module's
+       docstring."""
+    kind, _, option = spec.partition(":")
+    if kind == "none":
+        return None
+    if kind == "lowpass":
+        return LowPassFilter(float(option) if option else 0.2)
+    if kind == "median":
+        return MedianFilter(int(option) if option else 5)
+    raise ValueError("Unknown accelerometer filter '%s'" % spec)
+
+def open_source(spec, rate=200.0, filter_spec="none", realtime=True,
+                record=None):
+    """Return an AccelSource (not yet started) from a spec string as in
+       this module's docstring, sampling 'rate' times per second through
+       the filter given by 'filter_spec'. realtime and record are as for
+       AccelSource."""
+    kind, _, option = spec.partition(":")
+    kwargs = {"rate": rate, "filter": open_filter(filter_spec),
+              "realtime": realtime, "record": record}
+    if kind == "lis3dh":
+        return LIS3DHSource(int(option, 0) if option else 0x18, **kwargs)
+    if kind == "tilt":
+        return TiltSource(float(option) if option else 10.0, **kwargs)
+    if kind == "replay":
+        return ReplaySource(option, **kwargs)
+    raise ValueError("Unknown accelerometer source '%s'" % spec)
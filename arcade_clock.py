@@ -161,6 +161,10 @@ class ArcadeClock(SpectroBase):
         self.current_time = 0
         self.image = None
         self.draw = None
+        # Sprites move with time, so any rate works; 30 frames/sec keeps
+        # their motion smooth (the mouth's own animation is 20 frames/sec,
+        # see draw_mouth_*())
+        self.fps = 30
 
     def set_two_digits(self, first_sprite, value):
         """Set the image indices for two adjacent Sprites, used for
@@ -318,69 +322,65 @@ class ArcadeClock(SpectroBase):
 
 
     def run(self):
-
-        # Create offscreen buffer for graphics
-        double_buffer = self.matrix.CreateFrameCanvas()
-
         # Create PIL image and drawing context
         self.image = Image.new("RGB", (self.matrix.width, self.matrix.height))
         self.draw = ImageDraw.Draw(self.image)
 
         self.load_sprites(self.matrix.width > 32)
 
-        while True:
+        self.run_frames()  # Calls render() each frame
 
-            self.current_time = time.time()
+    def render(self, canvas):
+        self.current_time = time.time()
 
-            localtime = time.localtime(self.current_time)
-            if TWELVE_HOUR:
-                hour = localtime.tm_hour % 12
-                if hour == 0:
-                    hour = 12
-            else:
-                hour = localtime.tm_hour
-
-            # Configure time sprites (HH:MM:SS)
-            self.set_two_digits(1, hour)
-            self.set_two_digits(4, localtime.tm_min)
-            self.set_two_digits(7, localtime.tm_sec)
-
-            # Configure date sprites (MM.DD.YY) or (YY:MM:DD)
-            if EURO_DATE:
-                self.set_two_digits(9, localtime.tm_year % 100)
-                self.set_two_digits(12, localtime.tm_mon)
-                self.set_two_digits(15, localtime.tm_mday)
-            else:
-                self.set_two_digits(9, localtime.tm_mon)
-                self.set_two_digits(12, localtime.tm_mday)
-                self.set_two_digits(15, localtime.tm_year % 100)
-
-            # Animate mouth around maze
-            if self.matrix.width > 32:
-                frac, x_pos, y_pos = self.draw_mouth_large()
-                self.eat_digits(x_pos, y_pos, 6, 2)
-                self.draw_ghost_large(frac)
-            else:
-                frac, x_pos, y_pos = self.draw_mouth_small()
-                self.eat_digits(x_pos, y_pos, 3, 2)
-                self.draw_ghost_small(frac)
-
-            # Clear image, draw sprites in back-to-front order:
-            self.draw.rectangle((0, 0, self.matrix.width, self.matrix.height),
-                                fill=0)
-            for sprite in self.sprite_list:
-                self.image.paste(
-                    sprite.adjusted_brightness(),
-                    (sprite.x_pos, sprite.y_pos,
-                     sprite.x_pos + self.sprite_coords_list[
-                         sprite.image_index][2],
-                     sprite.y_pos + self.sprite_coords_list[
-                         sprite.image_index][3]),
-                    mask=self.sprite_data[sprite.image_index])
-
-            # Copy PIL image to matrix buffer, swap buffers each frame
-            double_buffer.SetImage(self.image)
-            double_buffer = self.matrix.SwapOnVSync(double_buffer)
+        localtime = time.localtime(self.current_time)
+        if TWELVE_HOUR:
+            hour = localtime.tm_hour % 12
+            if hour == 0:
+                hour = 12
+        else:
+            hour = localtime.tm_hour
+
+        # Configure time sprites (HH:MM:SS)
+        self.set_two_digits(1, hour)
+        self.set_two_digits(4, localtime.tm_min)
+        self.set_two_digits(7, localtime.tm_sec)
+
+        # Configure date sprites (MM.DD.YY) or (YY:MM:DD)
+        if EURO_DATE:
+            self.set_two_digits(9, localtime.tm_year % 100)
+            self.set_two_digits(12, localtime.tm_mon)
+            self.set_two_digits(15, localtime.tm_mday)
+        else:
+            self.set_two_digits(9, localtime.tm_mon)
+            self.set_two_digits(12, localtime.tm_mday)
+            self.set_two_digits(15, localtime.tm_year % 100)
+
+        # Animate mouth around maze
+        if self.matrix.width > 32:
+            frac, x_pos, y_pos = self.draw_mouth_large()
+            self.eat_digits(x_pos, y_pos, 6, 2)
+            self.draw_ghost_large(frac)
+        else:
+            frac, x_pos, y_pos = self.draw_mouth_small()
+            self.eat_digits(x_pos, y_pos, 3, 2)
+            self.draw_ghost_small(frac)
+
+        # Clear image, draw sprites in back-to-front order:
+        self.draw.rectangle((0, 0, self.matrix.width, self.matrix.height),
+                            fill=0)
+        for sprite in self.sprite_list:
+            self.image.paste(
+                sprite.adjusted_brightness(),
+                (sprite.x_pos, sprite.y_pos,
+                 sprite.x_pos + self.sprite_coords_list[
+                     sprite.image_index][2],
+                 sprite.y_pos + self.sprite_coords_list[
+                     sprite.image_index][3]),
+                mask=self.sprite_data[sprite.image_index])
+
+        # Copy PIL image to matrix buffer
+        canvas.SetImage(self.image)
 
 if __name__ == "__main__":
     MY_APP = ArcadeClock()  # Instantiate class, calls __init__() above
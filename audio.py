@@ -1,204 +1,294 @@
 #!/usr/bin/env python
 
 """
-Audio spectrum display for Adafruit Spectro. This is designed to be fun to
+Audio spectrum display for Adafruit Spectro, as a bar graph or (with
+--mode=waterfall) scrolling spectrogram. This is designed to be fun to
 look at, not a Serious Audio Tool(tm). Requires USB microphone & ALSA config.
 Prerequisite libraries include PyAudio and NumPy:
 sudo apt-get install python3-pyaudio python3-numpy
+(PyAudio isn't needed with --source=wav:FILE or --source=synth; see
+audiosource.py.)
 See the following for ALSA config (use Stretch directions):
 learn.adafruit.com/usb-audio-cards-with-a-raspberry-pi/updating-alsa-config
 """
 
 # Gets code to pass both pylint & pylint3:
-# pylint: disable=superfluous-parens, no-self-use, too-many-locals, too-many-branches, too-many-statements, import-error
+# pylint: disable=superfluous-parens, no-self-use, too-many-locals, too-many-branches, too-many-statements, import-error, attribute-defined-outside-init
 
 
+import colorsys
 import numpy as np
 from PIL import Image
-from PIL import ImageDraw
 from spectrobase import SpectroBase
-import pyaudio
+from spectrum import LogBinner, SpectrumAnalyzer, OnsetDetector, WINDOWS
+from audiosource import open_source
 
-FORMAT = pyaudio.paInt16  # Data format from audio device (16-bit int)
-CHANNELS = 1              # Mono's fine for what we're doing
 RATE = 32000              # Balance audio quality & frame rate
-CHUNK = 512               # Audio samples to read per frame
+CHUNK = 512               # Audio samples per capture block
+FFT_SIZE = 1024           # Default --fft-size
 NOISE = 2                 # Subtraced from FFT output to avoid sparkles
+# LEAST and MOST are bins of a FFT_SIZE-point FFT at RATE, and are scaled
+# to the same frequencies for other --fft-size values or WAV sample rates.
 LEAST = 50                # Lowest bin of FFT output to use for graph
-MOST = 300                # Highest bin (0 to CHUNK-1). Bit above C7-ish
+MOST = 300                # Highest bin (0 to FFT_SIZE/2-1). Bit above C7-ish
 EXPONENT = 2.5            # Column-to-FFT-bin nonlinear mapping
+# Waterfall mode color map, from silent to loudest: (level, (R, G, B))
+HEAT = ((0.0, (0, 0, 0)), (0.25, (0, 0, 160)), (0.5, (200, 0, 80)),
+        (0.75, (255, 160, 0)), (1.0, (255, 255, 255)))
+
+def heat_palette(size=256):
+    """Return (size, 3) uint8 array interpolating the HEAT color map,
+       for looking up levels scaled to 0 to size-1."""
+    levels = np.linspace(0.0, 1.0, size)
+    stops = [stop for stop, _ in HEAT]
+    return np.array([np.interp(levels, stops, [color[channel]
+                                               for _, color in HEAT])
+                     for channel in range(3)]).T.round().astype(np.uint8)
 
 class AudioSpectrum(SpectroBase):
     """Audio spectrum display for Adafruit Spectro."""
 
-# Not currently used (no args, no self.* variables)
-#    def __init__(self, *args, **kwargs):
-#        super(AudioSpectrum, self).__init__(*args, **kwargs)
-
-    def weight(self, pos, center, width):
-        """Used for 'weighting' values from the spectrum output into display
-           columns. Given a position 'pos' along X axis of spectrum out,
-           compute corresponding Y for cubic curve centered on 'center' with
-           range +/- 'width'. Returns 0.0 (outside or at very edge of curve)
-           to 1.0 (peak at center of curve)."""
-        dist = abs(pos - center) / width  # Normalized distance from center
-        if dist >= 1.0:                   # Not on curve
-            return 0.0
-        dist = 1.0 - dist                 # Invert dist so 1.0 is at center
-        return ((3.0 - (dist * 2.0)) * dist) * dist
+    def __init__(self, *args, **kwargs):
+        super(AudioSpectrum, self).__init__(*args, **kwargs)
+        self.fps = 30  # About the rate new audio blocks arrive
+        self.source = None
+        self.parser.add_argument(
+            "--source", action="store", help="Audio source: 'mic' (default "
+            "input device), 'mic:N' (PyAudio device index N), 'wav:FILE' "
+            "(looped WAV file) or 'synth[:HZ,HZ...]' (test tones). "
+            "Default: mic", default="mic", type=str)
+        self.parser.add_argument(
+            "--offline", action="store_true", help="WAV/synth sources "
+            "advance one block per frame rather than in real time (for "
+            "benchmarking, e.g. with --fps 0)")
+        self.parser.add_argument(
+            "--fft-size", action="store", help="Samples per FFT; larger "
+            "gives finer frequency resolution but more latency. "
+            "Default: %d" % FFT_SIZE, default=FFT_SIZE, type=int)
+        self.parser.add_argument(
+            "--window", action="store", help="FFT window function. "
+            "Default: rect (none)", choices=sorted(WINDOWS), default="rect")
+        self.parser.add_argument(
+            "--hop", action="store", help="Samples between successive "
+            "FFTs (overlapping if less than --fft-size). Default: half "
+            "of --fft-size", type=int)
+        self.parser.add_argument(
+            "--average", action="store", help="Average this many successive "
+            "spectra, for a smoother display. Default: 1", default=1,
+            type=int)
+        self.parser.add_argument(
+            "--mode", action="store", help="'bars' (spectrum graph) or "
+            "'waterfall' (scrolling spectrogram, newest at bottom). "
+            "Default: bars", choices=("bars", "waterfall"), default="bars")
+        self.parser.add_argument(
+            "--beat", action="store", help="Effect on detected beats: "
+            "'flash' (bars and peaks flash white), 'pulse' (brightness "
+            "pulses) or 'none'. Default: none",
+            choices=("none", "flash", "pulse"), default="none")
 
     def run(self):
 
-        # Access USB mic via PyAudio
-        audio = pyaudio.PyAudio()
-        stream = audio.open(
-            format=FORMAT,
-            channels=CHANNELS,
-            rate=RATE,
-            input=True,
-            output=False,
-            frames_per_buffer=CHUNK)
-
-        # Create offscreen buffer for graphics
-        double_buffer = self.matrix.CreateFrameCanvas()
-
-        # Create PIL image and drawing context
-        image = Image.new("RGB", (self.matrix.width, self.matrix.height))
-        draw = ImageDraw.Draw(image)
-
-        # Some tables associated with each column of the display.
-        # Should probably make a class for this, but for now it's just
-        # lots of messy variables...
-        height = [0] * self.matrix.width        # Current column height
-        peak = [0] * self.matrix.width          # Recent column peak
-        dropv = [0.0] * self.matrix.width       # Current peak falling speed
-        autolevel = [32.0] * self.matrix.width  # Per-column auto adjust
-
-        # Precompute values for each display column...
-        colors = []  # Again, if I make a per-column class as mentioned
-        weights = [] # above, these values can go in there. Deadlines happen.
-        sums = []
-        for column in range(self.matrix.width):
-            # Precompute hue. '300' is intentional...don't wrap all the
-            # way around back to red (360). Purple (300) looks good.
-            colors.append('hsl(%d, %d%%, %d%%)' %
-                          (column * 300 / self.matrix.width, 100, 50))
-
-            # Precompute FFT weightings. Each column of the display
-            # represents the sum of several FFT bins, applying a cubic
-            # weighting to each, with a slight overlap between columns.
-            frac = column / float(self.matrix.width - 1) # 0.0 to 1.0
-            center = LEAST + (MOST - LEAST) * (frac ** EXPONENT)
-            # Overlap is a function of distance to the next column.
-            if column > 0:
-                dist_column = column - 1  # Use distance from prior column
-            else:
-                dist_column = column + 1  # 1st column; use distance to next
-            frac = dist_column / float(self.matrix.width - 1) # 0.0 to 1.0
-            dist_center = LEAST + (MOST - LEAST) * (frac ** EXPONENT)
-            width = 0.75 + abs(center - dist_center)   # Cubic curve half-width
-            column_weights = []                        # List of bin weights
-            total = 0.0                                # Sum of weights
-            left = max(0, int(center - width))            # Clip left
-            right = min(int(center + width + 1), CHUNK-1) # Clip right
-            # Compute each FFT bin's contribution to column
-            for bucket in range(left, right): # ('bin' is a reserved keyword)
-                weight = self.weight(bucket + 0.5, center, width)
-                if weight > 0:
-                    # Bin is in range, append as a 2-element list with the
-                    # bin index and the bin's weighting toward the column.
-                    column_weights.append([bucket, weight])
-                    total += weight
-            weights.append(column_weights)  # Weights for this column
-            sums.append(total)              # Sum-of-weights for column
+        # Audio is captured into a ring buffer by its own thread (PyAudio
+        # callback for the mic), so capture never waits on drawing or v.v.
+        # Each frame analyzes whatever complete hops of audio have arrived
+        # since the last.
+        if self.args.fft_size < 2:
+            self.parser.error("--fft-size must be at least 2")
+        if self.args.hop is not None and self.args.hop <= 0:
+            self.parser.error("--hop must be positive")
+        if self.args.average < 1:
+            self.parser.error("--average must be at least 1")
+        self.analyzer = SpectrumAnalyzer(
+            self.args.fft_size, self.args.window, self.args.hop,
+            self.args.average)
+        # Ring holds all the samples the analyzer reads at once (more
+        # with a large --fft-size, --hop or --average), plus a second's
+        # headroom for capture running ahead of a slow frame.
+        self.source = open_source(self.args.source, RATE, CHUNK,
+                                  not self.args.offline,
+                                  self.analyzer.ring_size(RATE))
+        if self.stats is not None:
+            self.stats.counters["audio"] = self.source.counters
+
+        # Frame is drawn into a NumPy array (rows, columns, RGB), then
+        # converted to a PIL image for the matrix each pass.
+        columns = self.matrix.width
+        rows = self.matrix.height
+        self.frame = np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.row_index = np.arange(rows)[:, np.newaxis]  # For column masks
+
+        # Some tables associated with each column of the display, as
+        # NumPy arrays so all columns are processed at once.
+        self.height = np.zeros(columns)     # Current column height
+        self.peak = np.zeros(columns)       # Recent column peak
+        self.dropv = np.zeros(columns)      # Current peak falling speed
+        self.autolevel = np.full(columns, float(rows))  # Per-column adjust
+
+        # Waterfall mode keeps its image in a circular buffer of rows:
+        # each frame overwrites the oldest row (at waterfall_row) with the
+        # newest, so nothing is ever scrolled in memory. The two parts
+        # either side of waterfall_row are uploaded in order instead.
+        self.waterfall = np.zeros((rows, columns, 3), dtype=np.uint8)
+        self.waterfall_row = 0           # Oldest row, next to replace
+        self.heat = heat_palette()
+
+        # Beat detection runs on the binned columns of each new spectrum.
+        # Effects subscribe to it and fade out over following frames.
+        self.onsets = OnsetDetector(columns)
+        self.beat = 0.0  # Beat effect level, 1.0 at beat, decays to 0
+        self.analyzed = 0  # analyzer.frames at last onset check
+        if self.args.beat != "none":
+            self.onsets.subscribe(self.on_beat)
+
+        # Precompute color of each display column. Hue '300' is
+        # intentional...don't wrap all the way around back to red (360).
+        # Purple (300) looks good.
+        self.colors = np.array([
+            [int(c * 255 + 0.5) for c in colorsys.hls_to_rgb(
+                (column * 300 // columns) / 360.0, 0.5, 1.0)]
+            for column in range(columns)], dtype=np.uint8)
+
+        # Precompute FFT weightings. Each column of the display
+        # represents the sum of several FFT bins, applying a cubic
+        # weighting to each, with a slight overlap between columns.
+        # Bin numbers scale with FFT size relative to sample rate.
+        bin_scale = (self.args.fft_size / float(FFT_SIZE) *
+                     RATE / float(self.source.rate))
+        self.binner = LogBinner(columns, LEAST * bin_scale, MOST * bin_scale,
+                                EXPONENT, self.args.fft_size // 2)
         # Now normalize all the column sums, apply an exponential
         # scaling function to tone down the lower-frequency bins.
-        # No scientific reason for this, just looks better on the matrix.
-        maxsum = max(sums)
-        for column in range(self.matrix.width):
-            # Scaling function was arrived at through experimentation;
-            # no scientific reason to these values, just looked good.
-            scale = (0.02 + 0.08 *
-                     ((column / float(self.matrix.width - 1)) ** 1.8))
-            scale *= maxsum / sums[column] # Boost 'weak' columns
-            for weight in weights[column]: # List of bin weights for column
-                weight[1] *= scale         # Scale each bin weight
-
-        while True:
-
-            # Read bytes from PyAudio stream, convert to int16,
-            # process via NumPy's FFT function...
-            data_8 = stream.read(CHUNK * 2, exception_on_overflow=False)
-            data_16 = np.frombuffer(data_8, np.int16)
-            fft_out = np.fft.fft(data_16, norm="ortho")
-            # fft_out will have CHUNK * 2 elements, mirrored at center
-
-            # Get spectrum of first half. Instead of square root for
-            # magnitude, use something between square and cube root.
-            # No scientific reason, just looked good.
-            spec_y = [(c.real * c.real + c.imag * c.imag) ** 0.4
-                      for c in fft_out[0:CHUNK]]
-
-            # Process and render each column (here's where having
-            # a Column class would make things a little tidier).
-            for column in range(self.matrix.width):
-                # Calculate weighted sum of FFT bins for this column
-                total = -NOISE
-                for bin_weight in weights[column]:
-                    total += spec_y[bin_weight[0]] * bin_weight[1]
-
-                # Auto-leveling is intended to make each column 'pop'.
-                # When a particular column isn't getting a lot of input
-                # from the FFT, gradually boost that column's sensitivity.
-                if total > autolevel[column]:
-                    # Make autolevel rise quickly if column total exceeds it
-                    autolevel[column] = autolevel[column] * 0.25 + total * 0.75
-                else:
-                    # And fall slowly otherwise
-                    autolevel[column] = autolevel[column] * 0.98 + total * 0.02
-                # Minimum autolevel value is 1/8 matrix height
-                if autolevel[column] < self.matrix.height / 8.0:
-                    autolevel[column] = self.matrix.height / 8.0
-
-                # Apply autoleveling to weighted input...
-                # this is the preliminary column height before filtering
-                total = total * (self.matrix.height / autolevel[column])
-
-                # Filter the column height computed above
-                if total > height[column]:
-                    # If it's greater than this column's prior height,
-                    # filter column's height quickly in that direction
-                    height[column] = height[column] * 0.4 + total * 0.6
-                else:
-                    # If less, filter slowly down
-                    height[column] = height[column] * 0.6 + total * 0.4
-
-                # Compute "peak dots," which sort of show the recent
-                # peak level for each column (mostly just neat to watch).
-                if height[column] > peak[column]:
-                    # If column exceeds old peak, move peak immediately
-                    peak[column] = min(height[column], self.matrix.height)
-                    dropv[column] = 0.0
-                else:
-                    # Otherwise, peak gradually accelerates down
-                    dropv[column] += 0.15
-                    peak[column] -= dropv[column]
-
-                # Draw peak dot
-                draw.point([column, 32-peak[column]], fill=(255, 255, 255))
-                # Draw spectrum column (may occlude dot, is OK)
-                draw.line([column, 32, column, 32-height[column]],
-                          fill=colors[column])
-                # Debug stuff for showing autolevel action
-                #draw.point([column, 32-autolevel[column]], fill=(255, 0, 0))
-
-            # Copy PIL image to matrix buffer, swap buffers each frame
-            double_buffer.SetImage(image)
-            double_buffer = self.matrix.SwapOnVSync(double_buffer)
-
-            # Clear PIL image before next pass
-            draw.rectangle([0, 0, self.matrix.width - 1,
-                            self.matrix.height - 1], fill=0)
+        # Scaling function was arrived at through experimentation;
+        # no scientific reason to these values, just looked good.
+        # Divided by bin_scale as columns span proportionally more bins.
+        fracs = np.arange(columns) / float(columns - 1)
+        self.binner.scale((0.02 + 0.08 * (fracs ** 1.8)) *
+                          self.binner.sums.max() /
+                          self.binner.sums / bin_scale)  # Boost weak columns
+
+        self.source.start()
+        try:
+            self.run_frames()
+        finally:
+            self.source.stop()
+
+    def render(self, canvas):
+        rows = self.matrix.height
+
+        # Analyze new samples from capture ring buffer (spectrum is
+        # unchanged if there are none)...
+        spectrum = self.analyzer.update(self.source.ring, self.source.poll())
+
+        # Instead of magnitude (square root of power), use something
+        # between square and cube root of power (magnitude ** 0.8).
+        # No scientific reason, just looked good.
+        spec_y = spectrum ** 0.8
+        # Weighted sum of FFT bins for every column at once
+        total = self.binner.apply(spec_y)
+        if self.analyzer.frames != self.analyzed:  # New spectrum?
+            self.analyzed = self.analyzer.frames
+            self.onsets.process(
+                total, self.analyzer.position / float(self.source.rate))
+        total -= NOISE
+
+        # Auto-leveling is intended to make each column 'pop'.
+        # When a particular column isn't getting a lot of input
+        # from the FFT, gradually boost that column's sensitivity.
+        # Autolevel rises quickly if column total exceeds it, and
+        # falls slowly otherwise. Minimum is 1/8 matrix height.
+        self.autolevel = np.where(total > self.autolevel,
+                                  self.autolevel * 0.25 + total * 0.75,
+                                  self.autolevel * 0.98 + total * 0.02)
+        np.maximum(self.autolevel, rows / 8.0, out=self.autolevel)
+
+        # Apply autoleveling to weighted input...
+        # this is the preliminary column height before filtering
+        total *= rows / self.autolevel
+
+        if self.args.mode == "waterfall":
+            self.draw_waterfall(canvas, total)
+        else:
+            self.draw_bars(canvas, total)
+        self.beat *= 0.8  # Fade beat effect
+
+    def on_beat(self, now, strength):
+        """OnsetDetector callback: start beat effect."""
+        self.beat = 1.0
+
+    def draw_bars(self, canvas, total):
+        """Filter autoleveled column totals into bar heights and peak dots,
+           and draw them to canvas."""
+        rows = self.matrix.height
+
+        # Filter the column heights computed above: quickly toward
+        # a greater value than each column's prior height, slowly down.
+        self.height = np.where(total > self.height,
+                               self.height * 0.4 + total * 0.6,
+                               self.height * 0.6 + total * 0.4)
+
+        # Compute "peak dots," which sort of show the recent
+        # peak level for each column (mostly just neat to watch).
+        # If column exceeds old peak, move peak immediately,
+        # otherwise peak gradually accelerates down.
+        rising = self.height > self.peak
+        self.dropv = np.where(rising, 0.0, self.dropv + 0.15)
+        self.peak = np.where(rising, np.minimum(self.height, rows),
+                             self.peak - self.dropv)
+
+        # Draw spectrum columns, then peak dots where not occluded
+        # by their column.
+        tops = (rows - self.height).astype(int)  # First row of each column
+        self.frame[:] = 0
+        np.copyto(self.frame, self.colors,
+                  where=(self.row_index >= tops)[..., np.newaxis])
+        dots = (rows - self.peak).astype(int)
+        visible = (dots >= 0) & (dots < rows) & (dots < tops)
+        self.frame[dots[visible], np.nonzero(visible)[0]] = 255
+        self.apply_beat(self.frame)
+
+        # Copy image to matrix buffer (run_frames() swaps buffers)
+        canvas.SetImage(Image.fromarray(self.frame))
+
+    def apply_beat(self, pixels):
+        """Apply --beat effect, at the current beat level, to a NumPy image
+           (or row) in place."""
+        if self.args.beat == "flash" and self.beat > 0.05:
+            # Blend lit pixels toward white
+            lit = pixels.any(axis=-1)
+            pixels[lit] += ((255 - pixels[lit]) *
+                            (self.beat * 0.7)).astype(np.uint8)
+        elif self.args.beat == "pulse":
+            # Dim between beats, full brightness on a beat
+            np.multiply(pixels, 0.4 + 0.6 * self.beat, out=pixels,
+                        casting="unsafe")
+
+    def draw_waterfall(self, canvas, total):
+        """Add a row of autoleveled column totals, colored through the heat
+           palette, to the waterfall and draw it to canvas."""
+        rows = self.matrix.height
+        levels = np.clip(total * (255.0 / rows), 0, 255).astype(np.uint8)
+        self.waterfall[self.waterfall_row] = self.heat[levels]
+        if self.args.beat == "flash":
+            # Flashed rows stay in the history, marking each beat
+            self.apply_beat(self.waterfall[self.waterfall_row])
+        self.waterfall_row = (self.waterfall_row + 1) % rows
+        # Oldest rows (from waterfall_row to end of buffer) go at top of
+        # the display, followed by the rest of the buffer (up to and
+        # including the newest row) at the bottom. Each part is a
+        # contiguous slice, so no intermediate image is assembled...
+        split = rows - self.waterfall_row
+        if self.args.beat == "pulse":
+            # ...except to pulse the brightness of the whole display,
+            # leaving the history itself unscaled
+            self.frame[:split] = self.waterfall[self.waterfall_row:]
+            self.frame[split:] = self.waterfall[:self.waterfall_row]
+            self.apply_beat(self.frame)
+            canvas.SetImage(Image.fromarray(self.frame))
+            return
+        canvas.SetImage(Image.fromarray(self.waterfall[self.waterfall_row:]))
+        if self.waterfall_row:
+            canvas.SetImage(Image.fromarray(
+                self.waterfall[:self.waterfall_row]), 0, split)
 
 if __name__ == "__main__":
     MY_APP = AudioSpectrum()  # Instantiate class, calls __init__() above
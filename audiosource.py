@@ -0,0 +1,287 @@
+#!/usr/bin/env python
+
+"""
+Audio capture sources for audio.py. Capture runs independently of the
+display: each source writes 16-bit mono samples into a preallocated NumPy
+RingBuffer as they arrive (PyAudio callback mode, or a thread for generated
+audio), and the renderer copies out the most recent window whenever it
+draws a frame, without blocking. Counters track device overflows (samples
+the sound card dropped) and underruns (frames drawn with no new audio).
+
+Sources are chosen with a spec string (see open_source()):
+  mic            default ALSA input device, via PyAudio
+  mic:N          PyAudio input device index N
+  wav:FILE       16- or 8-bit WAV file, looped (offline testing/benchmarks)
+  synth          generated test tones plus noise
+  synth:F1,F2... tones at the given frequencies (Hz)
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, too-many-arguments, import-error
+
+import time
+import wave
+import threading
+import numpy as np
+
+class RingBuffer(object):
+    """Fixed-size circular buffer of samples in a NumPy array. One thread
+       may write() while others read() recent samples."""
+
+    def __init__(self, size, dtype=np.int16):
+        self.data = np.zeros(size, dtype=dtype)
+        self.size = size
+        self.written = 0  # Total samples ever written
+        self.lock = threading.Lock()
+
+    def write(self, samples):
+        """Append samples (array), overwriting the oldest ones."""
+        count = len(samples)
+        if count > self.size:
+            samples = samples[-self.size:]  # Only the newest fit
+        with self.lock:
+            # Where the kept samples go: after any that were trimmed
+            start = (self.written + count - len(samples)) % self.size
+            first = min(len(samples), self.size - start)
+            self.data[start:start + first] = samples[:first]
+            self.data[:len(samples) - first] = samples[first:]
+            self.written += count
+
+    def read(self, end, count, out=None):
+        """Copy the 'count' samples preceding absolute sample position
+           'end' (a value of 'written', at most 'size' samples ago),
+           oldest first, into out (an array, allocated if None). Zeros
+           precede the first sample ever written."""
+        if out is None:
+            out = np.empty(count, dtype=self.data.dtype)
+        with self.lock:
+            stop = end % self.size
+            first = min(count, stop)  # Part before the stop position
+            out[count - first:] = self.data[stop - first:stop]
+            out[:count - first] = self.data[self.size - (count - first):
+                                            self.size]
+        return out
+
+class AudioSource(object):
+    """Base class for audio sources: a RingBuffer holding 'buffer_size'
+       samples (default one second) written at 'rate' samples per second
+       in blocks of 'chunk', plus overflow/underrun counters. Subclasses
+       implement start() and stop(), or pull() to produce samples on
+       demand."""
+
+    def __init__(self, rate, chunk, buffer_size=None):
+        self.rate = rate
+        self.chunk = chunk
+        self.ring = RingBuffer(buffer_size or rate)
+        self.overflows = 0       # Blocks lost before reaching the ring
+        self.underruns = 0       # Reads with no new samples since the last
+        self.read_position = 0   # ring.written at last read
+
+    def start(self):
+        """Begin capturing audio into the ring buffer."""
+
+    def stop(self):
+        """Stop capturing audio and release the device."""
+
+    def pull(self):
+        """Called at each poll(). Sources that generate samples on
+           demand rather than in real time write them here."""
+
+    def poll(self):
+        """Return total samples written to the ring buffer so far (never
+           waiting for more to arrive), counting an underrun if there are
+           none new since the last poll."""
+        self.pull()
+        written = self.ring.written
+        if written == self.read_position:
+            self.underruns += 1
+        self.read_position = written
+        return written
+
+    def read_latest(self, count, out=None):
+        """Return the most recent 'count' samples (see RingBuffer.read()),
+           never waiting for more to arrive."""
+        return self.ring.read(self.poll(), count, out)
+
+    def counters(self):
+        """Return dict of capture statistics (for FrameStats reports)."""
+        return {"samples": self.ring.written, "overflows": self.overflows,
+                "underruns": self.underruns}
+
+class PyAudioSource(AudioSource):
+    """Live capture from a USB microphone (ALSA device) using PyAudio in
+       callback mode, so samples are stored as PortAudio delivers them
+       rather than when the renderer gets around to reading."""
+
+    def __init__(self, rate, chunk, device=None, buffer_size=None):
+        super(PyAudioSource, self).__init__(rate, chunk, buffer_size)
+        self.device = device  # PyAudio input device index, None = default
+        self.pyaudio = None
+        self.audio = None
+        self.stream = None
+
+    def start(self):
+        import pyaudio  # Only needed for live capture
+        self.pyaudio = pyaudio
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=1,  # Mono's fine for what we're doing
+            rate=self.rate,
+            input=True,
+            output=False,
+            input_device_index=self.device,
+            frames_per_buffer=self.chunk,
+            stream_callback=self.callback)
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio callback (PortAudio's thread): store one block."""
+        if status & self.pyaudio.paInputOverflow:
+            self.overflows += 1
+        self.ring.write(np.frombuffer(in_data, np.int16))
+        return (None, self.pyaudio.paContinue)
+
+    def stop(self):
+        if self.stream is not None:
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
+            self.stream = None
+
+class GeneratedSource(AudioSource):
+    """Base class for sources whose samples come from generate(). If
+       realtime, a thread writes a chunk every chunk/rate seconds like a
+       sound card would (a late thread counts as an overflow), otherwise
+       each poll() advances exactly one chunk, which makes offline
+       benchmarks deterministic and independent of frame rate."""
+
+    def __init__(self, rate, chunk, realtime=True, buffer_size=None):
+        super(GeneratedSource, self).__init__(rate, chunk, buffer_size)
+        self.realtime = realtime
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def generate(self, count):
+        """Override in subclass: return the next 'count' samples as an
+           int16 array."""
+        raise NotImplementedError()
+
+    def start(self):
+        if self.realtime:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self.feed)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def feed(self):
+        """Real-time thread body."""
+        period = self.chunk / float(self.rate)
+        deadline = time.monotonic()
+        while not self.stopped.is_set():
+            self.ring.write(self.generate(self.chunk))
+            deadline += period
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                self.stopped.wait(delay)
+            elif delay < -period:  # Fell behind, samples lost
+                self.overflows += 1
+                deadline = time.monotonic()
+
+    def pull(self):
+        if not self.realtime:
+            self.ring.write(self.generate(self.chunk))
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+class WavFileSource(GeneratedSource):
+    """Plays back an 8- or 16-bit WAV file (mixed down to mono), looping
+       at the end unless loop is False, after which it produces silence
+       and sets 'finished'. Sample rate is that of the file."""
+
+    def __init__(self, path, chunk, realtime=True, loop=True,
+                 buffer_size=None):
+        wav = wave.open(path, "rb")
+        try:
+            rate = wav.getframerate()
+            channels = wav.getnchannels()
+            width = wav.getsampwidth()
+            raw = wav.readframes(wav.getnframes())
+        finally:
+            wav.close()
+        if width == 2:
+            samples = np.frombuffer(raw, "<i2").astype(np.int32)
+        elif width == 1:  # 8-bit WAV is unsigned
+            samples = (np.frombuffer(raw, np.uint8).astype(np.int32) - 128) << 8
+        else:
+            raise ValueError("%s: only 8- and 16-bit WAV files are supported"
+                             % path)
+        samples = samples.reshape(-1, channels).mean(axis=1)
+        super(WavFileSource, self).__init__(rate, chunk, realtime,
+                                            buffer_size)
+        self.samples = samples.astype(np.int16)
+        self.loop = loop
+        self.position = 0
+        self.finished = False
+
+    def generate(self, count):
+        out = np.zeros(count, dtype=np.int16)
+        filled = 0
+        while filled < count and not self.finished:
+            part = self.samples[self.position:self.position + count - filled]
+            out[filled:filled + len(part)] = part
+            filled += len(part)
+            self.position += len(part)
+            if self.position >= len(self.samples):
+                self.position = 0
+                self.finished = not self.loop or not len(self.samples)
+        return out
+
+class SyntheticSource(GeneratedSource):
+    """Generates a mix of sine tones at the given frequencies (Hz) plus
+       Gaussian noise, for testing without a microphone."""
+
+    def __init__(self, rate, chunk, frequencies=(220.0, 880.0, 3520.0),
+                 amplitude=6000.0, noise=300.0, realtime=True, seed=None,
+                 buffer_size=None):
+        super(SyntheticSource, self).__init__(rate, chunk, realtime,
+                                              buffer_size)
+        self.frequencies = np.asarray(frequencies, dtype=float)[:, np.newaxis]
+        self.amplitude = amplitude / max(1, len(frequencies))
+        self.noise = noise
+        self.random = np.random.default_rng(seed)
+        self.position = 0  # Samples generated so far
+
+    def generate(self, count):
+        seconds = (self.position + np.arange(count)) / float(self.rate)
+        self.position += count
+        signal = self.amplitude * np.sin(
+            2.0 * np.pi * self.frequencies * seconds).sum(axis=0)
+        signal += self.random.normal(0.0, self.noise, count)
+        return np.clip(signal, -32768, 32767).astype(np.int16)
+
+def open_source(spec, rate, chunk, realtime=True, buffer_size=None):
+    """Return an AudioSource (not yet started) from a spec string as in
+       this module's docstring. 'rate' and 'chunk' are the sample rate and
+       block size to use (WAV files use their own rate); realtime applies
+       to WAV and synthetic sources. buffer_size is the ring buffer size
+       in samples (default one second)."""
+    kind, _, option = spec.partition(":")
+    if kind == "mic":
+        return PyAudioSource(rate, chunk, int(option) if option else None,
+                             buffer_size)
+    if kind == "wav":
+        return WavFileSource(option, chunk, realtime,
+                             buffer_size=buffer_size)
+    if kind == "synth":
+        if option:
+            return SyntheticSource(rate, chunk, [
+                float(frequency) for frequency in option.split(",")],
+                                   realtime=realtime,
+                                   buffer_size=buffer_size)
+        return SyntheticSource(rate, chunk, realtime=realtime,
+                               buffer_size=buffer_size)
+    raise ValueError("Unknown audio source '%s'" % spec)
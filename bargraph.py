@@ -26,8 +26,15 @@ class BargraphClock(SpectroBase):
     def __init__(self, *args, **kwargs):
         super(BargraphClock, self).__init__(*args, **kwargs)
 
-        # Create PIL image
+        # Create PIL image and drawing context
         self.image = Image.new("RGB", (64, 32))
+        self.draw = ImageDraw.Draw(self.image)
+        self.shown_time = None  # time.time() second currently displayed
+
+        # Content changes once per second; poll for that at 10 Hz so the
+        # seconds bar doesn't lag the actual time by much.
+        self.fps = 10
+        self.on_change = True
 
         digits = Image.open('graphics/bargraph-digits.png')
         self.digit = []
@@ -37,54 +44,54 @@ class BargraphClock(SpectroBase):
     def draw_digit(self, n, x, y):
         self.image.paste(self.digit[n], (x, y, x+6, y+10), mask=self.digit[n])
 
-    def run(self):
-
-        # Create offscreen buffer for graphics
-        double_buffer = self.matrix.CreateFrameCanvas()
-
-        draw = ImageDraw.Draw(self.image)
-
-        while True:
-            # Erase background
-            draw.rectangle((0, 0, 64, 32), fill=BACKGROUND_COLOR)
-
-            localtime = time.localtime(time.time())
-            if TWELVE_HOUR == True:
-                hour = localtime.tm_hour % 12
-                width = 44 * (hour * 60 + localtime.tm_min) // 719
-                if hour == 0:
-                    hour = 12
-            else:
-                hour = localtime.tm_hour
-                width = 44 * (hour * 60 + localtime.tm_min) // 1439
-
-            self.draw_digit(hour // 10, 2, 2)
-            self.draw_digit(hour % 10, 10, 2)
-            self.draw_digit(localtime.tm_min // 10, 2, 14)
-            self.draw_digit(localtime.tm_min % 10, 10, 14)
-
-            if width > 0:
-                draw.rectangle((18, 2, 17 + width, 11), fill=HOUR_FOREGROUND)
-            if width < 44:
-                draw.rectangle((18 + width, 2, 61, 11), fill=HOUR_BACKGROUND)
-
-            width = 44 * localtime.tm_min // 59
-            if width > 0:
-                draw.rectangle((18, 14, 17 + width, 23), fill=MINUTE_FOREGROUND)
-            if width < 44:
-                draw.rectangle((18 + width, 14, 61, 23), fill=MINUTE_BACKGROUND)
-
-            width = localtime.tm_sec
-            draw.rectangle((2, 26, 2 + width, 29), fill=SECOND_FOREGROUND)
-            if width < 59:
-                draw.rectangle((3 + width, 26, 61, 29), fill=SECOND_BACKGROUND)
-
-            # Copy PIL image to matrix buffer, swap buffers each frame
-            if self.matrix.height >= 32:
-                double_buffer.SetImage(self.image)
-            else:
-                double_buffer.SetImage(self.halve(self.image))
-            double_buffer = self.matrix.SwapOnVSync(double_buffer)
+    def needs_redraw(self):
+        """Display only changes once per second."""
+        return int(time.time()) != self.shown_time
+
+    def render(self, canvas):
+        # Erase background
+        self.draw.rectangle((0, 0, 64, 32), fill=BACKGROUND_COLOR)
+
+        self.shown_time = int(time.time())
+        localtime = time.localtime(self.shown_time)
+        if TWELVE_HOUR == True:
+            hour = localtime.tm_hour % 12
+            width = 44 * (hour * 60 + localtime.tm_min) // 719
+            if hour == 0:
+                hour = 12
+        else:
+            hour = localtime.tm_hour
+            width = 44 * (hour * 60 + localtime.tm_min) // 1439
+
+        self.draw_digit(hour // 10, 2, 2)
+        self.draw_digit(hour % 10, 10, 2)
+        self.draw_digit(localtime.tm_min // 10, 2, 14)
+        self.draw_digit(localtime.tm_min % 10, 10, 14)
+
+        if width > 0:
+            self.draw.rectangle((18, 2, 17 + width, 11), fill=HOUR_FOREGROUND)
+        if width < 44:
+            self.draw.rectangle((18 + width, 2, 61, 11), fill=HOUR_BACKGROUND)
+
+        width = 44 * localtime.tm_min // 59
+        if width > 0:
+            self.draw.rectangle((18, 14, 17 + width, 23),
+                                fill=MINUTE_FOREGROUND)
+        if width < 44:
+            self.draw.rectangle((18 + width, 14, 61, 23),
+                                fill=MINUTE_BACKGROUND)
+
+        width = localtime.tm_sec
+        self.draw.rectangle((2, 26, 2 + width, 29), fill=SECOND_FOREGROUND)
+        if width < 59:
+            self.draw.rectangle((3 + width, 26, 61, 29),
+                                fill=SECOND_BACKGROUND)
+
+        # Copy PIL image to matrix buffer
+        if self.matrix.height >= 32:
+            canvas.SetImage(self.image)
+        else:
+            canvas.SetImage(self.halve(self.image))
 
 if __name__ == "__main__":
     MY_APP = BargraphClock()  # Instantiate class, calls __init__() above
@@ -0,0 +1,365 @@
+#!/usr/bin/env python
+
+"""
+Benchmark harness for Adafruit Spectro scripts. Runs on a desktop machine
+(no Pi or LED matrix required) using SpectroBase's virtual matrix backend.
+
+Drive a script's run() loop for a number of frames and report throughput:
+python3 benchmark.py app life.py --frames 500 -- --led-cols=64
+(anything after '--' is passed to the script as its command line.)
+
+Compare a script's cold-start time to first frame against starting it from a
+pre-warmed zygote process (as selector.py does):
+python3 benchmark.py startup arcade_clock.py --runs 5
+Scripts using SpectroBase's frame scheduler are paced to their target frame
+rate; pass --fps 0 after '--' to measure raw rendering cost instead. Scripts
+that only redraw when their content changes (bargraph.py, accel.py) still
+do so at --fps 0, checking for changes every 10 ms, so for them it shows
+how often content actually changes rather than rendering cost.
+
+Feed recorded WAV files through audio.py's analysis and beat/onset detector,
+timing the detector per spectrum and listing the onsets found:
+python3 benchmark.py onset drums.wav speech.wav --hop 512
+
+Generations per second of each life.py simulation engine (no display):
+python3 benchmark.py life --width 256 --height 64
+
+Iterations per second of each pixeldust.py engine, as gravity slowly turns
+(no display or accelerometer), e.g. at accel.py's default 1/6 fill and at
+1/2 fill, where collisions dominate:
+python3 benchmark.py dust --width 128 --height 64
+python3 benchmark.py dust --width 128 --height 64 --fill 0.5
+and the experimental parallel engine (not used by accel.py until it
+beats numpy) on a long chain of panels, 1 to 4 cores (its checksums should
+all match, as results don't depend on worker count):
+python3 benchmark.py dust -e numpy -e parallel --width 512 --height 32 \
+    -j1 -j2 -j3 -j4
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=superfluous-parens
+
+import gc
+import os
+import sys
+import math
+import time
+import zlib
+import argparse
+import numpy as np
+from spectrobase import load_script_class
+from virtualmatrix import FrameLimitReached
+from zygote import Zygote, ReadyPopen
+
+def report(label, count, unit, elapsed, cpu, intervals=None):
+    """Print a one-benchmark summary: rate, CPU use and (if a list of
+       per-item intervals in seconds is given) latency percentiles."""
+    print("%s: %d %s in %.3f s = %.1f %s/s, CPU %.3f s (%.0f%%)" %
+          (label, count, unit, elapsed, count / elapsed, unit, cpu,
+           100.0 * cpu / elapsed))
+    if intervals is not None and len(intervals):
+        p50, p90, p99 = np.percentile(intervals, (50, 90, 99)) * 1000.0
+        print("  latency ms: p50 %.2f  p90 %.2f  p99 %.2f  max %.2f" %
+              (p50, p90, p99, np.max(intervals) * 1000.0))
+
+def bench_app(args):
+    """Run a SpectroBase script's run() for args.frames frames (after
+       args.warmup untimed frames) on the virtual matrix."""
+    script = os.path.abspath(args.script)
+    os.chdir(os.path.dirname(script))  # Scripts load fonts etc. relative
+    app = load_script_class(script)()
+    app.args = app.parser.parse_args(args.flags + ["--led-backend=virtual"])
+    app.matrix = app.create_matrix()
+    app.matrix.frame_limit = args.warmup + args.frames + 1
+
+    try:
+        app.run()
+    except FrameLimitReached:
+        pass
+
+    # Measure from the end of the last warmup frame
+    swap_times = app.matrix.swap_times[args.warmup:]
+    cpu_times = app.matrix.swap_cpu_times[args.warmup:]
+    if len(swap_times) < 2:
+        exit("%s exited before producing enough frames" % args.script)
+    intervals = np.diff(swap_times)
+    report(os.path.basename(script), len(intervals), "frames",
+           swap_times[-1] - swap_times[0], cpu_times[-1] - cpu_times[0],
+           intervals)
+
+def bench_startup(args):
+    """Time from launch to first frame of a script, started as a new
+       interpreter versus from a pre-warmed (and already warm) zygote."""
+    script = os.path.abspath(args.script)
+    os.chdir(os.path.dirname(script))
+    argv = [script, "--led-backend=virtual"] + args.flags
+    cold = []
+    warm = []
+    for _ in range(args.runs):
+        process = ReadyPopen([sys.executable] + argv)
+        latency = process.wait_first_frame(args.timeout)
+        if latency is not None:
+            cold.append(latency)
+        process.terminate()
+        process.wait()
+
+        zygote = Zygote(argv)
+        zygote.wait_warm(args.timeout)
+        zygote.start()
+        latency = zygote.wait_first_frame(args.timeout)
+        if latency is not None:
+            warm.append(latency)
+        zygote.terminate()
+        zygote.wait()
+    if not (cold and warm):
+        exit("%s didn't show a frame within %g s" % (args.script,
+                                                     args.timeout))
+    print("%s: time to first frame, mean (min) of %d runs" %
+          (os.path.basename(script), args.runs))
+    print("  cold start %.1f (%.1f) ms, zygote %.1f (%.1f) ms, %.1fx faster" %
+          (1000.0 * np.mean(cold), 1000.0 * min(cold),
+           1000.0 * np.mean(warm), 1000.0 * min(warm),
+           np.mean(cold) / np.mean(warm)))
+
+def bench_onset(args):
+    """Run WAV files through SpectrumAnalyzer, LogBinner and OnsetDetector
+       as audio.py does (but as fast as possible), timing the detector
+       and the whole analysis per spectrum."""
+    from audio import LEAST, MOST, EXPONENT, FFT_SIZE, RATE
+    from audiosource import WavFileSource
+    from spectrum import LogBinner, SpectrumAnalyzer, OnsetDetector
+    for path in args.wav:
+        source = WavFileSource(path, args.hop, realtime=False, loop=False)
+        analyzer = SpectrumAnalyzer(args.fft_size, args.window, args.hop)
+        bin_scale = (args.fft_size / float(FFT_SIZE) *
+                     RATE / float(source.rate))
+        binner = LogBinner(args.columns, LEAST * bin_scale,
+                           MOST * bin_scale, EXPONENT, args.fft_size // 2)
+        detector = OnsetDetector(args.columns, threshold=args.threshold)
+        onsets = []
+        detector.subscribe(lambda now, strength: onsets.append(now))
+        detect_times = []
+        total_times = []
+        cpu_start = time.process_time()
+        while not source.finished:
+            start = time.perf_counter()
+            spectrum = analyzer.update(source.ring, source.poll())
+            columns = binner.apply(spectrum ** 0.8)
+            detect_start = time.perf_counter()
+            detector.process(columns, analyzer.position / float(source.rate))
+            end = time.perf_counter()
+            detect_times.append(end - detect_start)
+            total_times.append(end - start)
+        cpu = time.process_time() - cpu_start
+        label = os.path.basename(path)
+        report(label + " analysis", len(total_times), "spectra",
+               sum(total_times), cpu, total_times)
+        report(label + " detector", len(detect_times), "spectra",
+               sum(detect_times), sum(detect_times), detect_times)
+        print("  %d onsets in %.1f s of audio%s" % (
+            len(onsets), len(source.samples) / float(source.rate),
+            ": " + " ".join("%.2f" % onset for onset in onsets[:20]) +
+            (" ..." if len(onsets) > 20 else "") if onsets else ""))
+
+def bench_life(args):
+    """Time life.py's engines stepping a random grid, without drawing."""
+    import life
+    rule = life.Rule(args.rule)
+    for name in args.engine or sorted(life.ENGINES):
+        try:
+            engine = life.ENGINES[name](args.width, args.height, rule=rule)
+        except ValueError as error:  # Rule not supported by this engine
+            print("%s: %s" % (name, error))
+            continue
+        per_step = 1
+        thresholds = gc.get_threshold()
+        if name == "hashlife":  # Torus-free plane, 2^speed per step
+            engine.speed = args.speed
+            per_step = 1 << args.speed
+            # Rare full collections, as Life.run() sets for it
+            gc.set_threshold(thresholds[0], thresholds[1],
+                             100 * thresholds[2])
+        engine.reset()
+        generations = args.generations
+        if name == "reference":  # Much slower; keep run time sensible
+            generations = max(1, generations // 50)
+        for _ in range(args.warmup):
+            engine.step()
+        intervals = []
+        cpu_start = time.process_time()
+        for _ in range(generations):
+            start = time.perf_counter()
+            engine.step()
+            intervals.append(time.perf_counter() - start)
+        report("%s %dx%d" % (name, args.width, args.height),
+               generations * per_step, "generations", sum(intervals),
+               time.process_time() - cpu_start, intervals)
+        gc.set_threshold(*thresholds)
+
+def bench_dust(args):
+    """Time pixeldust.py's engines iterating a field of sand, with the
+       gravity vector rotating once every 'turn' iterations so grains keep
+       moving and colliding rather than settling. Runs are seeded, so
+       each prints a checksum of the final grain positions that changes
+       only if the simulation's results do."""
+    import pixeldust
+    grains = args.grains or int(args.width * args.height * args.fill)
+    engines = dict(pixeldust.ENGINES, parallel=pixeldust.ParallelPixelDust)
+    runs = []  # (engine, extra constructor arguments)
+    for name in args.engine or sorted(engines):
+        if name == "parallel":
+            runs.extend((name, {"bands": args.bands, "workers": workers})
+                        for workers in args.workers or [None])
+        else:
+            runs.append((name, {}))
+    for name, kwargs in runs:
+        dust = engines[name](args.width, args.height, 0.1, args.seed,
+                             **kwargs)
+        if kwargs:
+            name = "%s %d bands %d workers" % (name, len(dust.edges) - 1,
+                                               dust.workers)
+        start = time.perf_counter()
+        dust.randomize(grains)
+        print("%s: placed %d grains in %.2f ms" % (
+            name, dust.num_grains, 1000.0 * (time.perf_counter() - start)))
+        iterations = args.iterations
+        intervals = []
+        cpu_start = time.process_time()
+        for i in range(-args.warmup, iterations):
+            angle = 2.0 * math.pi * i / args.turn
+            accel = (9.8 * math.sin(angle), 9.8 * math.cos(angle), 1.0)
+            start = time.perf_counter()
+            dust.iterate(accel)
+            if i >= 0:
+                intervals.append(time.perf_counter() - start)
+            else:
+                cpu_start = time.process_time()
+        elapsed = sum(intervals)
+        report("%s %dx%d, %d grains" % (name, args.width, args.height,
+                                        dust.num_grains),
+               iterations, "iterations", elapsed,
+               time.process_time() - cpu_start, intervals)
+        print("  %.0f grain-iterations/s, positions checksum %08x" % (
+            dust.num_grains * iterations / elapsed,
+            zlib.crc32(np.array(dust.get_positions(),
+                                dtype=np.float32).tobytes())))
+        dust.close()
+
+def main():
+    """Parse command line and dispatch to the selected benchmark."""
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    subparsers = parser.add_subparsers(dest="benchmark")
+    subparsers.required = True
+
+    app_parser = subparsers.add_parser(
+        "app", help="Frame rate of a SpectroBase script on virtual matrix")
+    app_parser.add_argument("script", help="Script to run, e.g. life.py")
+    app_parser.add_argument(
+        "-n", "--frames", help="Frames to time. Default: 300",
+        default=300, type=int)
+    app_parser.add_argument(
+        "-w", "--warmup", help="Untimed frames before measuring. "
+        "Default: 10", default=10, type=int)
+    app_parser.set_defaults(func=bench_app)
+
+    startup_parser = subparsers.add_parser(
+        "startup", help="Cold start vs zygote time to first frame")
+    startup_parser.add_argument("script", help="Script to run, e.g. life.py")
+    startup_parser.add_argument(
+        "-r", "--runs", help="Launches of each kind. Default: 5",
+        default=5, type=int)
+    startup_parser.add_argument(
+        "-t", "--timeout", help="Seconds to wait for a first frame. "
+        "Default: 30", default=30.0, type=float)
+    startup_parser.set_defaults(func=bench_startup)
+
+    onset_parser = subparsers.add_parser(
+        "onset", help="Beat/onset detector speed and results on WAV files")
+    onset_parser.add_argument("wav", nargs="+", help="WAV file(s) to analyze")
+    onset_parser.add_argument(
+        "--fft-size", help="Samples per FFT. Default: 1024",
+        default=1024, type=int)
+    onset_parser.add_argument(
+        "--hop", help="Samples between FFTs. Default: 512",
+        default=512, type=int)
+    onset_parser.add_argument(
+        "--window", help="FFT window function. Default: rect",
+        default="rect")
+    onset_parser.add_argument(
+        "--columns", help="Display columns (binned spectrum size). "
+        "Default: 64", default=64, type=int)
+    onset_parser.add_argument(
+        "--threshold", help="Onset threshold, standard deviations above "
+        "mean flux. Default: 2.0", default=2.0, type=float)
+    onset_parser.set_defaults(func=bench_onset)
+
+    life_parser = subparsers.add_parser(
+        "life", help="Generations/sec of life.py simulation engines")
+    life_parser.add_argument(
+        "-e", "--engine", action="append", help="Engine to time (may be "
+        "repeated). Default: all")
+    life_parser.add_argument(
+        "--width", help="Grid width. Default: 64", default=64, type=int)
+    life_parser.add_argument(
+        "--height", help="Grid height. Default: 32", default=32, type=int)
+    life_parser.add_argument(
+        "-n", "--generations", help="Generations to time (1/50 as many "
+        "for the reference engine). Default: 1000", default=1000, type=int)
+    life_parser.add_argument(
+        "-w", "--warmup", help="Untimed generations first. Default: 5",
+        default=5, type=int)
+    life_parser.add_argument(
+        "-s", "--speed", help="hashlife: each step advances 2^SPEED "
+        "generations. Default: 0", default=0, type=int)
+    life_parser.add_argument(
+        "-r", "--rule", help="Life-like rule, as life.py --rule. "
+        "Default: life", default="life")
+    life_parser.set_defaults(func=bench_life)
+
+    dust_parser = subparsers.add_parser(
+        "dust", help="Iterations/sec of pixeldust.py simulation engines")
+    dust_parser.add_argument(
+        "-e", "--engine", action="append", help="Engine to time (may be "
+        "repeated). Default: all")
+    dust_parser.add_argument(
+        "--width", help="Grid width. Default: 64", default=64, type=int)
+    dust_parser.add_argument(
+        "--height", help="Grid height. Default: 32", default=32, type=int)
+    dust_parser.add_argument(
+        "-f", "--fill", help="Fraction of the grid filled with grains. "
+        "Default: 0.1667 (as accel.py)", default=1 / 6.0, type=float)
+    dust_parser.add_argument(
+        "-g", "--grains", help="Number of grains (overrides --fill)",
+        type=int)
+    dust_parser.add_argument(
+        "-n", "--iterations", help="Iterations to time. Default: 300",
+        default=300, type=int)
+    dust_parser.add_argument(
+        "-w", "--warmup", help="Untimed iterations first. Default: 10",
+        default=10, type=int)
+    dust_parser.add_argument(
+        "-t", "--turn", help="Iterations per full turn of gravity. "
+        "Default: 200", default=200, type=int)
+    dust_parser.add_argument(
+        "-s", "--seed", help="Random seed. Default: 0", default=0, type=int)
+    dust_parser.add_argument(
+        "-b", "--bands", help="Bands the parallel engine splits the grid "
+        "into. Default: 4", default=4, type=int)
+    dust_parser.add_argument(
+        "-j", "--workers", action="append", type=int, help="Worker "
+        "processes for the parallel engine (may be repeated to compare). "
+        "Default: one per CPU, up to --bands")
+    dust_parser.set_defaults(func=bench_dust)
+
+    # Anything after '--' is the benchmarked script's own command line
+    argv = sys.argv[1:]
+    flags = []
+    if "--" in argv:
+        flags = argv[argv.index("--") + 1:]
+        argv = argv[:argv.index("--")]
+    args = parser.parse_args(argv)
+    args.flags = flags
+    args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
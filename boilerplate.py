@@ -40,6 +40,12 @@ class BoilerPlate(SpectroBase):
             # Swap buffers each frame
             double_buffer = self.matrix.SwapOnVSync(double_buffer)
 
+    # Alternately, rather than writing a run() loop as above, a script can
+    # let SpectroBase own the loop and implement just render(), which is
+    # called at a steady frame rate (self.fps, or --fps on command line):
+    # def render(self, canvas):
+    #     canvas.Fill(0, 0, 0)  # Draw one complete frame in canvas here
+
 if __name__ == "__main__":
     MY_APP = BoilerPlate()  # Instantiate class, calls __init__() above
     MY_APP.process()        # SpectroBase startup, calls run() above
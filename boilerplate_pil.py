@@ -52,7 +52,7 @@ class BoilerPlate(SpectroBase):
         # the smaller 32x16 size. A different case would be, regardless of
         # matrix size, declaring the PIL image 2X matrix.size.width & height
         # and always calling resize() to get smooth 2x2 downsampling.
-        # (See also reference to the halve() function below)
+        # (See also reference to the downsample() function below)
         # image = Image.new(
         #     "RGB", (self.matrix.width * 2, self.matrix.height * 2))
 
@@ -63,9 +63,10 @@ class BoilerPlate(SpectroBase):
             # double_buffer.SetImage(image.resize(
             #     (self.matrix.width, self.matrix.height),
             #     resample=Image.BILINEAR))
-            # There's also the halve() function in SpectroBase, providing
-            # a more precise 1:2 downscaling, but it's not as quick.
-            # double_buffer.SetImage(self.halve(self.image))
+            # There's also the downsample() function in SpectroBase,
+            # providing precise box-averaged downscaling by any integer
+            # factor (e.g. 2 for the 2X image above):
+            # double_buffer.SetImage(self.downsample(image, 2))
             double_buffer = self.matrix.SwapOnVSync(double_buffer)
 
 if __name__ == "__main__":
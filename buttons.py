@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+
+"""
+Mode-select button sources for selector.py. Rather than polling an input,
+each source invokes a callback from its own thread on every press, so the
+selector can sleep until something actually happens. GPIOButton uses RPi.GPIO
+edge detection on real hardware; SimulatedButton can be pressed from code
+(or on a fixed interval) to drive the selector on a dev machine or in tests.
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance
+
+import threading
+
+class Button(object):
+    """Base class / interface for a momentary mode-select button. Sources
+       call self.changed(is_pressed) on each press or release; 'pressed' is
+       a threading.Event set by a press (the selector clears it), and
+       'callback' (if set) is called with no arguments on each press."""
+
+    def __init__(self):
+        self.callback = None
+        self.pressed = threading.Event()   # Latched on press
+        self.released = threading.Event()  # Set while button is up
+        self.released.set()
+
+    def changed(self, is_pressed):
+        """Record a press or release (called by source implementation)."""
+        if is_pressed:
+            self.released.clear()
+            self.pressed.set()
+            if self.callback is not None:
+                self.callback()
+        else:
+            self.released.set()
+
+    def is_pressed(self):
+        """Return True if the button is currently held down."""
+        return not self.released.is_set()
+
+    def wait_for_release(self, timeout=None):
+        """Block until the button is up; returns False if still held after
+           timeout seconds."""
+        return self.released.wait(timeout)
+
+    def close(self):
+        """Release any resources held by the button source."""
+
+class GPIOButton(Button):
+    """Button on a Raspberry Pi GPIO pin (to GND, internal pull-up), using
+       RPi.GPIO edge-triggered callbacks with hardware-ish debounce."""
+
+    def __init__(self, pin, bouncetime=30):
+        super(GPIOButton, self).__init__()
+        import RPi.GPIO as gpio  # pylint: disable=import-error
+        self.gpio = gpio
+        self.pin = pin
+        gpio.setwarnings(False)
+        gpio.setmode(gpio.BCM)
+        gpio.setup(pin, gpio.IN, pull_up_down=gpio.PUD_UP)
+        if gpio.input(pin) == 0:
+            self.changed(True)
+            self.pressed.clear()  # Held at startup isn't a press
+        gpio.add_event_detect(pin, gpio.BOTH, callback=self.edge,
+                              bouncetime=bouncetime)
+
+    def edge(self, _pin):
+        """RPi.GPIO callback (its own thread) on either edge."""
+        is_pressed = self.gpio.input(self.pin) == 0
+        if is_pressed != self.is_pressed():
+            self.changed(is_pressed)
+
+    def close(self):
+        self.gpio.remove_event_detect(self.pin)
+
+class SimulatedButton(Button):
+    """Software button: call press() (optionally with a hold time) from any
+       thread, or pass interval to have it pressed automatically every
+       'interval' seconds, e.g. to soak-test mode switching."""
+
+    def __init__(self, interval=None):
+        super(SimulatedButton, self).__init__()
+        self.stopped = threading.Event()
+        if interval:
+            thread = threading.Thread(target=self.repeat, args=(interval,))
+            thread.daemon = True
+            thread.start()
+
+    def press(self, hold=0.05):
+        """Press the button, releasing it after 'hold' seconds (from a
+           timer thread, so this returns immediately)."""
+        self.changed(True)
+        timer = threading.Timer(hold, self.changed, (False,))
+        timer.daemon = True
+        timer.start()
+
+    def repeat(self, interval):
+        """Thread body for automatic presses."""
+        while not self.stopped.wait(interval):
+            self.press()
+
+    def close(self):
+        self.stopped.set()
@@ -5,7 +5,6 @@
 # Gets code to pass both pylint & pylint3:
 # pylint: disable=c-extension-no-member
 
-import time
 import psutil
 from rgbmatrix import graphics
 from spectrobase import SpectroBase
@@ -19,57 +18,62 @@ IMPERIAL = False  # Set this True if you want degrees Fahrenheit
 class CPULoad(SpectroBase):
     """Simple CPU load & temperature display for Spectro."""
 
-    def run(self):
+    def __init__(self, *args, **kwargs):
+        super(CPULoad, self).__init__(*args, **kwargs)
+        self.text_color = None
+        self.font = None
+        self.load_format = None
+        self.temp_format = None
+        self.symbol = None
+        self.fps = 2  # Load is averaged over each 0.5 second frame
 
-        # Create offscreen buffer for graphics
-        double_buffer = self.matrix.CreateFrameCanvas()
+    def run(self):
 
-        text_color = graphics.Color(255, 255, 255)
-        font = graphics.Font()
+        self.text_color = graphics.Color(255, 255, 255)
+        self.font = graphics.Font()
         if self.matrix.width < 64:
-            font.LoadFont(SMALL_FONT)
-            load_format = "LOAD:{:5.1f}"   # Small screen = packed tight,
-            temp_format = "TEMP:{:5.1f}"   # no percent or degree stuff.
-            symbol = ""
+            self.font.LoadFont(SMALL_FONT)
+            self.load_format = "LOAD:{:5.1f}"   # Small screen = packed
+            self.temp_format = "TEMP:{:5.1f}"   # tight, no percent or
+            self.symbol = ""                    # degree stuff.
         else:
-            font.LoadFont(LARGE_FONT)
-            load_format = "LOAD: {:5.1f}%" # A little more space
-            temp_format = "TEMP: {:5.1f}"
+            self.font.LoadFont(LARGE_FONT)
+            self.load_format = "LOAD: {:5.1f}%" # A little more space
+            self.temp_format = "TEMP: {:5.1f}"
             if IMPERIAL:
-                symbol = u"\N{DEGREE SIGN}" + "F"
+                self.symbol = u"\N{DEGREE SIGN}" + "F"
             else:
-                symbol = u"\N{DEGREE SIGN}" + "C"
+                self.symbol = u"\N{DEGREE SIGN}" + "C"
 
         psutil.cpu_percent(percpu=False)  # Read, discard initial CPU load
 
-        while True:
-            double_buffer.Clear()  # Clear image
-
-            # Poll CPU load and temperature
-            cpu_load = psutil.cpu_percent(percpu=False)
-            temps = psutil.sensors_temperatures(fahrenheit=IMPERIAL)
-            try:
-                thermal = temps.get("cpu_thermal") # New hotness
-                temperature = thermal[0].current
-            except TypeError:
-                thermal = temps.get("cpu-thermal") # Oldschool
-                temperature = thermal[0].current
-
-            # Format load and temperature
-            load_string = load_format.format(cpu_load)
-            temp_string = temp_format.format(temperature) + symbol
-
-            # Draw load and temperature to the matrix
-            graphics.DrawText(double_buffer, font, 0,
-                              font.baseline, text_color, load_string)
-            graphics.DrawText(double_buffer, font, 0,
-                              font.height + font.baseline, text_color,
-                              temp_string)
-
-            # Swap buffers each frame
-            double_buffer = self.matrix.SwapOnVSync(double_buffer)
-
-            time.sleep(0.5)
+        self.run_frames()  # Calls render() each frame
+
+    def render(self, canvas):
+        canvas.Clear()  # Clear image
+
+        # Poll CPU load (since last frame) and temperature
+        cpu_load = psutil.cpu_percent(percpu=False)
+        temps = psutil.sensors_temperatures(fahrenheit=IMPERIAL)
+        try:
+            thermal = temps.get("cpu_thermal") # New hotness
+            temperature = thermal[0].current
+        except TypeError:
+            thermal = temps.get("cpu-thermal") # Oldschool
+            temperature = thermal[0].current
+
+        # Format load and temperature
+        load_string = self.load_format.format(cpu_load)
+        temp_string = self.temp_format.format(temperature) + self.symbol
+
+        # Draw load and temperature to the matrix. DrawText() needs
+        # the actual canvas, not the wrapper used with --led-stats.
+        canvas = getattr(canvas, "canvas", canvas)
+        graphics.DrawText(canvas, self.font, 0,
+                          self.font.baseline, self.text_color, load_string)
+        graphics.DrawText(canvas, self.font, 0,
+                          self.font.height + self.font.baseline,
+                          self.text_color, temp_string)
 
 if __name__ == "__main__":
     MY_APP = CPULoad()  # Instantiate class, calls __init__() above
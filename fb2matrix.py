@@ -47,9 +47,9 @@ class FB2Matrix(SpectroBase):
                                             prot=mmap.PROT_READ)
         self.framebuffer_size = (vinfo[0], vinfo[1])
 
-        self.double_buffer = None # Initialized in run()
         self.matrix_size = None   # Initialized in run()
         self.stretch = False
+        self.fps = 30             # Matches typical framebuffer update rate
 
         self.parser.add_argument(
             "-s", "--stretch", help="Stretch rather than crop image",
@@ -59,8 +59,6 @@ class FB2Matrix(SpectroBase):
         if self.args.stretch is not None:
             self.stretch = self.args.stretch
 
-        # Create offscreen buffer for matrix graphics
-        self.double_buffer = self.matrix.CreateFrameCanvas()
         self.matrix_size = (self.matrix.width, self.matrix.height)
 
         # Turn off display blanking
@@ -69,25 +67,25 @@ class FB2Matrix(SpectroBase):
         except IOError:
             pass
 
-        while True:
-            self.framebuffer_mapped.seek(0)
-            framebuf_data = self.framebuffer_mapped.read(self.framebuffer_bytes)
-            image = Image.frombytes("RGBA", self.framebuffer_size,
-                                    framebuf_data)
-            channels = image.split()  # [B,G,R,A]
-            image = Image.merge("RGB", (channels[2], channels[1], channels[0]))
-
-            if self.stretch:
-                # Stretch framebuffer image to fill matrix
-                # (Does not maintain aspect ratio - image may be distorted)
-                image = image.resize(self.matrix_size, resample=FILTER)
-            else:
-                # Crop framebuffer image to fill matrix (default)
-                # (Maintains aspect ratio - no distortion, but cuts image)
-                image = ImageOps.fit(image, self.matrix_size, method=FILTER)
-
-            self.double_buffer.SetImage(image)
-            self.double_buffer = self.matrix.SwapOnVSync(self.double_buffer)
+        self.run_frames()  # Calls render() each frame
+
+    def render(self, canvas):
+        self.framebuffer_mapped.seek(0)
+        framebuf_data = self.framebuffer_mapped.read(self.framebuffer_bytes)
+        image = Image.frombytes("RGBA", self.framebuffer_size, framebuf_data)
+        channels = image.split()  # [B,G,R,A]
+        image = Image.merge("RGB", (channels[2], channels[1], channels[0]))
+
+        if self.stretch:
+            # Stretch framebuffer image to fill matrix
+            # (Does not maintain aspect ratio - image may be distorted)
+            image = image.resize(self.matrix_size, resample=FILTER)
+        else:
+            # Crop framebuffer image to fill matrix (default)
+            # (Maintains aspect ratio - no distortion, but cuts image)
+            image = ImageOps.fit(image, self.matrix_size, method=FILTER)
+
+        canvas.SetImage(image)
 
 if __name__ == "__main__":
     MY_APP = FB2Matrix()  # Instantiate class, calls __init__() above
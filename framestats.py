@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+
+"""
+Opt-in per-frame timing for SpectroBase scripts, enabled with the --led-stats,
+--led-stats-file or --led-stats-socket command line options. Each frame is
+split into phases:
+  idle   - waiting on the frame scheduler (scripts using render() only)
+  render - drawing the frame (everything not in the other phases)
+  upload - SetImage() calls copying PIL images to the canvas
+  vsync  - blocking in SwapOnVSync()
+  frame  - total, from the end of one swap to the end of the next
+Recent timings are kept per phase and summarized as percentiles and a
+histogram, reported as a periodic log line (stderr), a JSON stats file
+and/or a JSON reply to any connection on a local Unix socket, e.g.:
+python3 -c "import socket; s=socket.socket(socket.AF_UNIX); \
+s.connect('/tmp/spectro.sock'); print(s.recv(65536).decode())"
+When none of these options are given, nothing here is loaded and the matrix
+is used directly, so there is no overhead.
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, invalid-name
+
+import os
+import sys
+import json
+import time
+import socket
+import threading
+from collections import deque
+
+PHASES = ("idle", "render", "upload", "vsync", "frame")
+WINDOW = 600  # Number of recent frames kept per phase (~10-20 sec)
+# Histogram bucket upper edges, milliseconds (last bucket is open-ended)
+BUCKETS_MS = (0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.7, 33.3, 66.7, 133.3)
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already-sorted non-empty list."""
+    index = int(round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+class FrameStats(object):
+    """Rolling per-phase frame timings and their reporting outputs."""
+
+    def __init__(self, interval=10.0, log=False, path=None,
+                 socket_path=None):
+        self.interval = interval       # Seconds between log/file reports
+        self.log = log                 # If True, print summary line
+        self.path = path               # JSON stats file, or None
+        self.frames = 0                # Total frames recorded
+        self.scheduler = None          # FrameScheduler, if script uses one
+        self.counters = {}             # Name -> function returning dict of
+                                       # script-specific counts to report
+        self.times = dict((phase, deque(maxlen=WINDOW)) for phase in PHASES)
+        self.lock = threading.Lock()   # Socket thread reads self.times
+        now = time.perf_counter()
+        self.frame_start = now         # End of prior swap
+        self.render_start = now        # End of idle period this frame
+        self.upload = 0.0              # SetImage() time this frame
+        self.next_report = time.monotonic() + interval
+        if socket_path:
+            self.serve(socket_path)
+
+    def begin_frame(self):
+        """Mark the end of idle time (called by SpectroBase.run_frames()
+           after the frame scheduler's wait)."""
+        self.render_start = time.perf_counter()
+
+    def add_upload(self, elapsed):
+        """Accumulate time spent in SetImage() this frame."""
+        self.upload += elapsed
+
+    def end_frame(self, swap_start, swap_end):
+        """Record one frame's phases given the SwapOnVSync() call's start
+           and end times, and report if the interval has elapsed."""
+        render_start = max(self.render_start, self.frame_start)
+        with self.lock:
+            self.times["idle"].append(render_start - self.frame_start)
+            self.times["render"].append(
+                max(0.0, swap_start - render_start - self.upload))
+            self.times["upload"].append(self.upload)
+            self.times["vsync"].append(swap_end - swap_start)
+            self.times["frame"].append(swap_end - self.frame_start)
+            self.frames += 1
+        self.frame_start = swap_end
+        self.upload = 0.0
+        if time.monotonic() >= self.next_report:
+            self.next_report += self.interval
+            self.report()
+
+    def summary(self):
+        """Return a dict summarizing recent timings (milliseconds) for
+           each phase: mean, p50, p90, p99, max and histogram counts."""
+        result = {"frames": self.frames, "time": time.time()}
+        if self.scheduler is not None:
+            result["scheduler"] = {
+                "fps": 1.0 / self.scheduler.period
+                       if self.scheduler.period else 0,
+                "frames": self.scheduler.frames,
+                "skipped": self.scheduler.skipped,
+                "dropped": self.scheduler.dropped}
+        for name, counters in self.counters.items():
+            result[name] = counters()
+        with self.lock:
+            windows = dict((phase, sorted(values))
+                           for phase, values in self.times.items())
+        for phase in PHASES:
+            values = [value * 1000.0 for value in windows[phase]]
+            if not values:
+                continue
+            histogram = [0] * (len(BUCKETS_MS) + 1)
+            bucket = 0
+            for value in values:  # Sorted, so buckets fill in order
+                while bucket < len(BUCKETS_MS) and value > BUCKETS_MS[bucket]:
+                    bucket += 1
+                histogram[bucket] += 1
+            result[phase] = {
+                "mean": sum(values) / len(values),
+                "p50": percentile(values, 0.5),
+                "p90": percentile(values, 0.9),
+                "p99": percentile(values, 0.99),
+                "max": values[-1],
+                "histogram": histogram}
+        result["buckets_ms"] = list(BUCKETS_MS)
+        return result
+
+    def report(self):
+        """Write the periodic log line and/or stats file."""
+        summary = self.summary()
+        if self.log and "frame" in summary:
+            frame_ms = summary["frame"]["mean"]
+            line = "%.1f fps" % (1000.0 / frame_ms if frame_ms else 0.0)
+            for phase in ("render", "upload", "vsync", "frame"):
+                line += "  %s %.2f/%.2f ms" % (
+                    phase, summary[phase]["p50"], summary[phase]["p99"])
+            if "scheduler" in summary:
+                line += "  dropped %d" % summary["scheduler"]["dropped"]
+            for name in sorted(self.counters):
+                line += "  %s %s" % (name, " ".join(
+                    "%s %d" % item for item in sorted(summary[name].items())))
+            sys.stderr.write(line + " (p50/p99)\n")
+        if self.path:
+            # Write then rename, so readers never see a partial file
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as stats_file:
+                json.dump(summary, stats_file, indent=1)
+            os.rename(temp_path, self.path)
+
+    def serve(self, socket_path):
+        """Start a daemon thread answering each connection on a Unix
+           socket with the current summary as JSON."""
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(socket_path)
+        server.listen(1)
+
+        def loop():
+            """Answer connections until the process exits."""
+            while True:
+                connection, _ = server.accept()
+                try:
+                    connection.sendall(
+                        json.dumps(self.summary()).encode() + b"\n")
+                except OSError:
+                    pass
+                connection.close()
+
+        thread = threading.Thread(target=loop)
+        thread.daemon = True
+        thread.start()
+
+class InstrumentedCanvas(object):
+    """Wraps a matrix canvas, timing SetImage() calls. The underlying
+       canvas is in self.canvas, for functions such as rgbmatrix.graphics
+       DrawText() that require the real object."""
+
+    def __init__(self, canvas, stats):
+        self.canvas = canvas
+        self.stats = stats
+
+    def SetImage(self, *args, **kwargs):
+        """Canvas SetImage(), timed as 'upload' phase."""
+        start = time.perf_counter()
+        self.canvas.SetImage(*args, **kwargs)
+        self.stats.add_upload(time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self.canvas, name)
+
+class InstrumentedMatrix(object):
+    """Wraps an RGBMatrix (or VirtualMatrix), handing out instrumented
+       canvases and timing SwapOnVSync(). Other attributes and methods
+       pass through to the underlying matrix, in self.matrix."""
+
+    def __init__(self, matrix, stats):
+        self.matrix = matrix
+        self.stats = stats
+
+    def CreateFrameCanvas(self):
+        """Return an InstrumentedCanvas wrapping a new offscreen canvas."""
+        return InstrumentedCanvas(self.matrix.CreateFrameCanvas(), self.stats)
+
+    def SwapOnVSync(self, canvas, *args, **kwargs):
+        """Matrix SwapOnVSync(), timed as 'vsync' phase, which also marks
+           the end of a frame."""
+        start = time.perf_counter()
+        try:
+            result = self.matrix.SwapOnVSync(canvas.canvas, *args, **kwargs)
+        finally:
+            self.stats.end_frame(start, time.perf_counter())
+        canvas.canvas = result  # Reuse the wrapper for the returned canvas
+        return canvas
+
+    def __getattr__(self, name):
+        return getattr(self.matrix, name)
@@ -19,16 +19,15 @@ class IPShow(SpectroBase):
         self.font = None
         self.text_size = []
         self.double_string = ""
+        self.image = None
+        self.fps = 30  # Text position is time-based, any rate works
 
     def run(self):
-        # Create offscreen buffer for graphics
-        double_buffer = self.matrix.CreateFrameCanvas()
-
         # Create PIL image. Image object is 2X the matrix resolution
         # to provide nicer downsampling -- scrolling text looks better.
-        image = Image.new(
+        self.image = Image.new(
             "RGB", (self.matrix.width * 2, self.matrix.height * 2))
-        self.draw = ImageDraw.Draw(image)
+        self.draw = ImageDraw.Draw(self.image)
         # Oblique fonts look nicer with horizontal scrolling;
         # it avoids flicker from vertical strokes.
         if self.matrix.height < 32:
@@ -48,22 +47,22 @@ class IPShow(SpectroBase):
         # one instance as the string scrolls off the left side.
         self.double_string = single_string * 2
 
-        while True:
-            # Clear image
-            self.draw.rectangle((0, 0, image.width-1, image.height-1), fill=0)
+        self.run_frames()  # Calls render() each frame
+
+    def render(self, canvas):
+        # Clear image
+        self.draw.rectangle(
+            (0, 0, self.image.width-1, self.image.height-1), fill=0)
 
-            # Call screen-drawing function as appropriate to matrix size:
-            if self.matrix.height < 32:
-                self.draw_small()
-            else:
-                self.draw_large()
+        # Call screen-drawing function as appropriate to matrix size:
+        if self.matrix.height < 32:
+            self.draw_small()
+        else:
+            self.draw_large()
 
-            # Scale image 1:2, bilinear interpolation for smoothiness
-            scaled = image.resize((self.matrix.width, self.matrix.height),
-                                  resample=Image.BILINEAR)
-            # Copy scaled PIL image to matrix buffer, swap buffers each frame
-            double_buffer.SetImage(scaled)
-            double_buffer = self.matrix.SwapOnVSync(double_buffer)
+        # Scale image 1:2 with 2x2 averaging for smoothiness,
+        # copy scaled PIL image to matrix buffer
+        canvas.SetImage(self.downsample(self.image, 2))
 
     def draw_small(self):
         """Draw hostname/address on a single line for small matrices."""
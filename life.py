@@ -1,67 +1,172 @@
 #!/usr/bin/env python
 
 """
-Conway's Game of Life for Adafruit Spectro.
+Conway's Game of Life for Adafruit Spectro. The simulation itself is done
+by an interchangeable engine (--engine option): 'numpy' processes the whole
+grid at once with array operations and is the default (if NumPy is
+installed); 'reference' is the original cell-by-cell Python version, kept
+for comparison (see 'benchmark.py life'); 'hashlife' simulates a far
+larger, non-wrapping universe (memoized quadtree, --speed to fast-forward)
+shown through a panning, zooming viewport where brightness is cell
+density (--universe, --zoom, --soup). Boards that settle into a cycle
+(still lifes, oscillators, or gliders endlessly wrapping around the edges)
+are detected from a history of state hashes and restarted or perturbed
+(--cycle-* options). Other Life-like rules can be run with --rule, in
+B/S notation (e.g. B36/S23 for HighLife) including Generations rules with
+dying states (e.g. B2/S/C3 for Brian's Brain). By default cells are
+colored by how many generations they've been alive (--color).
 """
 
 # Gets code to pass both pylint & pylint3:
-# pylint: disable=superfluous-parens, unused-variable, too-many-locals
+# pylint: disable=bad-option-value, useless-object-inheritance, superfluous-parens, unused-variable, too-many-locals
 
+import gc
+import sys
 from copy import deepcopy
-from math import sin, pi
-from random import randrange
+from itertools import islice
+from collections import deque
+from math import sin, pi, gcd
+from colorsys import hsv_to_rgb
+from random import randrange, Random
 from time import time
+from PIL import Image
 from spectrobase import SpectroBase
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
-class Life(SpectroBase):
-    """Conway's Game of Life for Adafruit Spectro."""
+# Named rules accepted by --rule, besides B/S notation
+RULES = {"life": "B3/S23", "highlife": "B36/S23", "seeds": "B2/S",
+         "daynight": "B3678/S34678", "brain": "B2/S/C3",
+         "starwars": "B2/S345/C4"}
 
-    def __init__(self, *args, **kwargs):
-        super(Life, self).__init__(*args, **kwargs)
-        self.canvas = None   # LED drawing canvas is alloc'd in run()
-        self.grid_prior = [] # Grid state from prior iteration
-        self.grid_now = []   # Current grid state
-        self.grid_next = []  # New grid state being computed
-        self.repetitions = 0 # Count of prior-matches-next iterations
+class Rule(object):
+    """A Life-like rule: the neighbor counts (of the 8 surrounding cells in
+       state 1) at which a dead cell is born and a live cell survives.
+       Accepts B/S notation ("B3/S23"), the older S/B form ("23/3") and
+       Generations rules with a state count ("B2/S/C3" or "/2/3"), where
+       a live cell that doesn't survive passes through states 2, 3, ...
+       (dying, not counted as neighbors) before becoming dead (0). Raises
+       ValueError for anything else."""
+
+    def __init__(self, text):
+        self.name = RULES.get(text.lower(), text)
+        parts = self.name.upper().split("/")
+        self.birth = self.survive = None
+        self.states = 2
+        try:
+            if parts[0][:1] in ("B", "S"):
+                for part in parts:
+                    if part[:1] == "B" and self.birth is None:
+                        self.birth = self.digits(part[1:])
+                    elif part[:1] == "S" and self.survive is None:
+                        self.survive = self.digits(part[1:])
+                    elif part[:1] in ("C", "G") and len(parts) == 3:
+                        self.states = int(part[1:])
+                    else:
+                        raise ValueError()
+            elif 2 <= len(parts) <= 3:
+                self.survive = self.digits(parts[0])
+                self.birth = self.digits(parts[1])
+                if len(parts) == 3:
+                    self.states = int(parts[2])
+        except ValueError:
+            pass
+        if self.birth is None or self.survive is None or \
+                not 2 <= self.states <= 256:
+            raise ValueError("Invalid Life rule '%s'" % text)
+
+    @staticmethod
+    def digits(text):
+        """Return set of neighbor counts from a string of digits 0-8."""
+        if any(char not in "012345678" for char in text):
+            raise ValueError()
+        return frozenset(int(char) for char in text)
+
+    def table(self):
+        """Return the rule compiled to a lookup table, a list indexed by
+           state * 9 + neighbors giving each cell's next state."""
+        result = []
+        for state in range(self.states):
+            for neighbors in range(9):
+                if state == 0:
+                    result.append(1 if neighbors in self.birth else 0)
+                elif state == 1 and neighbors in self.survive:
+                    result.append(1)
+                else:  # Dying (or dead, if no dying states)
+                    result.append((state + 1) % self.states)
+        return result
+
+    def __repr__(self):
+        return self.name
+
+class ReferenceEngine(object):
+    """Life on a width x height torus using lists of lists and nested
+       Python loops. Slow, but simple enough to check other engines
+       against. Grids are referenced as [row][column], 0 = dead cell,
+       1 = live, 2 and up = dying (Generations rules only). Each live
+       cell's age (generations since birth, up to 255) is kept alongside
+       in the same layout."""
+
+    levels = 1  # array() returns cell states, ages() is available
+
+    def __init__(self, width, height, rule=None):
+        self.width = width
+        self.height = height
+        self.rule = rule or Rule("life")
+        self.table = self.rule.table()
+        self.grid_now = []    # Current grid state
+        self.grid_next = []   # New grid state being computed
+        self.age_now = []     # Current age of each cell
+        self.age_next = []    # New ages being computed
 
     def reset(self):
-        """Allocate/clear grid state, randomly set ~25% of pixels"""
-        # 'prior' grid is allocated all 0's
-        self.grid_prior = [[0 for col in range(self.matrix.width)]
-                           for row in range(self.matrix.height)]
-        # 'next' grid copies size/state (all 0's) from 'prior':
-        self.grid_next = deepcopy(self.grid_prior)
-        # 'now' grid initially copies size/state from 'prior'...
-        self.grid_now = deepcopy(self.grid_prior)
-        # ...then set ~25% of pixels randomly (some may overlap, is OK):
-        for count in range(self.matrix.width * self.matrix.height // 4):
-            self.grid_now[randrange(self.matrix.height)][
-                randrange(self.matrix.width)] = 1
-        self.repetitions = 0  # Reset repetition counter
+        """Allocate/clear grid state, randomly set ~25% of cells"""
+        # 'next' grid is allocated all 0's
+        self.grid_next = [[0 for col in range(self.width)]
+                          for row in range(self.height)]
+        # 'now' grid initially copies size/state from 'next'...
+        self.grid_now = deepcopy(self.grid_next)
+        self.age_now = deepcopy(self.grid_next)
+        self.age_next = deepcopy(self.grid_next)
+        # ...then set ~25% of cells randomly (some may overlap, is OK):
+        self.perturb(self.width * self.height // 4)
+
+    def perturb(self, count):
+        """Set 'count' random cells (some may overlap, is OK)"""
+        for _ in range(count):
+            row = randrange(self.height)
+            col = randrange(self.width)
+            self.grid_now[row][col] = 1
+            self.age_now[row][col] = 0
 
     def step(self):
-        """Run one iteration of Conway's Game of Life, using self.grid_now
-           as present playfield state, and self.grid_next as the destination
-           next state; don't read/write in same buffer!"""
-        self.canvas.Clear()  # Clear LED matrix
-        angle = -time()      # RGB color is a time-constant function...
-        red = (sin(angle) + 1.0) * 127.5
-        green = (sin(angle + pi * 2 / 3) + 1.0) * 127.5
-        blue = (sin(angle + pi * 4 / 3) + 1.0) * 127.5
+        """Run one iteration of the rule, using self.grid_now as present
+           playfield state, and self.grid_next as the destination next
+           state; don't read/write in same buffer! Then swap the present
+           and next grids."""
+        table = self.table
+        live = self.grid_now
+        if self.rule.states > 2:  # Dying cells aren't counted as neighbors
+            live = [[int(cell == 1) for cell in row] for row in live]
         # Use references to individual rows of grid_now and grid_next,
         # avoids a number of MOD operations and 2D array accesses.
-        row_current = self.grid_now[self.matrix.height - 1]
-        row_next = self.grid_now[0]
-        for row in range(self.matrix.height):
+        row_current = live[self.height - 1]
+        row_next = live[0]
+        for row in range(self.height):
             row_prior = row_current
             row_current = row_next
-            row_next = self.grid_now[(row + 1) % self.matrix.height]
+            row_next = live[(row + 1) % self.height]
+            state = self.grid_now[row]
             dest = self.grid_next[row]  # Destination row
-            col_prior = self.matrix.width - 1
-            for col in range(self.matrix.width):
-                col_next = (col + 1) % self.matrix.width
-                center = row_current[col]     # Center pixel
-                neighbors = (                 # 8 neighboring pixels:
+            age = self.age_now[row]
+            age_dest = self.age_next[row]
+            col_prior = self.width - 1
+            for col in range(self.width):
+                col_next = (col + 1) % self.width
+                center = row_current[col]     # Center cell
+                neighbors = (                 # 8 neighboring cells:
                     row_prior[col_prior] +    # (-1,-1)
                     row_prior[col] +          # ( 0,-1)
                     row_prior[col_next] +     # (+1,-1)
@@ -70,43 +175,809 @@ class Life(SpectroBase):
                     row_next[col_prior] +     # (-1,+1)
                     row_next[col] +           # ( 0,+1)
                     row_next[col_next])       # (+1,+1)
-                # Apply Life rules...
-                if center and not (2 <= neighbors <= 3):
-                    # Clear center pixel if set and <2 or >3 neighbors set
-                    dest[col] = 0
-                elif not center and neighbors == 3:
-                    # Set center pixel if clear and 3 neighbors set
-                    dest[col] = 1
+                # Apply rule, then age cells that stay alive
+                dest[col] = table[state[col] * 9 + neighbors]
+                if center and dest[col] == 1:
+                    age_dest[col] = min(age[col] + 1, 255)
                 else:
-                    # No change to pixel state
-                    dest[col] = row_current[col]
-                # Plot set pixels in the canvas
-                if dest[col]:
-                    self.canvas.SetPixel(col, row, red, green, blue)
+                    age_dest[col] = 0
                 col_prior = col
+        self.grid_now, self.grid_next = self.grid_next, self.grid_now
+        self.age_now, self.age_next = self.age_next, self.age_now
 
-    def run(self):
-        # Create offscreen buffer for graphics
-        self.canvas = self.matrix.CreateFrameCanvas()
+    def state_hash(self):
+        """Return a hash of the current grid state, for cycle detection."""
+        return hash(tuple(tuple(row) for row in self.grid_now))
 
-        self.reset()
+    def cells(self):
+        """Return list of (column, row) positions of live cells."""
+        return [(col, row) for row in range(self.height)
+                for col in range(self.width) if self.grid_now[row][col] == 1]
+
+    def array(self):
+        """Return current grid as a (height, width) uint8 NumPy array."""
+        return np.array(self.grid_now, dtype=np.uint8)
+
+    def ages(self):
+        """Return cell ages as a (height, width) uint8 NumPy array."""
+        return np.array(self.age_now, dtype=np.uint8)
+
+class NumpyEngine(ReferenceEngine):
+    """Life on a width x height torus using NumPy: neighbor counts for the
+       whole grid come from shifted (np.roll) copies, summed along rows
+       and then columns, so each generation is a handful of array
+       operations regardless of size, and the rule is applied to every
+       cell with one lookup into its compiled table. Grids and ages are
+       (height, width) uint8 arrays, states as in ReferenceEngine."""
+
+    def __init__(self, width, height, rule=None):
+        super(NumpyEngine, self).__init__(width, height, rule)
+        self.table = np.array(self.table, dtype=np.uint8)
+        self.index = None  # state * 9 + neighbors, per cell
+        self.random = np.random.default_rng()
+
+    def reset(self):
+        self.grid_next = np.zeros((self.height, self.width), dtype=np.uint8)
+        self.grid_now = self.grid_next.copy()
+        self.age_now = self.grid_next.copy()
+        self.index = np.zeros((self.height, self.width), dtype=np.uint16)
+        # Set ~25% of cells randomly (some may overlap, is OK):
+        self.perturb(self.width * self.height // 4)
+
+    def perturb(self, count):
+        cells = self.random.integers(0, self.width * self.height, count)
+        self.grid_now.flat[cells] = 1
+        self.age_now.flat[cells] = 0
+
+    def step(self):
+        grid = self.grid_now
+        live = grid if self.rule.states == 2 else (grid == 1).view(np.uint8)
+        # Sum of each cell and its left and right neighbors (wrapping),
+        # then of that for the rows above, at and below; less the cell
+        # itself gives the 8-neighbor count.
+        rows = live + np.roll(live, 1, axis=1) + np.roll(live, -1, axis=1)
+        neighbors = rows + np.roll(rows, 1, axis=0) + np.roll(rows, -1, axis=0)
+        neighbors -= live
+        # Next state of every cell from the rule table
+        np.multiply(grid, 9, out=self.index, dtype=np.uint16)
+        self.index += neighbors
+        np.take(self.table, self.index, out=self.grid_next)
+        # Cells live now and next get older (saturating), others are 0
+        age = self.age_now
+        age += age != 255
+        age *= live & (self.grid_next == 1)
+        self.grid_now, self.grid_next = self.grid_next, self.grid_now
+
+    def state_hash(self):
+        if self.rule.states > 2:
+            return hash(self.grid_now.tobytes())
+        # Packed to 1 bit per cell first, 8x less data to hash
+        return hash(np.packbits(self.grid_now).tobytes())
+
+    def cells(self):
+        rows, cols = np.nonzero(self.grid_now == 1)
+        return list(zip(cols.tolist(), rows.tolist()))
+
+    def array(self):
+        return self.grid_now
+
+    def ages(self):
+        return self.age_now
+
+class Node(object):
+    """HashLifeEngine quadtree node: a square of 2^k x 2^k cells made of
+       four 2^(k-1) quadrants (nw, ne, sw, se), or only a bitboard of its
+       cells if k is at most SMALL. Nodes are immutable and canonical (one
+       object per distinct pattern), so they can be compared and
+       dict-keyed by identity."""
+
+    __slots__ = ("k", "nw", "ne", "sw", "se", "n", "hash", "bits")
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, k, nw, ne, sw, se, n, hash_value, bits=None):
+        self.k = k            # Level, node is 2^k cells square
+        self.nw = nw
+        self.ne = ne
+        self.sw = sw
+        self.se = se
+        self.n = n            # Population (live cells)
+        self.hash = hash_value  # Structural hash
+        self.bits = bits      # Cells as a bitboard, up to level LEAF
+
+OFF = Node(0, None, None, None, None, 0, 0, 0)
+ON = Node(0, None, None, None, None, 1, 1, 1)
+
+# Nodes up to level LEAF (64 x 64 cells) also hold their cells as a
+# bitboard: an int with cell (x, y) at bit y * STRIDE + x. HashLifeEngine
+# advances those with bitwise operations rather than recursing further,
+# and below level SMALL keeps no quadrants at all, saving the many tiny
+# nodes every result would otherwise be split into.
+LEAF = 6
+SMALL = LEAF - 2
+STRIDE = 1 << LEAF
+FULL = (1 << (STRIDE * STRIDE)) - 1
+LEFT = sum(1 << (STRIDE * row) for row in range(STRIDE))  # Column 0
+RIGHT = LEFT << (STRIDE - 1)                              # Last column
+# Bitboard of the top-left 2^k x 2^k cells, by k
+SQUARES = [sum(((1 << (1 << k)) - 1) << (STRIDE * row)
+               for row in range(1 << k)) for k in range(LEAF + 1)]
+
+class HashLifeEngine(object):
+    """Life on a large plane (2^universe cells square, centered on 0,0;
+       cells leaving it are dropped), using Gosper's HashLife algorithm:
+       the universe is a quadtree of canonical nodes, and the result of
+       advancing any node 2^speed generations is memoized, so repetitive
+       patterns (including empty space) cost nothing to simulate however
+       large they are. Memory doesn't scale with area: the tables are
+       capped, oldest entries evicted (see trim()). step() advances
+       2^speed generations.
+
+       The display shows a viewport onto the universe: each pixel covers
+       2^zoom x 2^zoom cells, with brightness from their population
+       density. Unless a fixed zoom is given, the view follows the
+       population, panning to its center and zooming out to fit it (and
+       back in as it shrinks). set_view() moves it manually. Rules with
+       dying states, or births from 0 neighbors (which would fill empty
+       space), aren't supported."""
+
+    SUCCESSORS = 1 << 16  # Successor memo size limit, see tables()
+    NODES_PER_CELL = 8    # Node table size limit per live cell
+    EVICT_MIN = 1024      # Table entries trim() may always evict per step
+
+    def __init__(self, width, height, universe=12, speed=0, zoom=None,
+                 soup=None, rule=None):
+        self.width = width          # Viewport size in pixels
+        self.height = height
+        self.rule = rule or Rule("life")
+        if self.rule.states > 2 or 0 in self.rule.birth:
+            raise ValueError("Rule %s not supported, needs 2 states and "
+                             "no B0" % self.rule)
+        self.universe = universe
+        self.speed = speed
+        self.zoom = zoom            # Fixed zoom, or None for automatic
+        self.soup = soup or 2 * max(width, height)  # Random start size
+        self.levels = 255           # array() returns 0-255 brightness
+        # Neighbor counts giving a live cell, and whether for dead cells
+        # (birth) and live ones (survival), for life_bits()
+        self.counts = [(count, count in self.rule.birth,
+                        count in self.rule.survive) for count in range(9)
+                       if count in self.rule.birth or
+                       count in self.rule.survive]
+        self.random = Random()
+        self.nodes = {}             # (nw, ne, sw, se) or, up to level
+                                    # SMALL, (bits, k) -> canonical Node
+        self.successors = {}        # Node -> Node 2^speed generations on
+        self.bounds_cache = {}      # Node -> bounding box of live cells
+        self.zeros = [OFF]          # Empty node of each level
+        self.root = OFF
+        self.generation = 0
+        self.view_x = 0.0           # Cell at center of viewport
+        self.view_y = 0.0
+        self.view_zoom = zoom or 0  # Current zoom
+        self.follow = True          # If True, view follows population
+
+    def join(self, nw, ne, sw, se):
+        """Return the canonical node with the given quadrants."""
+        if nw.k < SMALL:
+            return self.from_bits(self.join_bits(nw, ne, sw, se), nw.k + 1)
+        key = (nw, ne, sw, se)
+        node = self.nodes.get(key)
+        if node is None:
+            bits = None
+            if nw.k < LEAF:
+                bits = self.join_bits(nw, ne, sw, se)
+            node = Node(nw.k + 1, nw, ne, sw, se, nw.n + ne.n + sw.n + se.n,
+                        hash((nw.hash, ne.hash, sw.hash, se.hash)), bits)
+            self.nodes[key] = node
+        return node
+
+    @staticmethod
+    def join_bits(nw, ne, sw, se):
+        """Return the bitboard of the node with the given quadrants."""
+        half = 1 << nw.k
+        return (nw.bits | ne.bits << half | sw.bits << STRIDE * half |
+                se.bits << (STRIDE + 1) * half)
+
+    def from_bits(self, bits, k):
+        """Return the canonical node of level k (at most LEAF) whose cells
+           are the bitboard 'bits'."""
+        if k > SMALL:
+            half = 1 << (k - 1)
+            mask = SQUARES[k - 1]
+            return self.join(
+                self.from_bits(bits & mask, k - 1),
+                self.from_bits(bits >> half & mask, k - 1),
+                self.from_bits(bits >> STRIDE * half & mask, k - 1),
+                self.from_bits(bits >> (STRIDE + 1) * half & mask, k - 1))
+        if k == 0:
+            return ON if bits else OFF
+        key = (bits, k)
+        node = self.nodes.get(key)
+        if node is None:
+            node = Node(k, None, None, None, None, bin(bits).count("1"),
+                        hash(key), bits)
+            self.nodes[key] = node
+        return node
+
+    def life_bits(self, board):
+        """Return the next generation of a bitboard (cells beyond its
+           edges counted as dead, so edge results are meaningless)."""
+        above = board >> STRIDE
+        below = board << STRIDE & FULL
+        neighbors = [above, below]
+        for row in (board, above, below):
+            neighbors.append(row << 1 & FULL & ~LEFT)
+            neighbors.append(row >> 1 & ~RIGHT)
+        # Add up every cell's neighbors at once, into bit planes of a
+        # 4-bit count
+        counts = [0, 0, 0, 0]
+        for plane in neighbors:
+            for bit in range(4):
+                carry = counts[bit] & plane
+                counts[bit] ^= plane
+                plane = carry
+                if not plane:
+                    break
+        dead = board ^ FULL
+        result = 0
+        for count, born, survives in self.counts:
+            match = board if not born else dead if not survives else FULL
+            for bit in range(4):
+                match &= counts[bit] if count >> bit & 1 else ~counts[bit]
+            result |= match
+        return result
+
+    def zero(self, k):
+        """Return the empty node of level k."""
+        while len(self.zeros) <= k:
+            empty = self.zeros[-1]
+            self.zeros.append(self.join(empty, empty, empty, empty))
+        return self.zeros[k]
 
-        while True:
-            self.step()  # Run one iteration of life
-            self.canvas = self.matrix.SwapOnVSync(self.canvas)
-            # If prior frame and next frame (2 frames apart) match,
-            # it's probably stabilized on blocks and blinkers.
-            if self.grid_next == self.grid_prior:
-                # Keep running for a bit, but eventually start over
-                self.repetitions += 1
-                if self.repetitions >= 250:
-                    self.reset()
-                    continue
+    def centre(self, node):
+        """Return node one level up, with node in its middle."""
+        if node.k < LEAF:
+            offset = 1 << (node.k - 1)
+            return self.from_bits(node.bits << (STRIDE + 1) * offset,
+                                  node.k + 1)
+        empty = self.zero(node.k - 1)
+        return self.join(self.join(empty, empty, empty, node.nw),
+                         self.join(empty, empty, node.ne, empty),
+                         self.join(empty, node.sw, empty, empty),
+                         self.join(node.se, empty, empty, empty))
+
+    def inner(self, node):
+        """Return middle half of node, one level down."""
+        if node.k <= LEAF:
+            offset = 1 << (node.k - 2)
+            return self.from_bits(node.bits >> (STRIDE + 1) * offset &
+                                  SQUARES[node.k - 1], node.k - 1)
+        return self.join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw)
+
+    def successor(self, node):
+        """Return the middle half of node (one level down), advanced
+           2^speed generations, or 2^(node.k - 2) if fewer. Memoized."""
+        result = self.successors.get(node)
+        if result is not None:
+            return result
+        if node.n == 0:
+            result = node.nw
+        elif node.k <= LEAF:
+            # Small enough to advance as a bitboard: the middle half is
+            # still exact after 2^(k-2) generations, at most
+            board = node.bits
+            for _ in range(1 << min(self.speed, node.k - 2)):
+                board = self.life_bits(board)
+            result = self.from_bits(
+                board >> (STRIDE + 1) * (1 << (node.k - 2)) &
+                SQUARES[node.k - 1], node.k - 1)
+        else:
+            join = self.join
+            step = self.successor
+            # Nine overlapping sub-squares, each advanced...
+            c1 = step(node.nw)
+            c2 = step(join(node.nw.ne, node.ne.nw, node.nw.se, node.ne.sw))
+            c3 = step(node.ne)
+            c4 = step(join(node.nw.sw, node.nw.se, node.sw.nw, node.sw.ne))
+            c5 = step(join(node.nw.se, node.ne.sw, node.sw.ne, node.se.nw))
+            c6 = step(join(node.ne.sw, node.ne.se, node.se.nw, node.se.ne))
+            c7 = step(node.sw)
+            c8 = step(join(node.sw.ne, node.se.nw, node.sw.se, node.se.sw))
+            c9 = step(node.se)
+            if self.speed < node.k - 2:
+                # ...by the full 2^speed generations, just reassemble
+                result = join(join(c1.se, c2.sw, c4.ne, c5.nw),
+                              join(c2.se, c3.sw, c5.ne, c6.nw),
+                              join(c4.se, c5.sw, c7.ne, c8.nw),
+                              join(c5.se, c6.sw, c8.ne, c9.nw))
+            else:
+                # ...by half, then combined and advanced the other half
+                result = join(step(join(c1, c2, c4, c5)),
+                              step(join(c2, c3, c5, c6)),
+                              step(join(c4, c5, c7, c8)),
+                              step(join(c5, c6, c8, c9)))
+        self.successors[node] = result
+        return result
+
+    def build(self, cells, k, left, top):
+        """Return node of level k with top-left cell (left, top), from
+           the live cells (a list of (x, y)) within it."""
+        if not cells:
+            return self.zero(k)
+        if k <= LEAF:
+            bits = 0
+            for x, y in cells:
+                bits |= 1 << ((y - top) * STRIDE + x - left)
+            return self.from_bits(bits, k)
+        half = 1 << (k - 1)
+        middle_x = left + half
+        middle_y = top + half
+        quads = ([], [], [], [])
+        for cell in cells:
+            quads[(cell[0] >= middle_x) + 2 * (cell[1] >= middle_y)].append(
+                cell)
+        return self.join(self.build(quads[0], k - 1, left, top),
+                         self.build(quads[1], k - 1, middle_x, top),
+                         self.build(quads[2], k - 1, left, middle_y),
+                         self.build(quads[3], k - 1, middle_x, middle_y))
+
+    def reset(self):
+        """Start over with a random soup, ~25% of a 'soup' cells square
+           around the origin set (some may overlap, is OK)."""
+        self.nodes.clear()
+        self.successors.clear()
+        self.bounds_cache.clear()
+        self.zeros = [OFF]
+        half = self.soup // 2
+        cells = [(self.random.randrange(-half, half),
+                  self.random.randrange(-half, half))
+                 for _ in range(self.soup * self.soup // 4)]
+        k = max(3, (2 * half - 1).bit_length() + 1)
+        self.root = self.build(cells, k, -(1 << (k - 1)), -(1 << (k - 1)))
+        self.generation = 0
+        self.view_x = self.view_y = 0.0
+        self.view_zoom = self.zoom or 0
+        self.update_view(True)
+
+    def set_cell(self, node, x, y):
+        """Return node with cell (x, y), relative to its top-left, set."""
+        if node.k <= LEAF:
+            return self.from_bits(node.bits | 1 << (y * STRIDE + x), node.k)
+        half = 1 << (node.k - 1)
+        nw, ne, sw, se = node.nw, node.ne, node.sw, node.se
+        if y < half:
+            if x < half:
+                nw = self.set_cell(nw, x, y)
             else:
-                self.repetitions = 0
-            # Shuffle prior, present and next grids down by one.
-            self.grid_prior, self.grid_now, self.grid_next = \
-                self.grid_now, self.grid_next, self.grid_prior
+                ne = self.set_cell(ne, x - half, y)
+        elif x < half:
+            sw = self.set_cell(sw, x, y - half)
+        else:
+            se = self.set_cell(se, x - half, y - half)
+        return self.join(nw, ne, sw, se)
+
+    def perturb(self, count):
+        """Set 'count' random cells within the viewport."""
+        size = 1 << self.view_zoom
+        for _ in range(count):
+            x = int(self.view_x + (self.random.random() - 0.5) *
+                    self.width * size)
+            y = int(self.view_y + (self.random.random() - 0.5) *
+                    self.height * size)
+            while max(abs(x), abs(y)) >= (1 << (self.root.k - 1)) - 1:
+                self.root = self.centre(self.root)
+            offset = 1 << (self.root.k - 1)
+            self.root = self.set_cell(self.root, x + offset, y + offset)
+
+    def step(self):
+        """Advance 2^speed generations."""
+        root = self.root
+        sizes = [len(table) for table, _ in self.tables()]
+        # Pad with empty space until the pattern is within the middle
+        # quarter, so nothing can reach the edges during the advance.
+        while (root.k < self.speed + 3 or
+               root.n != self.inner(self.inner(root)).n):
+            root = self.centre(root)
+        root = self.successor(root)
+        # Trim empty borders (so a given pattern always has the same root
+        # node, for state_hash()), and anything outside the universe.
+        while root.k > 3 and (root.k > self.universe or
+                              root.n == self.inner(root).n):
+            root = self.inner(root)
+        self.root = root
+        self.generation += 1 << self.speed
+        self.trim(sizes)
+        self.update_view()
+
+    def tables(self):
+        """Return the (table, size limit) of each memo table, in the order
+           trim() evicts from them: the successor memo, at a fixed
+           SUCCESSORS budget whatever the population (its results are what
+           make HashLife fast, and every other table only holds what they
+           and the pattern refer to); the bounds cache, at one entry per
+           live cell or viewport pixel (whichever is more), plenty for the
+           current pattern; and the node table, NODES_PER_CELL times that."""
+        limit = max(self.root.n, self.width * self.height)
+        return ((self.successors, self.SUCCESSORS),
+                (self.bounds_cache, limit),
+                (self.nodes, self.NODES_PER_CELL * limit))
+
+    def trim(self, sizes):
+        """Limit memory use: evict the oldest entries of any table over
+           its limit (see tables()). Called after every step with the
+           table sizes before it, evicting at most about twice what the
+           step added, so the work is spread out rather than stalling a
+           frame. Nodes are only evicted once nothing else refers to them
+           (not the pattern, nor a memoized result), so the table stays
+           canonical; ones still in use are moved to the back of the
+           queue. Evicting a node releases its quadrants, so those are
+           checked straight away too."""
+        for (table, limit), size in zip(self.tables(), sizes):
+            count = min(len(table) - limit,
+                        2 * max(len(table) - size, 0) + self.EVICT_MIN)
+            if count <= 0:
+                continue
+            keys = list(islice(table, count))  # Oldest first
+            if table is not self.nodes:
+                for key in keys:
+                    del table[key]
+                continue
+            while keys:
+                node = table.pop(keys.pop(), None)
+                if node is None:
+                    continue  # Already evicted, or never in the table
+                # References: 'node' and getrefcount()'s argument
+                if sys.getrefcount(node) > 2:
+                    table[self.key(node)] = node  # Still in use, keep
+                elif node.k > SMALL:
+                    keys.extend(self.key(quad) for quad in (
+                        node.nw, node.ne, node.sw, node.se))
+
+    @staticmethod
+    def key(node):
+        """Return node's key in the node table."""
+        if node.k <= SMALL:
+            return (node.bits, node.k)
+        return (node.nw, node.ne, node.sw, node.se)
+
+    def state_hash(self):
+        """Return a hash of the current universe, for cycle detection."""
+        return self.root.hash
+
+    def bounds(self, node):
+        """Return bounding box (left, top, right, bottom, exclusive) of
+           live cells in node relative to its top-left, or None if it's
+           empty. Memoized."""
+        if node.n == 0:
+            return None
+        if node.k <= LEAF:
+            # Straight from the bitboard: rows from its lowest and highest
+            # bits, columns from all rows ORed together
+            bits = node.bits
+            columns = bits
+            shift = STRIDE * STRIDE
+            while shift > STRIDE:
+                shift >>= 1
+                columns |= columns >> shift
+            columns &= (1 << STRIDE) - 1
+            return ((columns & -columns).bit_length() - 1,
+                    ((bits & -bits).bit_length() - 1) // STRIDE,
+                    columns.bit_length(),
+                    (bits.bit_length() - 1) // STRIDE + 1)
+        result = self.bounds_cache.get(node)
+        if result is None:
+            half = 1 << (node.k - 1)
+            boxes = []
+            for quad, dx, dy in ((node.nw, 0, 0), (node.ne, half, 0),
+                                 (node.sw, 0, half), (node.se, half, half)):
+                box = self.bounds(quad)
+                if box is not None:
+                    boxes.append((box[0] + dx, box[1] + dy,
+                                  box[2] + dx, box[3] + dy))
+            result = (min(box[0] for box in boxes),
+                      min(box[1] for box in boxes),
+                      max(box[2] for box in boxes),
+                      max(box[3] for box in boxes))
+            self.bounds_cache[node] = result
+        return result
+
+    def set_view(self, x, y, zoom=None):
+        """Center viewport on cell (x, y), optionally setting zoom, and
+           stop following the population."""
+        self.view_x = float(x)
+        self.view_y = float(y)
+        if zoom is not None:
+            self.zoom = self.view_zoom = zoom
+        self.follow = False
+
+    def update_view(self, jump=False):
+        """If following the population, pan (smoothly, unless 'jump')
+           toward its center and zoom to fit it."""
+        box = self.bounds(self.root)
+        if not self.follow or box is None:
+            return
+        offset = 1 << (self.root.k - 1)
+        target_x = (box[0] + box[2]) / 2.0 - offset
+        target_y = (box[1] + box[3]) / 2.0 - offset
+        rate = 1.0 if jump else 0.1
+        self.view_x += (target_x - self.view_x) * rate
+        self.view_y += (target_y - self.view_y) * rate
+        if self.zoom is None:
+            # Smallest zoom at which the population fits, zooming in only
+            # once it fits comfortably to avoid flip-flopping.
+            need = max((box[2] - box[0]) / float(self.width),
+                       (box[3] - box[1]) / float(self.height))
+            zoom = max(0, int(need - 1).bit_length())
+            if zoom > self.view_zoom or (
+                    zoom < self.view_zoom and
+                    need < 0.8 * (1 << (self.view_zoom - 1))):
+                self.view_zoom = zoom
+
+    def pixels(self):
+        """Yield (column, row, population) for each non-empty viewport
+           pixel, visiting only quadtree nodes that are in view and
+           non-empty."""
+        zoom = self.view_zoom
+        size = 1 << zoom
+        # Top-left of view, aligned to pixel (node) boundaries
+        left = (int(self.view_x) - self.width * size // 2) >> zoom << zoom
+        top = (int(self.view_y) - self.height * size // 2) >> zoom << zoom
+        right = left + self.width * size
+        bottom = top + self.height * size
+        root = self.root
+        while root.k < zoom:
+            root = self.centre(root)
+        origin = -(1 << (root.k - 1))
+        stack = [(root, origin, origin)]
+        while stack:
+            node, x, y = stack.pop()
+            if node.n == 0:
+                continue
+            extent = 1 << node.k
+            if x >= right or y >= bottom or x + extent <= left or \
+                    y + extent <= top:
+                continue
+            if node.k == zoom:
+                yield (x - left) >> zoom, (y - top) >> zoom, node.n
+            elif node.k <= SMALL:
+                # No quadrants, count its cells into pixels directly
+                counts = {}
+                bits = node.bits
+                while bits:
+                    low = bits & -bits
+                    bits ^= low
+                    cell_y, cell_x = divmod(low.bit_length() - 1, STRIDE)
+                    cell_x += x
+                    cell_y += y
+                    if left <= cell_x < right and top <= cell_y < bottom:
+                        pixel = ((cell_x - left) >> zoom,
+                                 (cell_y - top) >> zoom)
+                        counts[pixel] = counts.get(pixel, 0) + 1
+                for (col, row), count in counts.items():
+                    yield col, row, count
+            else:
+                half = extent >> 1
+                stack.append((node.nw, x, y))
+                stack.append((node.ne, x + half, y))
+                stack.append((node.sw, x, y + half))
+                stack.append((node.se, x + half, y + half))
+
+    def cells(self):
+        """Return list of (column, row) of non-empty viewport pixels."""
+        return [(col, row) for col, row, _ in self.pixels()]
+
+    def array(self):
+        """Return viewport as a (height, width) uint8 NumPy array of
+           brightness (0-255) from cell density: 255 for a live cell at
+           zoom 0 or 25% density or more when zoomed out."""
+        cols, rows, counts = [], [], []
+        for col, row, count in self.pixels():
+            cols.append(col)
+            rows.append(row)
+            counts.append(count)
+        density = np.zeros((self.height, self.width))
+        density[rows, cols] = counts
+        density *= 4.0 / (1 << (2 * self.view_zoom))
+        return (np.sqrt(np.minimum(density, 1.0)) * 255).astype(np.uint8)
+
+# Available --engine choices
+ENGINES = {"reference": ReferenceEngine, "numpy": NumpyEngine,
+           "hashlife": HashLifeEngine}
+
+class CycleDetector(object):
+    """Detects when a sequence of states (as hashes) repeats with any
+       period up to max_period, in O(1) time per state: the last max_period
+       hashes are kept in a deque, along with a dict of the position each
+       was last seen at. Hash collisions could in theory report a cycle
+       that isn't there, which for Life just means an early restart."""
+
+    def __init__(self, max_period):
+        self.max_period = max_period
+        self.history = deque()  # Recent hashes, oldest first
+        self.seen = {}          # Hash -> position in sequence last seen
+        self.position = 0       # Number of states added
+
+    def clear(self):
+        """Forget all history."""
+        self.history.clear()
+        self.seen.clear()
+
+    def add(self, state_hash):
+        """Add the next state's hash. Returns the cycle's period if it
+           matches one of the last max_period states, else 0."""
+        self.position += 1
+        last_seen = self.seen.get(state_hash)
+        self.seen[state_hash] = self.position
+        self.history.append(state_hash)
+        if len(self.history) > self.max_period:
+            oldest = self.history.popleft()
+            if self.seen[oldest] == self.position - len(self.history):
+                del self.seen[oldest]  # Not seen again since
+        if last_seen is None:
+            return 0
+        return self.position - last_seen
+
+def age_palette(states):
+    """Return the colors for --color age as a (states * 256, 3) uint8
+       NumPy array indexed by state * 256 + age. Newborn cells are white,
+       turning yellow, then green, then settling on dimmer blue over
+       their first 48 generations; dying states (Generations rules) fade
+       out through red; dead cells are black."""
+    palette = np.zeros((states, 256, 3), dtype=np.uint8)
+    for age in range(256):
+        fraction = min(age / 48.0, 1.0)
+        palette[1, age] = [round(channel * 255) for channel in hsv_to_rgb(
+            1 / 6.0 + fraction / 2.0, min(age / 4.0, 1.0),
+            1.0 - 0.4 * fraction)]
+    for state in range(2, states):
+        palette[state, :] = (255 * (states - state) // (states - 1), 0, 0)
+    return palette.reshape(-1, 3)
+
+class Life(SpectroBase):
+    """Conway's Game of Life for Adafruit Spectro."""
+
+    def __init__(self, *args, **kwargs):
+        super(Life, self).__init__(*args, **kwargs)
+        self.engine = None   # Simulation engine is alloc'd in run()
+        self.cycles = None   # CycleDetector, also alloc'd in run()
+        self.frame = None    # NumPy image of cells, if NumPy available
+        self.palette = None  # age_palette() for --color age
+        self.index = None    # Per-cell palette index, state * 256 + age
+        self.hold = None     # Generations left before cycle action
+        self.fps = 30        # Generations per second
+        self.parser.add_argument(
+            "--engine", action="store", help="Simulation engine: 'numpy' "
+            "(fast, default if NumPy is installed), 'reference' (original "
+            "cell-by-cell Python) or 'hashlife' (huge universe, shown "
+            "through a viewport)", choices=sorted(ENGINES),
+            default="numpy" if np is not None else "reference")
+        self.parser.add_argument(
+            "--rule", action="store", help="Life-like rule in B/S notation, "
+            "e.g. B36/S23, or Generations rule with a state count, e.g. "
+            "B2/S/C3. Also accepts names: " + ", ".join(sorted(RULES)) +
+            ". Default: life (B3/S23)", default=Rule("life"), type=Rule)
+        self.parser.add_argument(
+            "--color", action="store", help="Cell coloring: 'age' (by "
+            "generations alive; needs NumPy) or 'cycle' (all cells one "
+            "color, changing over time). hashlife always uses 'cycle'. "
+            "Default: age", choices=("age", "cycle"), default="age")
+        self.parser.add_argument(
+            "--universe", action="store", help="hashlife: universe is 2^N "
+            "cells square; cells leaving it vanish. Default: 12",
+            default=12, type=int)
+        self.parser.add_argument(
+            "--speed", action="store", help="hashlife: advance 2^N "
+            "generations per frame. Default: 0", default=0, type=int)
+        self.parser.add_argument(
+            "--zoom", action="store", help="hashlife: each pixel shows 2^N "
+            "x 2^N cells (brightness = density). Default: automatic, "
+            "following the population", type=int)
+        self.parser.add_argument(
+            "--soup", action="store", help="hashlife: size of random "
+            "starting area, in cells. Default: twice display width", type=int)
+        self.parser.add_argument(
+            "--cycle-period", action="store", help="Longest cycle (in "
+            "generations) to detect; 0 disables. Default: long enough for "
+            "a glider to wrap around the display", type=int)
+        self.parser.add_argument(
+            "--cycle-hold", action="store", help="Generations to keep "
+            "running after a cycle is found before --cycle-action. "
+            "Default: 250", default=250, type=int)
+        self.parser.add_argument(
+            "--cycle-action", action="store", help="What to do about a "
+            "cycle: 'reset' (new random board), 'perturb' (add some random "
+            "cells) or 'none'. Default: reset",
+            choices=("reset", "perturb", "none"), default="reset")
+
+    def reset(self):
+        """Randomize grid and start looking for cycles over"""
+        self.engine.reset()
+        self.cycles.clear()
+        self.hold = None
+
+    def run(self):
+        width = self.matrix.width
+        height = self.matrix.height
+        if self.args.engine == "hashlife":
+            try:
+                self.engine = HashLifeEngine(
+                    width, height, self.args.universe, self.args.speed,
+                    self.args.zoom, self.args.soup, self.args.rule)
+            except ValueError as error:
+                self.parser.error(str(error))
+        else:
+            self.engine = ENGINES[self.args.engine](
+                width, height, self.args.rule)
+        period = self.args.cycle_period
+        if period is None:
+            # A glider moves one cell diagonally every 4 generations, so
+            # returns to its start after 4 * lcm(width, height).
+            period = 4 * width * height // gcd(width, height)
+        self.cycles = CycleDetector(period)
+        if np is not None:
+            self.frame = np.zeros((height, width, 3), dtype=np.uint8)
+            if self.args.color == "age" and self.engine.levels == 1:
+                self.palette = age_palette(self.args.rule.states)
+                self.index = np.zeros((height, width), dtype=np.uint16)
+        thresholds = gc.get_threshold()
+        if self.args.engine == "hashlife":
+            # HashLife keeps up to millions of nodes. Reference counting
+            # alone frees them (they can't form cycles), but each full
+            # collection by the cycle collector would rescan them all,
+            # stalling a frame, so make those rare while it runs.
+            gc.set_threshold(thresholds[0], thresholds[1], 100 * thresholds[2])
+        self.reset()
+        try:
+            self.run_frames()  # Calls render() each frame
+        finally:
+            gc.set_threshold(*thresholds)
+
+    def render(self, canvas):
+        self.engine.step()  # Run one iteration of life
+        if self.hold is None:
+            # If the board repeats an earlier state it's stuck in a cycle
+            # (blocks and blinkers, gliders wrapping around, etc.).
+            # Keep running for a bit, but eventually start over.
+            if (self.cycles.max_period > 0 and
+                    self.cycles.add(self.engine.state_hash())):
+                self.hold = self.args.cycle_hold
+        elif self.hold > 0:
+            self.hold -= 1
+        elif self.args.cycle_action == "reset":
+            self.reset()
+        elif self.args.cycle_action == "perturb":
+            self.engine.perturb(self.engine.width * self.engine.height // 16)
+            self.cycles.clear()
+            self.hold = None
+
+        if self.palette is not None:
+            # Look up every cell's color by state and age, upload as one
+            # image
+            np.multiply(self.engine.array(), 256, out=self.index,
+                        dtype=np.uint16)
+            self.index += self.engine.ages()
+            np.take(self.palette, self.index, axis=0, out=self.frame)
+            canvas.SetImage(Image.fromarray(self.frame))
+            return
+
+        angle = -time()      # RGB color is a time-constant function...
+        red = (sin(angle) + 1.0) * 127.5
+        green = (sin(angle + pi * 2 / 3) + 1.0) * 127.5
+        blue = (sin(angle + pi * 4 / 3) + 1.0) * 127.5
+        if self.frame is not None:
+            # Color every live cell at once and upload as one image
+            color = np.array((red, green, blue), dtype=np.uint8)
+            cells = self.engine.array()[..., np.newaxis]
+            if self.engine.levels == 1:
+                np.multiply(cells == 1, color, out=self.frame)
+            else:  # Brightness levels, scale color
+                self.frame[:] = cells * color.astype(np.uint16) // 255
+            canvas.SetImage(Image.fromarray(self.frame))
+        else:
+            # Plot set cells in the canvas
+            canvas.Clear()
+            for col, row in self.engine.cells():
+                canvas.SetPixel(col, row, red, green, blue)
 
 if __name__ == "__main__":
     MY_APP = Life()  # Instantiate class, calls __init__() above
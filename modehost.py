@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+
+"""
+In-process mode host for selector.py. Rather than starting a new Python
+interpreter for each mode (re-importing PIL & NumPy, re-initializing the
+matrix and reloading fonts/sprites every button press), SpectroBase scripts
+are imported once as modules into the selector process and run in a thread,
+all sharing a single long-lived matrix. Each running mode is represented by
+a HostedMode object with the same poll()/terminate()/wait()/returncode
+interface as subprocess.Popen, so the selector treats both alike.
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, invalid-name, superfluous-parens
+
+import os
+import time
+import threading
+import traceback
+from spectrobase import load_script_class
+
+class ModeStopped(Exception):
+    """Raised inside a hosted script's SwapOnVSync() call to unwind its
+       run() loop when the selector switches modes."""
+
+class HostedMatrix(object):
+    """Wraps the host's persistent matrix for one hosted mode: notes the
+       time of the first frame shown (for switch latency) and stops the
+       mode at its next SwapOnVSync() once a stop has been requested.
+       Once the mode is killed, the matrix is dropped and any use of it
+       raises ModeStopped."""
+
+    def __init__(self, matrix, mode):
+        self.matrix = matrix
+        self.mode = mode
+
+    def SwapOnVSync(self, *args, **kwargs):
+        """Matrix SwapOnVSync(), raising ModeStopped if mode is stopping."""
+        if self.mode.stopping or self.matrix is None:
+            raise ModeStopped()
+        result = self.matrix.SwapOnVSync(*args, **kwargs)
+        if self.mode.first_frame_time is None:
+            self.mode.first_frame_time = time.time()
+            self.mode.notify()
+        return result
+
+    def __getattr__(self, name):
+        if self.__dict__.get("matrix") is None:  # Mode was killed
+            raise ModeStopped()
+        return getattr(self.matrix, name)
+
+class HostedMode(object):
+    """One activation of a SpectroBase script running in a thread of the
+       host process, with a subprocess.Popen-like interface. returncode is
+       None while running, 0 if run() returned or was stopped, 1 if it
+       raised an exception."""
+
+    def __init__(self, app, matrix, start_time, notify=None, setup=None):
+        self.app = app
+        self.pid = None
+        self.ready_fd = None  # (Subprocess modes use this; see zygote.py)
+        self.notify = notify or (lambda: None)  # First frame & exit callback
+        self.returncode = None
+        self.stopping = False
+        self.start_time = start_time   # When the switch to this mode began
+        self.first_frame_time = None   # When its first frame was shown
+        # CPU seconds used by the mode's thread, once finished. A lower
+        # bound: time in any threads the script starts itself isn't
+        # counted (it can't be told apart from the rest of the process).
+        self.cpu_time = 0.0
+        self.setup = setup             # Called at start of mode's thread
+        self.cwd = os.getcwd()         # Some scripts chdir(), undo that
+        self.hosted_matrix = HostedMatrix(matrix, self)
+        app.matrix = self.hosted_matrix
+        app.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def run(self):
+        """Thread body: run the script until it's stopped or fails."""
+        try:
+            if self.setup is not None:
+                self.setup()
+            self.app.run()
+            self.returncode = 0
+        except ModeStopped:
+            self.returncode = 0
+        except SystemExit as error:  # Script called exit()
+            self.returncode = 1 if error.code else 0
+        except Exception:  # pylint: disable=broad-except
+            traceback.print_exc()
+            self.returncode = 1
+        finally:
+            self.cpu_time = time.thread_time()
+            self.app.matrix = None  # Don't keep a reference to the matrix
+            os.chdir(self.cwd)
+            self.notify()
+
+    def poll(self):
+        """Return returncode, None if the mode is still running."""
+        return self.returncode
+
+    def terminate(self):
+        """Ask the mode to stop; takes effect at its next frame."""
+        self.stopping = True
+        self.app.running = False
+
+    def kill(self):
+        """Stop the mode and take the matrix away from it: threads can't
+           be forcibly stopped, but if the script is stuck outside its
+           frame loop (e.g. in a socket call), it can no longer draw when
+           it returns. If wait() still times out, the selector abandons
+           the thread (see ModeHost.abandon())."""
+        self.terminate()
+        self.hosted_matrix.matrix = None
+
+    def wait(self, timeout=None):
+        """Wait for the mode's thread to finish, return returncode."""
+        self.thread.join(timeout)
+        return self.returncode
+
+    def switch_latency(self):
+        """Seconds from the start of the switch to this mode until its
+           first frame was shown, or None if no frame yet."""
+        if self.first_frame_time is None:
+            return None
+        return self.first_frame_time - self.start_time
+
+class ModeHost(object):
+    """Loads SpectroBase scripts as modules and runs them, one at a time,
+       on a matrix that persists across mode switches. Script instances are
+       cached, so module imports and __init__() work happen only once."""
+
+    def __init__(self, flags, notify=None):
+        self.flags = flags    # Command line passed to every hosted script
+        self.notify = notify  # Called (from mode's thread) on first frame
+        self.matrix = None    # and when mode exits
+        self.apps = {}      # Script filename -> SpectroBase instance
+
+    def load(self, script):
+        """Import script and instantiate its SpectroBase subclass, parsing
+           the host's flags as its command line. Cached after first call."""
+        if script not in self.apps:
+            app = load_script_class(script)()
+            app.args = app.parser.parse_args(self.flags)
+            self.apps[script] = app
+        return self.apps[script]
+
+    def launch(self, script, start_time=None, setup=None):
+        """Start script running in-process, creating the shared matrix if
+           needed. start_time (default now) is when the mode switch began,
+           for switch latency reporting. setup, if given, is called first
+           in the mode's new thread. Returns a HostedMode."""
+        app = self.load(script)
+        if self.matrix is None:
+            self.matrix = app.create_matrix()
+        return HostedMode(app, self.matrix,
+                          time.time() if start_time is None else start_time,
+                          self.notify, setup)
+
+    def abandon(self, mode):
+        """Give up on a mode whose thread didn't exit after kill(). The
+           thread is left to finish on its own (it can't touch the matrix
+           any more), and its script instance is dropped from the cache so
+           it's never reused; selector.py runs that script out-of-process
+           from then on."""
+        for script, app in list(self.apps.items()):
+            if app is mode.app:
+                del self.apps[script]
+
+    def release(self):
+        """Free the shared matrix (e.g. before running a subprocess mode
+           that needs the hardware itself). Recreated on next launch()."""
+        self.matrix = None
@@ -186,11 +186,9 @@ class NextBus(SpectroBase):
                 if tile.x_pos < image.size[0]: # Draw tile if onscreen
                     tile.draw(self)
 
-            # Scale image 1:2, bilinear interpolation for smoothiness
+            # Scale image 1:2 with 2x2 averaging for smoothiness
             # Copy scaled PIL image to matrix buffer, swap buffers each frame
-            double_buffer.SetImage(image.resize(
-                (self.matrix.width, self.matrix.height),
-                resample=Image.BILINEAR))
+            double_buffer.SetImage(self.downsample(image, 2))
             double_buffer = self.matrix.SwapOnVSync(double_buffer)
 
 if __name__ == "__main__":
@@ -2,14 +2,63 @@
 
 """
 A Python port of the Adafruit_PixelDust Arduino library.
-Particle similation for "LED sand."
+Particle similation for "LED sand." PixelDust keeps the original
+grain-object-at-a-time implementation; NumpyPixelDust stores grains as
+NumPy arrays and updates their velocities in bulk, for many more grains
+per frame (see 'benchmark.py dust'). ParallelPixelDust, experimental and
+not yet in ENGINES, splits that work across CPU cores for long chains of
+panels. FixedTimestep runs any of these at a set number of iterations per
+second, independent of the display frame rate.
 """
 
 # Gets code to pass both pylint & pylint3:
 # pylint: disable=bad-option-value, useless-object-inheritance
 
+import os
 import math
+import time
 import random
+import multiprocessing
+from operator import or_
+try:
+    import numpy as np
+    from multiprocessing import shared_memory
+except ImportError:
+    np = None
+
+def mask_bytes(mask, width, height):
+    """Return an obstacle mask as bytes, one per pixel in row-major order,
+       1 where there's an obstacle. 'mask' is a PIL image (any mode;
+       non-black pixels are obstacles), a NumPy array or a list of rows
+       (non-zero elements are obstacles), width x height pixels."""
+    if hasattr(mask, "convert"):  # PIL image
+        if mask.size != (width, height):
+            raise ValueError("Obstacle image is %dx%d, not %dx%d" %
+                             (mask.size + (width, height)))
+        # Test all three channels: a greyscale conversion rounds dark
+        # colors like (1, 0, 0) down to 0 and would leave them free.
+        mask = mask.convert("RGB")
+        if np is not None:
+            return np.asarray(mask).any(axis=2).tobytes()
+        rgb = mask.tobytes()
+        return bytes(1 if any(rgb[i:i + 3]) else 0
+                     for i in range(0, len(rgb), 3))
+    if hasattr(mask, "shape"):    # NumPy array
+        if mask.shape != (height, width):
+            raise ValueError("Obstacle mask is %s, not (%d, %d)" %
+                             (mask.shape, height, width))
+        return (mask != 0).tobytes()
+    if len(mask) != height or any(len(row) != width for row in mask):
+        raise ValueError("Obstacle mask must be %d rows of %d" %
+                         (height, width))
+    return bytes(1 if value else 0 for row in mask for value in row)
+
+# Grain materials for NumpyPixelDust.set_materials(), as (name,
+# elasticity, noise multiplier). Elasticity None means the value the
+# simulation was created with. Water barely bounces but jiggles more than
+# sand, so it spreads out and levels off rather than piling up.
+MATERIALS = (("sand", None, 1.0), ("water", 0.0, 4.0))
+SAND, WATER = range(len(MATERIALS))
 
 # pylint: disable=too-few-public-methods
 class Grain(object):
@@ -32,14 +81,15 @@ class PixelDust(object):
        appealing to the eye but takes many shortcuts with collision
        detection, etc."""
 
-    def __init__(self, width, height, elasticity):
+    def __init__(self, width, height, elasticity, seed=None):
         self.width = width            # Dimensions of pixel grid
         self.height = height
         self.elasticity = -elasticity # Invert elasticity; multiply = bounce
         self.scale = 0.005
+        self.random = random.Random(seed) # Same seed = same simulation
         self.num_grains = 0           # Grain list is not populated at start
         self.grains = None
-        self.bitmap = None
+        self.bitmap = None            # Occupancy, 1 byte/pixel, row-major
         self.clear()                  # Allocates/inits self.bitmap
 
     def set_pixel(self, coord_x, coord_y):
@@ -48,31 +98,39 @@ class PixelDust(object):
            BEFORE placing any sand grains with the place() or randomize()
            functions. Setting a pixel does NOT place a sand grain there,
            only marks that location as an obstacle."""
-        self.bitmap[int(coord_x)][int(coord_y)] = True
+        self.bitmap[int(coord_y) * self.width + int(coord_x)] = 1
 
     def clear_pixel(self, coord_x, coord_y):
         """Clears state of one pixel on the pixel grid; the inverse of
            set_pixel(). Call this function BEFORE placing any sand grains
            with the place() or randomize() functions."""
-        self.bitmap[int(coord_x)][int(coord_y)] = False
+        self.bitmap[int(coord_y) * self.width + int(coord_x)] = 0
 
     def get_pixel(self, coord_x, coord_y):
         """Returns state of one pixel on the pixel grid; True if pixel is
            set (an obstacle), False if clear (grains can move here)."""
-        return self.bitmap[int(coord_x)][int(coord_y)]
+        return self.bitmap[int(coord_y) * self.width + int(coord_x)] != 0
 
     def clear(self):
         """Clear the pixel grid contents (remove all obstacles)."""
-        self.bitmap = [[False for _ in range(self.height)]
-                       for _ in range(self.width)]
+        self.bitmap = bytearray(self.width * self.height)
+
+    def set_obstacles(self, mask):
+        """Set many pixels on the pixel grid at once, from a PIL image or
+           NumPy array the size of the grid (see mask_bytes()); pixels
+           already set stay set. As with set_pixel(), call this BEFORE
+           placing any sand grains."""
+        self.bitmap = bytearray(map(or_, self.bitmap,
+                                    mask_bytes(mask, self.width, self.height)))
 
     def set_position(self, coord_x, coord_y):
         """Place one sand grain on the pixel grid. Returns True if grain is
            added, False if position is already occupied."""
-        if self.bitmap[coord_x][coord_y]:
+        index = coord_y * self.width + coord_x
+        if self.bitmap[index]:
             return False # Position already occupied
         self.grains.append(Grain(coord_x, coord_y))
-        self.bitmap[coord_x][coord_y] = True
+        self.bitmap[index] = 1
         self.num_grains += 1
         return True
 
@@ -81,27 +139,44 @@ class PixelDust(object):
            of grain (0 to num_grains-1), returns X, Y coordinates."""
         return self.grains[i].position[0], self.grains[i].position[1]
 
+    def close(self):
+        """Release any resources (e.g. worker processes) the simulation
+           holds. It can't be iterated after this."""
+
+    def get_positions(self):
+        """Get positions of all sand grains. Returns two sequences, the X
+           and Y coordinates of grains 0 to num_grains-1."""
+        return ([grain.position[0] for grain in self.grains],
+                [grain.position[1] for grain in self.grains])
+
     def randomize(self, num_grains):
         """Randomize grain coordinates. This assigns random starting
            locations to every grain in the simulation, making sure they do
            not overlap or occupy obstacle pixels placed with the set_pixel()
-           function. The pixel grid should first be cleared with the clear()
-           functions and any obstacles then placed with set_pixel(); don't
-           randomize() on an already-active field."""
-        max_grains = sum(x.count(False) for x in self.bitmap)
-        num_grains = min(num_grains, max_grains)
+           or set_obstacles() functions. The pixel grid should first be
+           cleared with the clear() functions and any obstacles then
+           placed; don't randomize() on an already-active field. Grains
+           are sampled from a list of the free pixels, so this takes the
+           same time however full the grid is."""
+        free = [index for index, used in enumerate(self.bitmap) if not used]
+        num_grains = min(num_grains, len(free))
         self.num_grains = 0
         self.grains = []
-        # Populate grains array, avoiding occupied spaces
-        for _ in range(num_grains):
-            while not self.set_position(random.randrange(self.width),
-                                        random.randrange(self.height)):
-                pass
+        # Populate grains array from distinct free spaces
+        for index in self.random.sample(free, num_grains):
+            self.set_position(index % self.width, index // self.width)
 
     # pylint: disable=too-many-nested-blocks, too-many-branches, too-many-statements
     def iterate(self, accel):
         """Run one iteration (frame) of the particle simulation.
            Pass in acceleration as a 3-tuple (X,Y,Z)."""
+        accel, noise = self.forces(accel)
+        self.accelerate(accel, noise)
+        self.move()
+
+    def forces(self, accel):
+        """Return acceleration (X,Y,Z) scaled to sub-pixel units and the
+           amount of random noise to apply, for accelerate()."""
 
         # Scale from G to sub-pixel units, flip X axis
         accel = (accel[0] * -self.scale, accel[1] * self.scale,
@@ -115,10 +190,15 @@ class PixelDust(object):
 
         noise = 0.025 - max(min(abs(accel[2]) / 4, 0.02), 0.005)
 
-        # Apply 2D accel vector to grain velocities...
+        return accel, noise
+
+    def accelerate(self, accel, noise):
+        """Apply 2D accel vector (in sub-pixel units) plus random noise of
+           up to +/-noise to grain velocities, limiting speed to 1 pixel
+           per iteration."""
         for grain in self.grains:
-            grain.velocity[0] += accel[0] + random.uniform(-noise, noise)
-            grain.velocity[1] += accel[1] + random.uniform(-noise, noise)
+            grain.velocity[0] += accel[0] + self.random.uniform(-noise, noise)
+            grain.velocity[1] += accel[1] + self.random.uniform(-noise, noise)
             # Terminal velocity (in any direction) is 1.0 units -- 1 pixel --
             # which keeps moving grains from passing through each other and
             # other such mayhem. Though it takes some extra math, velocity is
@@ -131,7 +211,10 @@ class PixelDust(object):
                 grain.velocity[0] /= velocity  # Maintain heading &
                 grain.velocity[1] /= velocity  # limit magnitude
 
-        # ...then update position of each grain, one at a time, checking for
+    def move(self):
+        """Update position of each grain from its velocity, handling
+           collisions."""
+        # Update position of each grain, one at a time, checking for
         # collisions and having them react. This really seems like it
         # shouldn't work, as only one grain is considered at a time while
         # the rest are regarded as stationary. Yet this naive algorithm,
@@ -143,80 +226,637 @@ class PixelDust(object):
         # got out of hand for my tiny dinosaur brain.)
 
         for grain in self.grains:
-            newx = grain.position[0] + grain.velocity[0] # New position
-            newy = grain.position[1] + grain.velocity[1] # in grain space
-            if newx < 0:                             # If going out of bounds,
-                newx = 0                             # keep it inside,
-                grain.velocity[0] *= self.elasticity # and bounce off wall
-            elif newx >= self.width:
-                newx = self.width - 0.001
-                grain.velocity[0] *= self.elasticity
-            if newy < 0:
-                newy = 0
-                grain.velocity[1] *= self.elasticity
-            elif newy >= self.height:
-                newy = self.height - 0.001
-                grain.velocity[1] *= self.elasticity
-
-            # old_index/new_index are the prior and new pixel index for this
-            # grain -- easier to check motion vs handling X & Y separately.
-            old_index = (int(grain.position[1]) * self.width +
-                         int(grain.position[0]))
-            new_index = int(newy) * self.width + int(newx)
-
-            # If grain's moving to a new pixel, but pixel's already occupied...
-            if old_index != new_index and self.get_pixel(newx, newy):
-                # What direction when blocked?
-                delta = abs(new_index - old_index)
-                if delta == 1:                           # 1 pixel left/right
-                    newx = grain.position[0]             # Cancel X motion
-                    grain.velocity[0] *= self.elasticity # bounce X velocity
-                elif delta == self.width:                # 1 pixel up or down
-                    newy = grain.position[1]             # Cancel Y motion
-                    grain.velocity[1] *= self.elasticity # bounce Y velocity
-                else: # Diagonal intersection is more tricky...
-                    # Try skidding along just one axis of motion if possible
-                    # (start w/faster axis).
-                    if abs(grain.velocity[0]) >= abs(grain.velocity[1]):
-                        # X axis is faster
-                        if not self.get_pixel(newx, grain.position[1]):
-                            # (newx, oldy) is free, take it!
-                            # But cancel Y motion, bounce Y velocity
-                            newy = grain.position[1]
-                            grain.velocity[1] *= self.elasticity
-                        else: # X pixel is taken, so try Y...
-                            if not self.get_pixel(grain.position[0], newy):
-                                # (oldx, newy) is free, take it...
-                                # but cancel X motion, bounce X velocity
-                                newx = grain.position[0]
-                                grain.velocity[0] *= self.elasticity
-                            else: # Both spots are occupied
-                                # Cancel X & Y motion, bounce X & Y velocity
-                                newx = grain.position[0]
-                                newy = grain.position[1]
-                                grain.velocity[0] *= self.elasticity
-                                grain.velocity[1] *= self.elasticity
-                    else: # Y axis is faster, start there
-                        if not self.get_pixel(grain.position[0], newy):
+            self.move_grain(grain.position, grain.velocity)
+
+    def move_grain(self, position, velocity):
+        """Move one grain, given its position and velocity as [X, Y] lists
+           (updated in place), marking its new spot in the pixel grid."""
+        newx = position[0] + velocity[0] # New position
+        newy = position[1] + velocity[1] # in grain space
+        if newx < 0:                         # If going out of bounds,
+            newx = 0                         # keep it inside,
+            velocity[0] *= self.elasticity   # and bounce off wall
+        elif newx >= self.width:
+            newx = self.width - 0.001
+            velocity[0] *= self.elasticity
+        if newy < 0:
+            newy = 0
+            velocity[1] *= self.elasticity
+        elif newy >= self.height:
+            newy = self.height - 0.001
+            velocity[1] *= self.elasticity
+
+        # old_index/new_index are the prior and new pixel index for this
+        # grain -- easier to check motion vs handling X & Y separately.
+        old_index = int(position[1]) * self.width + int(position[0])
+        new_index = int(newy) * self.width + int(newx)
+
+        # If grain's moving to a new pixel, but pixel's already occupied...
+        if old_index != new_index and self.get_pixel(newx, newy):
+            # What direction when blocked?
+            delta = abs(new_index - old_index)
+            if delta == 1:                       # 1 pixel left/right
+                newx = position[0]               # Cancel X motion
+                velocity[0] *= self.elasticity   # bounce X velocity
+            elif delta == self.width:            # 1 pixel up or down
+                newy = position[1]               # Cancel Y motion
+                velocity[1] *= self.elasticity   # bounce Y velocity
+            else: # Diagonal intersection is more tricky...
+                # Try skidding along just one axis of motion if possible
+                # (start w/faster axis).
+                if abs(velocity[0]) >= abs(velocity[1]):
+                    # X axis is faster
+                    if not self.get_pixel(newx, position[1]):
+                        # (newx, oldy) is free, take it!
+                        # But cancel Y motion, bounce Y velocity
+                        newy = position[1]
+                        velocity[1] *= self.elasticity
+                    else: # X pixel is taken, so try Y...
+                        if not self.get_pixel(position[0], newy):
                             # (oldx, newy) is free, take it...
                             # but cancel X motion, bounce X velocity
-                            newx = grain.position[0]
-                            grain.velocity[0] *= self.elasticity
-                        else: # Y pixel is taken, so try X...
-                            if not self.get_pixel(newx, grain.position[1]):
-                                # (newx, oldy) is free, take it, but...
-                                # but cancel Y motion, bounce Y velocity
-                                newy = grain.position[1]
-                                grain.velocity[1] *= self.elasticity
-                            else: # Both spots are occupied
-                                # Cancel X & Y motion, bounce X & Y velocity
-                                newx = grain.position[0]
-                                newy = grain.position[1]
-                                grain.velocity[0] *= self.elasticity
-                                grain.velocity[1] *= self.elasticity
-
-            # Clear old spot, update grain position, set new spot
-            self.clear_pixel(grain.position[0], grain.position[1])
-            grain.position[0] = newx
-            grain.position[1] = newy
-            self.set_pixel(newx, newy)
+                            newx = position[0]
+                            velocity[0] *= self.elasticity
+                        else: # Both spots are occupied
+                            # Cancel X & Y motion, bounce X & Y velocity
+                            newx = position[0]
+                            newy = position[1]
+                            velocity[0] *= self.elasticity
+                            velocity[1] *= self.elasticity
+                else: # Y axis is faster, start there
+                    if not self.get_pixel(position[0], newy):
+                        # (oldx, newy) is free, take it...
+                        # but cancel X motion, bounce X velocity
+                        newx = position[0]
+                        velocity[0] *= self.elasticity
+                    else: # Y pixel is taken, so try X...
+                        if not self.get_pixel(newx, position[1]):
+                            # (newx, oldy) is free, take it, but...
+                            # but cancel Y motion, bounce Y velocity
+                            newy = position[1]
+                            velocity[1] *= self.elasticity
+                        else: # Both spots are occupied
+                            # Cancel X & Y motion, bounce X & Y velocity
+                            newx = position[0]
+                            newy = position[1]
+                            velocity[0] *= self.elasticity
+                            velocity[1] *= self.elasticity
+
+        # Clear old spot, update grain position, set new spot
+        self.clear_pixel(position[0], position[1])
+        position[0] = newx
+        position[1] = newy
+        self.set_pixel(newx, newy)
+
+class NumpyPixelDust(PixelDust):
+    """PixelDust with grains stored as a structure of arrays rather than a
+       list of Grain objects: X and Y position and velocity are each a
+       float32 NumPy array indexed by grain number, and the pixel grid is
+       a flat uint8 array. Each grain also has a uint8 color index (for
+       the application to map through a palette; it doesn't affect the
+       simulation) and material (index into MATERIALS, setting its
+       elasticity and noise). Acceleration, noise and the terminal
+       velocity limit are applied to all grains at once with array
+       operations.
+
+       Collisions are resolved in rounds, all pending grains at once (see
+       move()), rather than one grain at a time. Results are deterministic
+       for given velocities, with the same bounce and skid-along-one-axis
+       behavior as PixelDust, but not identical to it: PixelDust's grains
+       see whichever neighbors happened to move before them in list
+       order, while here a grain following a moving one waits to see if
+       it gets out of the way (up to max_wait rounds)."""
+
+    # Each grain moving to a new pixel tries these outcomes in turn, by
+    # kind of move (left/right, up/down, diagonal faster in X, diagonal
+    # faster in Y): 0 = new X & Y, 1 = new X only (bounce Y), 2 = new Y
+    # only (bounce X), 3 = stay put (bounce both). The last one stays in
+    # the grain's own pixel, so always succeeds.
+    OUTCOMES = ((0, 2, 2, 2), (0, 1, 1, 1), (0, 1, 2, 3), (0, 2, 1, 3))
+
+    def __init__(self, width, height, elasticity, seed=None):
+        self.position_x = np.zeros(0, dtype=np.float32)
+        self.position_y = np.zeros(0, dtype=np.float32)
+        self.velocity_x = np.zeros(0, dtype=np.float32)
+        self.velocity_y = np.zeros(0, dtype=np.float32)
+        self.color = np.zeros(0, dtype=np.uint8)
+        self.material = np.zeros(0, dtype=np.uint8)
+        self.bounce = np.zeros(0, dtype=np.float32)  # Elasticity, by grain
+        self.jitter = np.zeros(0, dtype=np.float32)  # Noise scale, by grain
+        self.max_wait = 4   # Rounds a grain may wait on another to move
+        self.owner = None   # Scratch pixel -> grain array for resolve()
+        self.outcomes = np.array(self.OUTCOMES, dtype=np.int8)
+        super(NumpyPixelDust, self).__init__(width, height, elasticity, seed)
+        self.random = np.random.default_rng(seed)
+        # Per-material elasticity (inverted, as self.elasticity) and noise
+        self.material_bounce = np.array(
+            [self.elasticity if bounce is None else -bounce
+             for _, bounce, _ in MATERIALS], dtype=np.float32)
+        self.material_jitter = np.array(
+            [jitter for _, _, jitter in MATERIALS], dtype=np.float32)
+
+    def clear(self):
+        self.bitmap = np.zeros(self.width * self.height, dtype=np.uint8)
+
+    def set_grains(self, coord_x, coord_y):
+        """Replace all grains with ones at the given coordinates (two
+           sequences), velocities 0, color 0, material sand. Doesn't touch
+           the pixel grid."""
+        self.position_x = np.array(coord_x, dtype=np.float32)
+        self.position_y = np.array(coord_y, dtype=np.float32)
+        self.num_grains = len(self.position_x)
+        self.velocity_x = np.zeros(self.num_grains, dtype=np.float32)
+        self.velocity_y = np.zeros(self.num_grains, dtype=np.float32)
+        self.color = np.zeros(self.num_grains, dtype=np.uint8)
+        self.set_materials(SAND)
+
+    def set_position(self, coord_x, coord_y):
+        # Appending copies the arrays; use randomize() for many grains
+        index = coord_y * self.width + coord_x
+        if self.bitmap[index]:
+            return False # Position already occupied
+        self.position_x = np.append(self.position_x, np.float32(coord_x))
+        self.position_y = np.append(self.position_y, np.float32(coord_y))
+        self.velocity_x = np.append(self.velocity_x, np.float32(0))
+        self.velocity_y = np.append(self.velocity_y, np.float32(0))
+        self.color = np.append(self.color, np.uint8(0))
+        self.material = np.append(self.material, np.uint8(SAND))
+        self.bounce = np.append(self.bounce, self.material_bounce[SAND])
+        self.jitter = np.append(self.jitter, self.material_jitter[SAND])
+        self.num_grains += 1
+        self.bitmap[index] = 1
+        return True
+
+    def set_colors(self, color):
+        """Set grain color indices: one value for all grains, or one per
+           grain (a sequence of num_grains values, 0-255)."""
+        self.color = np.broadcast_to(
+            np.asarray(color, dtype=np.uint8), (self.num_grains,)).copy()
+
+    def set_materials(self, material):
+        """Set grain materials (SAND, WATER, ...; see MATERIALS): one value
+           for all grains, or one per grain."""
+        self.material = np.broadcast_to(
+            np.asarray(material, dtype=np.uint8), (self.num_grains,)).copy()
+        self.bounce = self.material_bounce[self.material]
+        self.jitter = self.material_jitter[self.material]
+
+    def get_position(self, i):
+        return float(self.position_x[i]), float(self.position_y[i])
+
+    def get_positions(self):
+        """Get positions of all sand grains as two float32 NumPy arrays,
+           X and Y (don't modify these; they're the simulation state)."""
+        return self.position_x, self.position_y
+
+    def set_obstacles(self, mask):
+        self.bitmap |= np.frombuffer(
+            mask_bytes(mask, self.width, self.height), dtype=np.uint8)
+
+    def randomize(self, num_grains):
+        free = np.flatnonzero(self.bitmap == 0)
+        cells = self.random.choice(free, min(num_grains, free.size),
+                                   replace=False)
+        self.bitmap[cells] = 1
+        self.set_grains(cells % self.width, cells // self.width)
+
+    def accelerate(self, accel, noise, grains=None):
+        """As PixelDust.accelerate(), for all grains or only those whose
+           (ascending) indices are in the array 'grains'."""
+        select = slice(None) if grains is None else grains
+        velocity_x = self.velocity_x[select]  # View, or copy if 'grains'
+        velocity_y = self.velocity_y[select]
+        count = velocity_x.size
+        jitter = self.jitter[select] * np.float32(noise)  # Noise, by grain
+        velocity_x += accel[0] + jitter * self.random.uniform(
+            -1.0, 1.0, count).astype(np.float32)
+        velocity_y += accel[1] + jitter * self.random.uniform(
+            -1.0, 1.0, count).astype(np.float32)
+        # Scale down velocity vectors longer than 1.0, keeping heading
+        speed = np.sqrt(velocity_x * velocity_x + velocity_y * velocity_y)
+        np.maximum(speed, 1.0, out=speed)
+        velocity_x /= speed
+        velocity_y /= speed
+        if grains is not None:
+            self.velocity_x[grains] = velocity_x
+            self.velocity_y[grains] = velocity_y
+
+    def iterate_band(self, accel, noise, start, stop, axis):
+        """Run one iteration for just the grains in a band of the grid:
+           those with X (axis 0) or Y (axis 1) in range start to stop - 1.
+           accel and noise are as from forces(). Grains whose move would
+           leave the band are accelerated but not moved; returns an int8
+           array of which way each grain in the band is leaving (-1 below
+           start, 1 to stop or beyond, else 0), then the band's grains'
+           indices. Other bands can be iterated at the same time, as
+           nothing outside the band is read or changed."""
+        position = (self.position_x, self.position_y)[axis]
+        grains = np.flatnonzero((position >= start) & (position < stop))
+        self.accelerate(accel, noise, grains)
+        new = position[grains] + (self.velocity_x,
+                                  self.velocity_y)[axis][grains]
+        np.clip(new, 0, (self.width, self.height)[axis] - 0.001, out=new)
+        leaving = (new >= stop).astype(np.int8) - (new < start)
+        self.move(grains[leaving == 0])
+        return leaving, grains
+
+    # pylint: disable=too-many-locals
+    def move(self, grains=None):
+        """Update grain positions from their velocities: all grains, or
+           only those whose (ascending) indices are in the array 'grains',
+           others staying put. Grains that stay within their pixel just
+           move. The rest are resolved in rounds: each pending grain tries
+           its current outcome's pixel (see OUTCOMES); if that's free, the
+           lowest-numbered grain wanting it takes it. If it's occupied by
+           a grain that's still pending (which may move away), the grain
+           waits, else it falls back to its next outcome."""
+        width = self.width
+        select = slice(None) if grains is None else grains
+        bounce = self.bounce[select]
+        position_x = self.position_x[select]  # Views, or copies if 'grains'
+        position_y = self.position_y[select]
+        velocity_x = self.velocity_x[select]
+        velocity_y = self.velocity_y[select]
+
+        # New positions, kept inside the grid, bouncing off the walls
+        new_x = position_x + velocity_x
+        new_y = position_y + velocity_y
+        for new, velocity, size in ((new_x, velocity_x, width),
+                                    (new_y, velocity_y, self.height)):
+            outside = (new < 0) | (new >= size)
+            velocity[outside] *= bounce[outside]
+            np.clip(new, 0, size - 0.001, out=new)
+
+        old_col = position_x.astype(np.int32)
+        old_row = position_y.astype(np.int32)
+        new_col = new_x.astype(np.int32)
+        new_row = new_y.astype(np.int32)
+        old_index = old_row * width + old_col
+        new_index = new_row * width + new_col
+        movers = np.flatnonzero(new_index != old_index)
+        old_x = position_x[movers]
+        old_y = position_y[movers]
+        position_x[:] = new_x
+        position_y[:] = new_y
+        if movers.size:
+            keep_x, keep_y = self.resolve(
+                movers, old_index, new_index, old_row * width + new_col,
+                new_row * width + old_col, velocity_x, velocity_y, bounce)
+            position_x[movers[keep_x]] = old_x[keep_x]
+            position_y[movers[keep_y]] = old_y[keep_y]
+        if grains is not None:
+            self.position_x[grains] = position_x
+            self.position_y[grains] = position_y
+            self.velocity_x[grains] = velocity_x
+            self.velocity_y[grains] = velocity_y
+
+    # pylint: disable=too-many-arguments
+    def resolve(self, movers, old_index, new_index, skid_x, skid_y,
+                velocity_x, velocity_y, bounce):
+        """Collision rounds for move(), updating the pixel grid. 'movers'
+           indexes the grains (of those being moved) entering a new pixel.
+           old_index, new_index, skid_x and skid_y give each moving
+           grain's old pixel, new pixel, and the pixels with just its new
+           X or just its new Y. Velocities along cancelled axes are
+           bounced in place. Returns two boolean arrays, by mover: whether
+           its X and its Y motion were cancelled."""
+        width = self.width
+
+        # Pixel index of each mover's outcomes, in the order it tries them
+        delta = np.abs(new_index[movers] - old_index[movers])
+        kind = np.where(
+            delta == 1, 0, np.where(
+                delta == width, 1, np.where(
+                    np.abs(velocity_x[movers]) >= np.abs(velocity_y[movers]),
+                    2, 3)))
+        tries = self.outcomes[kind]
+        pixels = np.stack((new_index[movers], skid_x[movers],
+                           skid_y[movers], old_index[movers]), 1)
+        tries_pixel = np.take_along_axis(pixels, tries.astype(np.intp), 1)
+
+        bitmap = self.bitmap
+        # Grain in each pixel (-1 if none), only of those being moved.
+        # Kept between calls, all -1, as filling a new one for the whole
+        # grid would cost more than resolving a few grains.
+        owner = self.owner
+        if owner is None or owner.size != bitmap.size:
+            owner = self.owner = np.full(bitmap.size, -1, dtype=np.int32)
+        owner[old_index] = np.arange(old_index.size, dtype=np.int32)
+        is_pending = np.zeros(old_index.size, dtype=bool)
+        is_pending[movers] = True
+        pending = np.arange(movers.size)    # Into movers, grain order
+        attempt = np.zeros(movers.size, dtype=np.intp)
+        outcome = np.zeros(movers.size, dtype=np.int8)
+        rounds = 0
+        while pending.size:
+            grain = movers[pending]
+            pixel = tries_pixel[pending, attempt[pending]]
+            done = owner[pixel] == grain  # Staying put
+            free = np.flatnonzero(bitmap[pixel] == 0)
+            # np.unique finds the first, i.e. lowest-numbered, grain
+            # wanting each free pixel
+            _, first = np.unique(pixel[free], return_index=True)
+            winners = free[first]
+            done[winners] = True
+            vacated = old_index[grain[winners]]
+            bitmap[vacated] = 0
+            owner[vacated] = -1
+            bitmap[pixel[winners]] = 1
+            owner[pixel[winners]] = grain[winners]
+            outcome[pending[done]] = tries[pending[done],
+                                          attempt[pending[done]]]
+            is_pending[grain[done]] = False
+
+            # Blocked grains wait on pending occupants for a while, else
+            # fall back to their next outcome
+            blocked = np.flatnonzero(~done & (bitmap[pixel] != 0))
+            if rounds < self.max_wait:
+                occupant = owner[pixel[blocked]]
+                blocked = blocked[(occupant < 0) | ~is_pending[occupant]]
+                if not blocked.size and not winners.size:
+                    rounds = self.max_wait  # All waiting on each other
+            attempt[pending[blocked]] += 1
+            pending = pending[~done]
+            rounds += 1
+        owner[old_index] = -1  # Every pixel set above was one of these
+        owner[tries_pixel] = -1
+
+        # Cancelled motion along an axis bounces
+        keep_x = (outcome == 2) | (outcome == 3)
+        keep_y = (outcome == 1) | (outcome == 3)
+        velocity_x[movers[keep_x]] *= bounce[movers[keep_x]]
+        velocity_y[movers[keep_y]] *= bounce[movers[keep_y]]
+        return keep_x, keep_y
+
+class FixedTimestep(object):
+    """Advances a PixelDust simulation a fixed number of iterations per
+       second of real time, so grains move at the same speed whatever
+       the frame rate (which varies with the Pi model, panel size and
+       sensor reads). Each call to advance() runs however many whole
+       iterations are due since the last, carrying any fraction over;
+       that's several per frame if frames are slower than 'hz', or none
+       if faster. To keep a slow frame from causing more iterations,
+       making the next frame slower still, at most max_steps are run
+       per call and any further backlog is discarded (counted in
+       'dropped'): the simulation then runs slow rather than falling
+       ever further behind."""
+
+    def __init__(self, dust, hz=60.0, max_steps=4, clock=time.monotonic):
+        self.dust = dust
+        self.period = 1.0 / hz    # Simulated seconds per iteration
+        self.max_steps = max_steps
+        self.clock = clock        # Function returning time in seconds
+        self.last = None          # Time of last advance()
+        self.lag = 0.0            # Time due but not yet simulated
+        self.steps = 0            # Iterations run
+        self.dropped = 0          # Iterations skipped as too far behind
+
+    def advance(self, accel):
+        """Run iterations due since the last call with acceleration
+           'accel' (as PixelDust.iterate()). Returns number run. The first
+           call runs one iteration, so there's motion from the start."""
+        now = self.clock()
+        if self.last is None:
+            self.lag = self.period
+        else:
+            self.lag += now - self.last
+        self.last = now
+        steps = int(self.lag / self.period)
+        self.lag -= steps * self.period
+        if steps > self.max_steps:
+            self.dropped += steps - self.max_steps
+            steps = self.max_steps
+        for _ in range(steps):
+            self.dust.iterate(accel)
+        self.steps += steps
+        return steps
+
+# Commands from ParallelPixelDust to its workers (first element of the
+# shared control array)
+STEP, ATTACH, STOP = range(3)
+
+# pylint: disable=too-many-arguments, too-many-locals
+def band_worker(connection, control, go, done, sync, seed, bands, edges):
+    """Worker process body for ParallelPixelDust: iterates the listed
+       bands in turn on each STEP command, on a NumpyPixelDust whose
+       arrays are in shared memory, then moves grains crossing from each
+       of those bands into the next. Commands and the step's forces are
+       in 'control' (a shared array of command, accel X and Y, noise), set
+       before the parent releases this worker's 'go' semaphore; the worker
+       releases 'done' (shared by all workers) when finished. 'sync' is a
+       barrier among the workers, between moving bands and crossings, or
+       None if there's just one. Each band has
+       its own random number generator, from 'seed' and the band number,
+       so results don't depend on which worker runs which band."""
+    generators = {band: np.random.default_rng(
+        None if seed is None else (seed, band)) for band in bands}
+    control = np.frombuffer(control, dtype=np.float64)
+    memory = None
+    dust = None
+    while True:
+        go.acquire()
+        # As Python floats, so float32 arrays stay float32 (see NEP 50)
+        command, accel_x, accel_y, noise = control.tolist()
+        if command == STEP:
+            accel = (accel_x, accel_y)
+            for band in bands:
+                dust.random = generators[band]
+                leaving, grains = dust.iterate_band(
+                    accel, noise, edges[band], edges[band + 1], dust.axis)
+                # Edge each leaving grain crosses (its index in 'edges';
+                # 0, the grid's edge, for none)
+                dust.crossing[grains] = np.where(
+                    leaving != 0, band + (leaving > 0), 0)
+            if sync is not None:
+                sync.wait()  # Crossings only touch bands now all moved
+            # Grains move at most a pixel, so crossing the edge above
+            # each band touches just the pixels either side of it, which
+            # no other edge's crossings do as bands are 2+ pixels wide
+            for band in bands:
+                if band + 2 < len(edges):
+                    crossing = np.flatnonzero(dust.crossing == band + 1)
+                    if crossing.size:
+                        dust.move(crossing)
+        elif command == ATTACH:
+            name, width, height, count, axis = connection.recv()
+            dust = None  # Drop views into old block before closing it
+            if memory is not None:
+                memory.close()
+            memory = shared_memory.SharedMemory(name=name)
+            dust = NumpyPixelDust(width, height, 0.0)
+            for key, view in ParallelPixelDust.shared_views(
+                    memory.buf, count, width, height).items():
+                setattr(dust, key, view)
+            dust.num_grains = count
+            dust.axis = axis
+        else:  # STOP
+            break
+        done.release()
+    dust = None
+    if memory is not None:
+        memory.close()
+
+class ParallelPixelDust(NumpyPixelDust):
+    """NumpyPixelDust using several CPU cores, for long chains of panels.
+       The grid's longer side is split into 'bands' equal bands (columns
+       of the grid if it's wider than tall, else rows) at least two pixels
+       wide, shared among 'workers' processes (default one per band, up
+       to the number of CPUs). Grain, velocity and pixel grid arrays live
+       in shared memory. Each iteration, every worker accelerates and
+       moves the grains within its bands, which touch no pixels outside
+       them, so bands proceed at once without locking. Grains whose moves
+       would cross into another band are left for a second pass, again
+       in the workers, each moving the grains crossing the edges above
+       its bands. Workers are started and stopped through barriers and a
+       small shared array rather than messages, as an iteration may take
+       only a millisecond or so.
+
+       Results are deterministic for a given seed and number of bands,
+       whatever the number of workers, but differ from NumpyPixelDust's
+       (grains are moved in a different order). close() stops the
+       workers.
+
+       Not in ENGINES: with the work this simulation does per grain,
+       it hasn't yet been shown to outrun NumpyPixelDust; compare them
+       with 'benchmark.py dust -e numpy -e parallel -j1 -j2 -j4'."""
+
+    # Shared arrays, in order in the shared memory block: name, dtype
+    # and whether there's one per grain (else one per pixel)
+    SHARED = (("position_x", "float32", True), ("position_y", "float32", True),
+              ("velocity_x", "float32", True), ("velocity_y", "float32", True),
+              ("bounce", "float32", True), ("jitter", "float32", True),
+              ("bitmap", "uint8", False), ("crossing", "int16", True))
+    TIMEOUT = 10.0  # Seconds to wait on workers before giving up on them
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, width, height, elasticity, seed=None, bands=4,
+                 workers=None):
+        self.axis = 0 if width >= height else 1  # Split the longer side
+        size = (width, height)[self.axis]
+        bands = max(1, min(bands, size // 2))
+        self.edges = [size * band // bands for band in range(bands + 1)]
+        self.workers = min(workers or os.cpu_count() or 1, bands)
+        self.seed = seed
+        self.crossing = np.zeros(0, dtype=np.int16)  # See band_worker()
+        self.memory = None        # SharedMemory holding the arrays
+        self.views = None         # Name -> array in self.memory
+        self.orphans = []         # Released SharedMemory still in use
+        self.processes = []
+        self.connections = []
+        self.control = None       # Command & forces, shared with workers
+        self.go = []              # Semaphore per worker: command is set
+        self.done = None          # Semaphore: a worker has finished it
+        super(ParallelPixelDust, self).__init__(width, height, elasticity,
+                                                seed)
+
+    @classmethod
+    def shared_views(cls, buffer, count, width, height):
+        """Return dict of NumPy arrays laid out in 'buffer' (None to get
+           the size needed instead) for 'count' grains and a width x
+           height grid."""
+        views = {}
+        offset = 0
+        for name, dtype, per_grain in cls.SHARED:
+            length = count if per_grain else width * height
+            if buffer is not None:
+                views[name] = np.ndarray(length, dtype=dtype, buffer=buffer,
+                                         offset=offset)
+            offset += length * np.dtype(dtype).itemsize
+            offset += -offset % 8  # Keep the next array aligned
+        return views if buffer is not None else offset
+
+    def command(self, command, *values):
+        """Have the workers carry out a command (STEP, ATTACH or STOP),
+           with up to three values for it, returning once they have."""
+        self.control[:1 + len(values)] = (command,) + values
+        for go in self.go:
+            go.release()
+        if command != STOP:
+            for _ in self.go:
+                if not self.done.acquire(timeout=self.TIMEOUT):
+                    raise RuntimeError("ParallelPixelDust worker stopped "
+                                       "responding")
+
+    def share(self):
+        """Copy the simulation arrays into a new shared memory block and
+           use them from there, starting the worker processes if needed
+           and attaching them to it."""
+        count = self.num_grains
+        memory = shared_memory.SharedMemory(create=True, size=max(
+            1, self.shared_views(None, count, self.width, self.height)))
+        views = self.shared_views(memory.buf, count, self.width, self.height)
+        self.crossing = np.zeros(count, dtype=np.int16)
+        for name, view in views.items():
+            view[:] = getattr(self, name)
+            setattr(self, name, view)
+        self.release()
+        self.memory = memory
+        self.views = views
+
+        if not self.processes:
+            context = multiprocessing.get_context("spawn")
+            control = context.RawArray("d", 4)
+            self.control = np.frombuffer(control, dtype=np.float64)
+            self.go = [context.Semaphore(0) for _ in range(self.workers)]
+            self.done = context.Semaphore(0)
+            sync = context.Barrier(self.workers) if self.workers > 1 else None
+            for worker in range(self.workers):
+                connection, child = context.Pipe()
+                process = context.Process(target=band_worker, args=(
+                    child, control, self.go[worker], self.done, sync,
+                    self.seed, range(worker, len(self.edges) - 1,
+                                     self.workers), self.edges))
+                process.daemon = True
+                process.start()
+                self.processes.append(process)
+                self.connections.append(connection)
+        for connection in self.connections:
+            connection.send((memory.name, self.width, self.height, count,
+                             self.axis))
+        self.command(ATTACH)
+    def release(self):
+        """Free the shared memory block (if any), first copying the arrays
+           in it back to private memory."""
+        if self.memory is None:
+            return
+        for name, view in self.views.items():
+            if getattr(self, name) is view:
+                setattr(self, name, view.copy())
+        self.views = None
+        try:
+            self.memory.close()
+        except BufferError:
+            # A caller still holds a view into the block (e.g. kept
+            # position_x). It stays mapped for them until exit.
+            self.orphans.append(self.memory)
+        self.memory.unlink()
+        self.memory = None
+
+    def get_positions(self):
+        """As NumpyPixelDust.get_positions(), but copies, as the
+           simulation's arrays are in shared memory freed by close()."""
+        return self.position_x.copy(), self.position_y.copy()
+
+    def iterate(self, accel):
+        # (Re)share if any array was replaced, e.g. by randomize()
+        if self.views is None or any(getattr(self, name) is not view
+                                     for name, view in self.views.items()):
+            self.share()
+        accel, noise = self.forces(accel)
+        self.command(STEP, accel[0], accel[1], noise)
+
+    def close(self):
+        if self.processes:
+            self.command(STOP)
+        for process in self.processes:
+            process.join(self.TIMEOUT)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        self.processes = []
+        self.connections = []
+        self.release()
+
+# Available simulation engines, e.g. for a command-line option
+# (ParallelPixelDust isn't one yet; see its docstring)
+ENGINES = {"reference": PixelDust, "numpy": NumpyPixelDust}
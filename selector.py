@@ -2,55 +2,139 @@
 
 """
 Selector program for Adafruit Spectro. Cycles among various programs/scripts
-using the side button.
+using the side button. The selector sleeps between events: button presses
+arrive as edge-triggered callbacks (see buttons.py), child exits as SIGCHLD
+and first frames of new modes via a pipe, so it uses no CPU while idle.
 """
 
 # Gets code to pass both pylint & pylint3:
-# pylint: disable=bad-option-value, useless-object-inheritance, no-member
+# pylint: disable=bad-option-value, useless-object-inheritance
 
 import os
-import subprocess
+import json
 import time
+import signal
+import select
 import argparse
-try:
-    import RPi.GPIO as gpio
-except ImportError:
-    exit("This library requires the RPi.GPIO module\n"
-         "Install with: sudo pip install RPi.GPIO")
+import subprocess
+from buttons import GPIOButton, SimulatedButton
+from modehost import ModeHost
+from zygote import Zygote, ReadyPopen
 
 # List of programs to cycle through. First item is launched on startup,
 # will run for 15 seconds before automatically advancing to the next.
 # All subsequent advancements will only occur with a manual button press
-# (even when cycling back to the first program). For each item, there is
-# a program name (if ending in ".py", it will be run via the Python
-# interpreter, else standalone program) and a True/False argument
-# indicating whether the framebuffer-to-matrix utility should be run
-# concurrently with that program/script.
+# (even when cycling back to the first program). Each item is a dict
+# with a "program" name (if ending in ".py", it will be run via the Python
+# interpreter, else standalone program) plus any settings from
+# MODE_DEFAULTS below that should differ from the default for that mode.
 PROGRAMS = (
-    ("ip_address.py", False),
-    ("cpu_load.py", False),
-    ("bargraph.py", False),
-    ("arcade_clock.py", False),
-    ("life.py", False),
-    ("gifplay.py", False),
-    ("audio.py", False),
-    ("accel.py", False),
-    ("nextbus_matrix.py", False),
-    ("idle.py", True)) # Nonsense idle script to test fb2matrix.py
+    {"program": "ip_address.py", "in_process": False},
+    {"program": "cpu_load.py"},
+    {"program": "bargraph.py"},
+    {"program": "arcade_clock.py"},
+    {"program": "life.py"},
+    {"program": "gifplay.py", "in_process": False},
+    {"program": "audio.py", "in_process": False, "restart": 3,
+     "nice": -5, "cpus": (0, 1, 2), "max_rss_mb": 150},
+    {"program": "accel.py"},
+    {"program": "nextbus_matrix.py", "in_process": False, "restart": 3,
+     "max_rss_mb": 150},
+    # Nonsense idle script to test fb2matrix.py
+    {"program": "idle.py", "fb2matrix": True, "in_process": False})
+# Per-mode settings and their defaults:
+MODE_DEFAULTS = {
+    # Run the framebuffer-to-matrix utility concurrently with program
+    "fb2matrix": False,
+    # SpectroBase script may run in-process: loaded as a module into the
+    # selector, sharing one persistent matrix. Makes mode switches much
+    # quicker (no new interpreter, imports or matrix init). Only for
+    # scripts that spend their time in SpectroBase.run_frames() (or
+    # otherwise call SwapOnVSync() at least every second or so), as
+    # that's where a hosted mode stops; use False for scripts that block
+    # elsewhere (network lookups, long sleeps) or need crash isolation
+    # from the selector. The resource
+    # settings below apply to the script's thread if in-process, except
+    # max_rss_mb, which requires a subprocess.
+    "in_process": True,
+    # If the mode crashes (nonzero exit or signal), restart it up to this
+    # many times in a row before advancing to the next mode, waiting
+    # 'backoff' seconds before the first restart, doubling each time up
+    # to 'backoff_max'. A crash after running longer than 'backoff_max'
+    # starts the count over.
+    "restart": 0,
+    "backoff": 1.0,
+    "backoff_max": 30.0,
+    # Scheduling priority (-20 to 19, lower is higher priority)
+    "nice": 0,
+    # CPU cores the mode may run on, or None for any. rgbmatrix refreshes
+    # the display from a thread on the last core of multi-core Pis, e.g.
+    # (0, 1, 2) keeps rendering off that core on a Pi 3 or 4.
+    "cpus": None,
+    # Kill the mode (counts as a crash) if its resident memory exceeds
+    # this many megabytes, or None for no limit. Checked every
+    # RSS_CHECK_INTERVAL seconds, only while such a mode is running.
+    "max_rss_mb": None,
+}
+RSS_CHECK_INTERVAL = 5.0
 # Python version to use with any .py scripts in above list, in case
 # version 2 or 3 needs to be forced:
 PYTHON = "python3"
 # Name of framebuffer-to-matrix script:
 FB_TO_MATRIX = "fb2matrix.py"
 # Command-line flags passed to above program/scripts and the
-# framebuffer-to-matrix utility:
+# framebuffer-to-matrix utility (plus --led-backend, if not hardware):
 FLAGS = ["--led-cols=64", "--led-rows=32", "--led-slowdown-gpio=4"]
 # Additional commands not used here, but you might find useful:
 # FLAGS = ["--led-rgb-sequence=rbg", "--led-brightness=50"]
 
+def mode_config(index):
+    """Return settings for PROGRAMS[index], with defaults filled in."""
+    config = dict(MODE_DEFAULTS)
+    config.update(PROGRAMS[index])
+    return config
+
+def apply_limits(config, pid=0):
+    """Apply a mode's 'nice' and 'cpus' settings to the calling process
+       (used as subprocess preexec_fn) or, being Linux, calling thread
+       (used at the start of an in-process mode's thread), or to the
+       given pid (a zygote, just before it starts the mode)."""
+    if config["nice"]:
+        os.setpriority(os.PRIO_PROCESS, pid, config["nice"])
+    if config["cpus"] is not None:
+        os.sched_setaffinity(pid, config["cpus"])
+
+def resident_mb(pid):
+    """Return resident memory (RSS) of process in megabytes, or None if
+       it can't be read (e.g. process has exited)."""
+    try:
+        with open("/proc/%d/status" % pid) as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def cpu_seconds(pid):
+    """Return CPU time (user + system) used so far by process, in seconds,
+       or None if it can't be read (e.g. process has been reaped). Still
+       readable while the process is a zombie, i.e. has exited but hasn't
+       been waited for."""
+    try:
+        with open("/proc/%d/stat" % pid) as stat_file:
+            # Fields after the parenthesized command name, which may
+            # contain spaces; utime and stime are fields 14 and 15 overall
+            fields = stat_file.read().rsplit(")", 1)[1].split()
+        return ((int(fields[11]) + int(fields[12])) /
+                float(os.sysconf("SC_CLK_TCK")))
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
 class Selector(object):
     """Selector program for Spectro. Cycles among various programs/scripts
-       using the side button."""
+       using the side button, supervising each (restarts, resource limits
+       and per-mode statistics) according to its PROGRAMS settings."""
 
     def __init__(self):
         self.mode = 0
@@ -58,45 +142,258 @@ class Selector(object):
         self.timeout = 15.0  # First-program timeout (then advances modes)
         self.time_start = time.time()
         self.gpio = 25
+        self.button = None               # Button source, set up in run()
+        self.time_pressed = time.time()  # Start of most recent mode switch
+        self.switch_latencies = []       # (program, seconds) to 1st frame
+        self.stats = {}                  # Per-program accounting
+        self.cpu_used = {}               # pid: CPU seconds, current mode
+        # Anything needing the main loop's attention (button press, child
+        # exit, hosted mode's first frame) writes to this pipe to wake it.
+        self.wake_read, self.wake_write = os.pipe()
+        os.set_blocking(self.wake_read, False)
+        os.set_blocking(self.wake_write, False)
+        self.flags = list(FLAGS)         # Passed to every mode
+        self.host = None                 # In-process modes, set up in run()
+        self.zygote = None               # Pre-warmed process for next mode
+        self.zygote_mode = None          # Index in PROGRAMS of that mode
+        self.isolated = set()            # Programs that failed to stop
+                                         # in-process, now run as
+                                         # subprocesses
         self.parser = argparse.ArgumentParser()
         self.args = None
         self.parser.add_argument(
             "-g", "--gpio", action="store", help="GPIO # for mode selector "
             "button (to GND). Default: " + str(self.gpio), default=self.gpio,
             type=int)
+        self.parser.add_argument(
+            "--led-backend", action="store", help="Matrix backend passed "
+            "to every mode: hardware (RGB LED matrix) or virtual "
+            "(headless, for testing). Default: hardware", default="hardware",
+            choices=["hardware", "virtual"], type=str)
+        self.parser.add_argument(
+            "--no-zygote", action="store_true", help="Don't pre-warm a "
+            "process for the next out-of-process Python mode")
+        self.parser.add_argument(
+            "--simulate", action="store", help="No GPIO; simulate a button "
+            "press every N seconds instead (for testing)", type=float)
+        self.parser.add_argument(
+            "--stats-file", action="store", help="Write per-mode launch, "
+            "crash, uptime and CPU time statistics as JSON to this file "
+            "after each mode ends", type=str)
+
+    def wake(self):
+        """Wake the main loop (safe to call from any thread)."""
+        try:
+            os.write(self.wake_write, b"!")
+        except OSError:
+            pass  # Pipe full, so main loop has plenty to wake it
+
+    def button_pressed(self):
+        """Button callback (from button's thread): note time, wake loop."""
+        self.time_pressed = time.time()
+        self.wake()
+
+    def sleep(self, timeout, wait_on=()):
+        """Sleep until woken (see wake()), a file descriptor in wait_on is
+           readable or timeout (seconds, None = forever) elapses."""
+        select.select([self.wake_read] + list(wait_on), [], [], timeout)
+        try:
+            os.read(self.wake_read, 256)  # Drain wake-up bytes
+        except OSError:
+            pass
+
+    def prefork(self):
+        """Start a pre-warmed zygote process for the next mode in PROGRAMS
+           if it's a Python script that will run as a subprocess, so it can
+           start instantly on the next button press."""
+        next_mode = (self.mode + 1) % len(PROGRAMS)
+        config = mode_config(next_mode)
+        if (self.args.no_zygote or not config["program"].endswith(".py") or
+                self.hosted(config) or self.zygote_mode == next_mode):
+            return
+        if self.zygote is not None:
+            self.zygote.cancel()
+        self.zygote = Zygote([config["program"]] + self.flags)
+        self.zygote_mode = next_mode
 
-    def run_one(self):
-        """Monitor last-launched subprocess until either it exits,
-           the mode-change button is pressed or the subprocess timeout
-           has elapsed. Also check for extended button hold and halt
-           system if necessary."""
+    def hosted(self, config):
+        """Return True if mode with given settings should run in-process."""
+        return (config["in_process"] and not config["fb2matrix"] and
+                config["program"] not in self.isolated)
+
+    def launch(self, config):
+        """Start mode with given settings (and fb2matrix if needed)."""
+        # SpectroBase scripts flagged for it run in-process, sharing
+        # the host's matrix (falling back on a subprocess if the
+        # script can't be loaded that way):
+        if self.hosted(config):
+            try:
+                self.process.append(self.host.launch(
+                    config["program"], self.time_pressed,
+                    setup=lambda: apply_limits(config)))
+            except Exception as error:  # pylint: disable=broad-except
+                print("%s: can't run in-process (%s)" %
+                      (config["program"], error))
+        if not self.process:
+            # Subprocess needs the matrix hardware to itself
+            self.host.release()
+            # Run as Python script (from pre-warmed zygote if
+            # available) or standalone program, passing flags:
+            if self.zygote_mode == self.mode:
+                zygote = self.zygote
+                self.zygote = self.zygote_mode = None
+                try:
+                    apply_limits(config, zygote.pid)
+                except OSError:
+                    pass  # Died while warming up, start() reports it
+                if zygote.start(self.time_pressed):
+                    self.process.append(zygote)
+                else:  # Died while warming up, try a cold start instead
+                    print("%s: pre-warmed process exited (status %d), "
+                          "starting normally" %
+                          (config["program"], zygote.returncode))
+                    self.stats[config["program"]]["zygote_failures"] += 1
+            if not self.process:
+                command = [config["program"]] + self.flags
+                if config["program"].endswith(".py"):
+                    command.insert(0, PYTHON)
+                self.process.append(ReadyPopen(
+                    command, self.time_pressed,
+                    preexec_fn=lambda: apply_limits(config)))
+        # Optionally launch framebuffer-to-matrix util concurrently
+        if config["fb2matrix"]:
+            self.process.append(
+                subprocess.Popen([PYTHON, FB_TO_MATRIX] + self.flags))
+
+    def sample_cpu(self):
+        """Note CPU time used so far by current mode's subprocess(es), for
+           account(). Must be called before each is reaped (by poll(),
+           wait(), or terminate() or kill() on a Popen that has exited)."""
+        for process in self.process:
+            if process.pid is not None and process.returncode is None:
+                seconds = cpu_seconds(process.pid)
+                if seconds is not None:
+                    self.cpu_used[process.pid] = seconds
+
+    def wait_process(self, process, timeout):
+        """Wait up to timeout seconds for a Popen, Zygote or HostedMode to
+           exit. Returns True if it did. A subprocess that exits is left
+           unreaped, so sample_cpu() can still read its final CPU time."""
+        if process.pid is None:  # Hosted mode
+            return process.wait(timeout) is not None
+        end_time = time.time() + timeout
+        while process.returncode is None and not os.waitid(
+                os.P_PID, process.pid,
+                os.WEXITED | os.WNOHANG | os.WNOWAIT):
+            remaining = end_time - time.time()
+            if remaining <= 0:
+                return False
+            self.sleep(remaining)  # Woken by SIGCHLD when it exits
+        return True
+
+    def stop_processes(self, config):
+        """Terminate current mode's process(es), escalating to kill if one
+           doesn't exit promptly. Processes that already exited (signal or
+           script error) are fine. A hosted mode whose thread ignores
+           both (stuck outside its frame loop) is abandoned and its script
+           run out-of-process from then on, so the selector never hangs."""
+        for process in self.process:
+            try:
+                self.sample_cpu()
+                process.terminate()
+                if not self.wait_process(process, 2.0):
+                    self.sample_cpu()
+                    process.kill()
+                    if (not self.wait_process(process, 2.0) and
+                            process.pid is None):  # Hosted mode
+                        print("%s: didn't stop in-process, abandoning it; "
+                              "will run it as a subprocess" %
+                              config["program"])
+                        self.host.abandon(process)
+                        self.isolated.add(config["program"])
+                self.sample_cpu()
+                process.poll()  # Reap it
+            except OSError:
+                pass  # Process already exited (signal or error)
+            if hasattr(process, "close_ready"):
+                process.close_ready()
+
+    def run_one(self, config):
+        """Sleep until the last-launched mode crashes (or exceeds its memory
+           limit), the mode-change button is pressed or the first-program
+           timeout has elapsed, recording the new mode's switch latency when
+           its first frame appears. Then stop the mode, and check for
+           extended button hold and halt system if necessary. Returns the
+           reason: "crash", "button" or "timeout"."""
+        reported = False
+        pid = self.process[0].pid
+        check_rss = config["max_rss_mb"] is not None and pid is not None
         while True:
-            self.process[0].poll() # Sets returncode if process exited
-            if(self.process[0].returncode or  # Signal or script error OR
-               gpio.input(self.gpio) == 0 or  # Button press OR
-               (self.timeout > 0 and          # Timeout
-                time.time() - self.time_start > self.timeout)):
-                time_pressed = time.time()
-                # Try killing process(es), assuming it hasn't choked
-                # on its own due to a signal or Python script error.
-                for process in self.process:
-                    try:
-                        process.terminate()
-                        process.wait()
-                        # process.wait() seems a little flaky about
-                        # this, hence the extra while and sleep:
-                        while process.returncode is None:
-                            time.sleep(0.25)
-                    except OSError:
-                        pass  # Process already exited (signal or error)
-                time.sleep(0.1) # Extra button debounce a little
-                while gpio.input(self.gpio) == 0: # Wait for button release
-                    if time.time() - time_pressed >= 3: # Held a few sec?
-                        os.system("shutdown -h now")    # Halt system
-                        while True:                     # Wait for it
-                            pass
+            if not reported and hasattr(self.process[0], "switch_latency"):
+                latency = self.process[0].switch_latency()
+                if latency is not None:
+                    self.switch_latencies.append((config["program"], latency))
+                    self.stats[config["program"]][
+                        "switch_latency_ms"] = latency * 1000.0
+                    print("%s: switch latency %d ms" %
+                          (config["program"], latency * 1000))
+                    reported = True
+            self.sample_cpu()                   # Before poll() reaps it
+            if self.process[0].poll():          # Signal or script error
+                reason = "crash"
+                break
+            if self.button.pressed.is_set():    # Button press
+                reason = "button"
                 break
-            time.sleep(0.1)
+            if check_rss:
+                rss = resident_mb(pid)
+                if rss is not None and rss > config["max_rss_mb"]:
+                    print("%s: %d MB resident exceeds %d MB limit" %
+                          (config["program"], rss, config["max_rss_mb"]))
+                    self.stats[config["program"]]["rss_kills"] += 1
+                    reason = "crash"
+                    break
+            timeout = RSS_CHECK_INTERVAL if check_rss else None
+            if self.timeout > 0:
+                remaining = self.timeout - (time.time() - self.time_start)
+                if remaining <= 0:               # First-program timeout
+                    reason = "timeout"
+                    break
+                timeout = min(timeout or remaining, remaining)
+            # Sleep until woken by something (or timeout)
+            ready_fd = getattr(self.process[0], "ready_fd", None)
+            self.sleep(timeout, [ready_fd]
+                       if not reported and ready_fd is not None else [])
+        if reason != "button":
+            self.time_pressed = time.time()
+
+        # Try killing process(es), assuming it hasn't choked
+        # on its own due to a signal or Python script error.
+        self.stop_processes(config)
+        if (self.button.is_pressed() and not self.button.wait_for_release(
+                max(0.0, 3.0 - (time.time() - self.time_pressed)))):
+            os.system("shutdown -h now")  # Held a few sec? Halt system
+            while True:                   # Wait for it
+                time.sleep(1)
+        self.button.pressed.clear()
+        return reason
+
+    def account(self, config, start_time, reason):
+        """Update per-mode statistics after a mode ends, and write them to
+           the --stats-file if given."""
+        stats = self.stats[config["program"]]
+        stats["uptime"] += time.time() - start_time
+        if self.process and hasattr(self.process[0], "cpu_time"):
+            stats["cpu"] += self.process[0].cpu_time  # In-process, lower bound
+        else:
+            stats["cpu"] += sum(self.cpu_used.values())  # Subprocess(es)
+        if reason == "crash":
+            stats["crashes"] += 1
+        if self.args.stats_file:
+            temp_path = self.args.stats_file + ".tmp"
+            with open(temp_path, "w") as stats_file:
+                json.dump(self.stats, stats_file, indent=1, sort_keys=True)
+            os.rename(temp_path, self.args.stats_file)
 
     def run(self):
         """Main loop of Selector program."""
@@ -105,34 +402,71 @@ class Selector(object):
         self.args = self.parser.parse_args()
         if self.args.gpio is not None:
             self.gpio = self.args.gpio
+        if self.args.led_backend != "hardware":
+            self.flags.append("--led-backend=" + self.args.led_backend)
+        self.host = ModeHost(self.flags, notify=self.wake)
+
+        # Button init
+        if self.args.simulate:
+            self.button = SimulatedButton(self.args.simulate)
+        else:
+            try:
+                self.button = GPIOButton(self.gpio)
+            except ImportError:
+                exit("This library requires the RPi.GPIO module\n"
+                     "Install with: sudo pip install RPi.GPIO")
+        self.button.callback = self.button_pressed
 
-        # GPIO init
-        gpio.setwarnings(False)
-        gpio.setmode(gpio.BCM)
-        gpio.setup(self.gpio, gpio.IN, pull_up_down=gpio.PUD_UP)
+        # Child process exits (SIGCHLD) wake the main loop, too
+        signal.set_wakeup_fd(self.wake_write)
+        signal.signal(signal.SIGCHLD, lambda signum, frame: None)
 
+        for index in range(len(PROGRAMS)):
+            self.stats[mode_config(index)["program"]] = {
+                "launches": 0, "crashes": 0, "restarts": 0, "rss_kills": 0,
+                "zygote_failures": 0,
+                "uptime": 0.0, "cpu": 0.0, "switch_latency_ms": None}
+
+        restarts = 0  # Consecutive restarts of current mode after crashes
         while True:  # Cycle between programs indefinitely
 
-            # Launch new process (from PROGRAMS list, based on self.mode).
-            # Run as Python script or standalone program, passing FLAGS:
-            if PROGRAMS[self.mode][0].endswith(".py"):
-                self.process.append(
-                    subprocess.Popen([PYTHON, PROGRAMS[self.mode][0]] + FLAGS))
-            else:
-                self.process.append(
-                    subprocess.Popen([PROGRAMS[self.mode][0]] + FLAGS))
-            # Optionally launch framebuffer-to-matrix util concurrently
-            if PROGRAMS[self.mode][1] is True:
-                self.process.append(
-                    subprocess.Popen([PYTHON, FB_TO_MATRIX] + FLAGS))
-
-            self.run_one()  # Until button press, timeout, etc.
+            # Launch new process (from PROGRAMS list, based on self.mode)
+            config = mode_config(self.mode)
+            self.stats[config["program"]]["launches"] += 1
+            start_time = time.time()
+            self.cpu_used = {}
+            self.launch(config)
+
+            self.prefork()   # Warm up next mode while this one runs
+            reason = self.run_one(config)  # Until button press, etc.
+            self.account(config, start_time, reason)
+            self.process = []
+
+            if time.time() - start_time > config["backoff_max"]:
+                restarts = 0  # Ran stably before crashing, fresh budget
+            if reason == "crash" and restarts < config["restart"]:
+                # Restart crashed mode after a delay (unless button
+                # is pressed in the meantime, then just advance)
+                delay = min(config["backoff"] * 2 ** restarts,
+                            config["backoff_max"])
+                restarts += 1
+                self.stats[config["program"]]["restarts"] += 1
+                print("%s: restart %d of %d in %g s" %
+                      (config["program"], restarts, config["restart"], delay))
+                end_time = time.time() + delay
+                while (not self.button.pressed.is_set() and
+                       time.time() < end_time):
+                    self.sleep(max(0.0, end_time - time.time()))
+                if not self.button.pressed.is_set():
+                    self.time_pressed = time.time()
+                    continue
+                self.button.pressed.clear()
+            restarts = 0
 
             self.mode += 1                 # Advance to next mode
             if self.mode >= len(PROGRAMS): # Wrap around to start
                 self.mode = 0
             self.timeout = -1  # Only do timeout case once, at startup
-            self.process = []
 
 if __name__ == "__main__":
     SELECTOR = Selector()
@@ -10,13 +10,109 @@ reformatted to appease pylint/pylint3.
 """
 
 # Gets code to pass both pylint & pylint3:
-# pylint: disable=bad-option-value, useless-object-inheritance, superfluous-parens, no-self-use, unused-argument
+# pylint: disable=bad-option-value, useless-object-inheritance, superfluous-parens, no-self-use, unused-argument, invalid-name
 
+import os
 import sys
+import time
 import signal
+import inspect
 import argparse
-from rgbmatrix import RGBMatrix, RGBMatrixOptions
-from PIL import Image, ImageDraw
+import importlib.util
+from PIL import Image
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from rgbmatrix import RGBMatrix, RGBMatrixOptions
+except ImportError:
+    # Only needed for the 'hardware' backend; the 'virtual' backend
+    # lets scripts run (and be benchmarked) without the Pi library.
+    RGBMatrix = RGBMatrixOptions = None
+
+def load_script_class(script):
+    """Import a Spectro script by filename as a module (its __main__ block
+       is NOT run) and return the SpectroBase subclass it defines. Used by
+       tools that run scripts without starting a new interpreter."""
+    name = os.path.splitext(os.path.basename(script))[0]
+    spec = importlib.util.spec_from_file_location(name, script)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    for _, cls in inspect.getmembers(module, inspect.isclass):
+        if issubclass(cls, SpectroBase) and cls.__module__ == name:
+            return cls
+    raise ValueError("No SpectroBase subclass found in " + script)
+
+class FrameScheduler(object):
+    """Deadline-based frame pacing for SpectroBase.run_frames(). Rather than
+       sleeping a fixed interval after each frame (which drifts by however
+       long the frame took to draw), wait() sleeps until the next multiple
+       of the frame period. If a frame overruns by one or more whole
+       periods, those deadlines are counted in 'dropped' and skipped rather
+       than rushed through to catch up. fps of 0 means free-running,
+       except that skipped frames (see skip()) wait 'poll' seconds."""
+
+    def __init__(self, fps, poll=0.01):
+        self.period = 1.0 / fps if fps > 0 else 0.0
+        self.poll = poll      # Free-running wait after a skipped frame
+        self.deadline = None  # Start time of next frame (time.monotonic())
+        self.frames = 0       # Frames rendered and shown
+        self.skipped = 0      # Frame slots skipped as nothing changed
+        self.dropped = 0      # Deadlines missed because a frame overran
+
+    def wait(self):
+        """Sleep until it's time to start the next frame."""
+        if self.period <= 0.0:
+            return
+        now = time.monotonic()
+        if self.deadline is None:  # First frame starts immediately
+            self.deadline = now + self.period
+            return
+        delay = self.deadline - now
+        if delay > 0.0:
+            time.sleep(delay)
+            self.deadline += self.period
+        else:
+            missed = int(-delay / self.period)
+            self.dropped += missed
+            self.deadline += (missed + 1) * self.period
+
+    def skip(self):
+        """Count a frame slot in which nothing needed drawing. When
+           free-running, also wait a little, so an on-change script
+           polls for changes rather than spinning at 100% CPU."""
+        self.skipped += 1
+        if self.period <= 0.0:
+            time.sleep(self.poll)
+
+class FirstFrameNotifier(object):
+    """Wraps a matrix until the first SwapOnVSync(), then writes one byte
+       to a file descriptor (named by environment variable SPECTRO_READY_FD,
+       set by selector.py/zygote.py) so a parent process can measure the
+       time to first frame, and unwraps itself from the SpectroBase object."""
+
+    def __init__(self, app, matrix, ready_fd):
+        self.app = app
+        self.matrix = matrix
+        self.ready_fd = ready_fd
+
+    def SwapOnVSync(self, *args, **kwargs):
+        """Matrix SwapOnVSync(), notifying parent after the first one."""
+        result = self.matrix.SwapOnVSync(*args, **kwargs)
+        if self.ready_fd is not None:
+            try:
+                os.write(self.ready_fd, b"f")
+                os.close(self.ready_fd)
+            except OSError:
+                pass  # Parent isn't listening, no problem
+            self.ready_fd = None
+            self.app.matrix = self.matrix
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.matrix, name)
 
 class SpectroBase(object):
     """A base class for Adafruit Spectro projects, adapted from the
@@ -25,6 +121,11 @@ class SpectroBase(object):
         self.parser = argparse.ArgumentParser()
         self.args = None
         self.matrix = None
+        self.fps = 0              # Default --fps for run_frames(), 0 = max
+        self.on_change = False    # Default --on-change for run_frames()
+        self.scheduler = None     # FrameScheduler while run_frames() active
+        self.stats = None         # FrameStats if --led-stats* options used
+        self.running = True       # run_frames() returns if set False
 
         self.parser.add_argument(
             "-r", "--led-rows", action="store", help="Display rows. "
@@ -81,9 +182,78 @@ class SpectroBase(object):
             "0=direct; 1=strip; 2=checker; 3=spiral; 4=ZStripe; "
             "5=ZnMirrorZStripe; 6=coreman; 7=Kaler2Scan; 8=ZStripeUneven "
             "(Default: 0)", default=0, type=int)
+        self.parser.add_argument(
+            "--led-backend", action="store", help="Matrix backend: "
+            "hardware (RGB LED matrix) or virtual (headless, NumPy). "
+            "Default: hardware", default="hardware",
+            choices=['hardware', 'virtual'], type=str)
+        self.parser.add_argument(
+            "--fps", action="store", help="Target frame rate for scripts "
+            "using the SpectroBase frame scheduler. 0 = as fast as "
+            "possible. Default: depends on script", default=None, type=float)
+        self.parser.add_argument(
+            "--on-change", action="store_true", help="Only redraw when "
+            "the script reports the display has changed (scripts using "
+            "the SpectroBase frame scheduler)")
+        self.parser.add_argument(
+            "--led-stats", action="store", help="Log frame timing "
+            "breakdown (render/upload/vsync) to stderr every N seconds",
+            default=0.0, type=float)
+        self.parser.add_argument(
+            "--led-stats-file", action="store", help="Periodically write "
+            "frame timing statistics as JSON to this file", type=str)
+        self.parser.add_argument(
+            "--led-stats-socket", action="store", help="Answer connections "
+            "on this Unix socket with frame timing statistics as JSON",
+            type=str)
 
     def run(self):
-        """Placeholder. Override this in subclass."""
+        """Override this in subclass to own the main loop. Otherwise,
+           subclasses implement render() (and optionally needs_redraw()),
+           and this calls run_frames() to call them at a steady rate.
+           A subclass run() may also do setup and then call run_frames()."""
+        self.run_frames()
+
+    def render(self, canvas):
+        """Per-frame callback for run_frames(). Override this in subclass
+           to draw one complete frame into canvas (an offscreen buffer from
+           CreateFrameCanvas()); run_frames() then swaps it to the matrix."""
+        raise NotImplementedError("Subclass must implement run() or render()")
+
+    def needs_redraw(self):
+        """Per-frame callback for run_frames() in --on-change mode. Override
+           in subclass to return False when the display would be unchanged
+           from the last frame, in which case render() is not called and no
+           swap occurs. Default is to always redraw."""
+        return True
+
+    def run_frames(self):
+        """Main loop for subclasses implementing render(). Frames are paced
+           to the --fps target (or the subclass's self.fps default) with a
+           FrameScheduler, so CPU use follows the frame rate the content
+           actually needs rather than spinning as fast as SwapOnVSync()
+           returns. In --on-change mode (or self.on_change), frames are
+           only drawn when needs_redraw() says so (checked every 10 ms
+           at --fps 0). Returns if self.running
+           is cleared (e.g. by selector.py's in-process mode host)."""
+        if self.args.fps is not None:
+            self.fps = self.args.fps
+        if self.args.on_change:
+            self.on_change = True
+        self.scheduler = FrameScheduler(self.fps)
+        if self.stats is not None:
+            self.stats.scheduler = self.scheduler
+        canvas = self.matrix.CreateFrameCanvas()
+        while self.running:
+            self.scheduler.wait()
+            if self.stats is not None:
+                self.stats.begin_frame()
+            if self.on_change and not self.needs_redraw():
+                self.scheduler.skip()
+                continue
+            self.render(canvas)
+            canvas = self.matrix.SwapOnVSync(canvas)
+            self.scheduler.frames += 1
 
     def signal_handler(self, signum, frame):
         """Signal handler calls just invokes exit() which clears matrix."""
@@ -94,6 +264,38 @@ class SpectroBase(object):
            those options before calling the subclass code."""
         self.args = self.parser.parse_args()
 
+        signal.signal(signal.SIGTERM, self.signal_handler)
+        signal.signal(signal.SIGINT, self.signal_handler)
+
+        self.matrix = self.create_matrix()
+        self.start_stats()
+        ready_fd = os.environ.pop("SPECTRO_READY_FD", None)
+        if ready_fd is not None:
+            self.matrix = FirstFrameNotifier(self, self.matrix, int(ready_fd))
+
+        try:
+            self.run()
+        except KeyboardInterrupt:
+            sys.exit(0)
+
+        return True
+
+    def create_matrix(self):
+        """Create the matrix object (a real RGBMatrix, or a VirtualMatrix
+           with --led-backend=virtual) from the parsed command-line
+           options in self.args."""
+        if self.args.led_backend == 'virtual':
+            from virtualmatrix import VirtualMatrix
+            return VirtualMatrix(
+                self.args.led_cols * self.args.led_chain,
+                self.args.led_rows * self.args.led_parallel,
+                self.args.led_brightness)
+
+        if RGBMatrix is None:
+            exit("This library requires the rgbmatrix module\n"
+                 "Install from https://github.com/hzeller/rpi-rgb-led-matrix"
+                 "\nor use --led-backend=virtual")
+
         options = RGBMatrixOptions()
 
         if self.args.led_gpio_mapping is not None:
@@ -121,37 +323,50 @@ class SpectroBase(object):
         # For some reason this isn't working from command line.
         options.drop_privileges = False
 
-        signal.signal(signal.SIGTERM, self.signal_handler)
-        signal.signal(signal.SIGINT, self.signal_handler)
-
-        self.matrix = RGBMatrix(options=options)
-
-        try:
-            self.run()
-        except KeyboardInterrupt:
-            sys.exit(0)
+        return RGBMatrix(options=options)
 
-        return True
+    def start_stats(self):
+        """If any --led-stats* option was given, wrap self.matrix so each
+           frame's time is broken down and reported (see framestats.py).
+           Otherwise the matrix is left untouched and costs nothing."""
+        if not (self.args.led_stats or self.args.led_stats_file or
+                self.args.led_stats_socket):
+            return
+        from framestats import FrameStats, InstrumentedMatrix
+        self.stats = FrameStats(
+            interval=self.args.led_stats or 10.0,
+            log=self.args.led_stats > 0,
+            path=self.args.led_stats_file,
+            socket_path=self.args.led_stats_socket)
+        self.matrix = InstrumentedMatrix(self.matrix, self.stats)
 
     def halve(self, image_in):
         """PIL's image.resize() with BILINEAR sampling doesn't quite produce
            the expected 2x2 pixel averaging when scaling an image exactly 1:2.
-           This function handles it manually, returning an image half the size
-           of the original with 2x2 averaging. Being all Python, it's not as
-           fast as PIL, so not the best for quick animation. This is
-           specifically for PIL images, NOT an RGBMatrix canvas."""
-        width = image_in.size[0] // 2
-        height = image_in.size[1] // 2
-        image_out = Image.new('RGB', (width, height))
-        draw = ImageDraw.Draw(image_out)
-        for row in range(height):
-            for col in range(width):
-                pixel_0 = image_in.getpixel((col * 2, row * 2))
-                pixel_1 = image_in.getpixel((col * 2 + 1, row * 2))
-                pixel_2 = image_in.getpixel((col * 2, row * 2 + 1))
-                pixel_3 = image_in.getpixel((col * 2 + 1, row * 2 + 1))
-                draw.point((col, row), fill=(
-                    (pixel_0[0] + pixel_1[0] + pixel_2[0] + pixel_3[0]) // 4,
-                    (pixel_0[1] + pixel_1[1] + pixel_2[1] + pixel_3[1]) // 4,
-                    (pixel_0[2] + pixel_1[2] + pixel_2[2] + pixel_3[2]) // 4))
-        return image_out
+           This function handles it, returning an image half the size of the
+           original with 2x2 averaging. Equivalent to downsample(image_in, 2).
+           This is specifically for PIL images, NOT an RGBMatrix canvas."""
+        return self.downsample(image_in, 2)
+
+    def downsample(self, image_in, factor):
+        """Box-filter downsampling of a PIL image by an integer factor:
+           each output pixel is the average of a factor x factor block of
+           input pixels (sum divided by factor squared, rounded down), so
+           supersampled drawing (e.g. text rendered at 2X) scales back down
+           precisely. Input is cropped to a multiple of factor. Uses NumPy
+           so it's quick enough for per-frame use; if NumPy is unavailable,
+           falls back on PIL's Image.reduce(), which rounds to nearest
+           rather than down. Returns an RGB image."""
+        image_in = image_in.convert('RGB')
+        if factor == 1:
+            return image_in
+        width = image_in.size[0] // factor
+        height = image_in.size[1] // factor
+        if np is None:
+            return image_in.crop(
+                (0, 0, width * factor, height * factor)).reduce(factor)
+        pixels = np.asarray(image_in)[:height * factor, :width * factor]
+        sums = pixels.reshape(height, factor, width, factor, 3).sum(
+            axis=(1, 3), dtype=np.uint32)
+        return Image.fromarray(
+            (sums // (factor * factor)).astype(np.uint8), 'RGB')
@@ -0,0 +1,224 @@
+#!/usr/bin/env python
+
+"""
+Audio spectrum analysis helpers for Adafruit Spectro (see audio.py).
+SpectrumAnalyzer turns a stream of samples (an audiosource.RingBuffer) into
+magnitude spectra at a fixed hop size, independent of the display frame
+rate, with optional windowing and averaging. LogBinner maps FFT output bins
+onto display columns along a nonlinear (roughly logarithmic) frequency
+axis. Each column is a weighted sum of several neighboring bins, and the
+weights are precomputed once into a dense banded matrix so a whole frame's
+worth of columns is one NumPy matrix-vector product. OnsetDetector finds
+beats/onsets in the resulting columns and notifies subscribers.
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, too-many-arguments
+
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+# Window functions for SpectrumAnalyzer, by name
+WINDOWS = {"rect": np.ones, "hann": np.hanning, "hamming": np.hamming,
+           "blackman": np.blackman}
+
+class SpectrumAnalyzer(object):
+    """Short-time FFT analysis of a sample stream. An analysis frame of
+       fft_size samples, multiplied by the named window function (see
+       WINDOWS), is taken every 'hop' samples (default fft_size / 2, i.e.
+       50% overlap), and the magnitude spectra of the last 'average'
+       frames are averaged. Frames are aligned to absolute sample
+       positions, so results don't depend on when or how often update()
+       is called. The window and sample buffers are allocated once."""
+
+    def __init__(self, fft_size=1024, window="rect", hop=None, average=1):
+        self.fft_size = fft_size
+        self.hop = hop or fft_size // 2
+        self.average = max(1, average)
+        self.bins = fft_size // 2 + 1  # rfft output size
+        # Window is scaled for unity gain, so spectrum levels are similar
+        # whichever window is used.
+        window = WINDOWS[window](fft_size)
+        self.window = (window / window.mean()).astype(np.float32)
+        # Enough samples for 'average' overlapping frames at once. The
+        # ring buffer must hold this much plus a hop (see ring_size()).
+        self.span = fft_size + (self.average - 1) * self.hop
+        self.samples = np.zeros(self.span, dtype=np.int16)
+        self.history = np.zeros((self.average, self.bins), dtype=np.float32)
+        self.history_index = 0    # Next row of history to replace
+        self.history_count = 0    # Rows of history filled so far
+        self.spectrum = np.zeros(self.bins, dtype=np.float32)  # Average
+        self.position = None      # Sample position of last frame's end
+        self.frames = 0           # Total analysis frames computed
+
+    def ring_size(self, headroom):
+        """Return the smallest RingBuffer size update() can read from
+           reliably, if up to 'headroom' more samples may be written
+           between it reading ring.written and reading the samples."""
+        return self.span + self.hop + headroom
+
+    def update(self, ring, written=None):
+        """Analyze any complete hops of new samples in ring (a RingBuffer)
+           up to sample position 'written' (default all that's there).
+           Returns the averaged magnitude spectrum (self.spectrum, an array
+           of fft_size / 2 + 1 values), unchanged if no hop has completed.
+           If more hops are pending than are averaged, only the most
+           recent 'average' are computed, as the rest would be discarded."""
+        if ring.size < self.span + self.hop:
+            raise ValueError("Ring buffer of %d samples too small for FFT "
+                             "size %d, hop %d, average %d" % (
+                                 ring.size, self.fft_size, self.hop,
+                                 self.average))
+        if written is None:
+            written = ring.written
+        end = written - written % self.hop  # Latest hop boundary
+        if self.position is None:
+            self.position = end - self.hop
+        count = min((end - self.position) // self.hop, self.average)
+        if count <= 0:
+            return self.spectrum
+        # Read all the new frames' samples (overlapping) in one go, then
+        # view them as 'count' rows of fft_size, hop samples apart, to
+        # window and transform together.
+        length = self.fft_size + (count - 1) * self.hop
+        samples = ring.read(end, length, self.samples[:length])
+        frames = as_strided(samples, shape=(count, self.fft_size),
+                            strides=(self.hop * samples.itemsize,
+                                     samples.itemsize))
+        magnitudes = np.abs(np.fft.rfft(frames * self.window, axis=1,
+                                        norm="ortho"))
+        for magnitude in magnitudes:
+            self.history[self.history_index] = magnitude
+            self.history_index = (self.history_index + 1) % self.average
+        self.history_count = min(self.history_count + count, self.average)
+        self.history.sum(axis=0, out=self.spectrum)
+        self.spectrum /= self.history_count  # Unfilled rows are zero
+        self.position = end
+        self.frames += count
+        return self.spectrum
+
+    def bin_frequency(self, rate):
+        """Return width of each spectrum bin in Hz at sample rate 'rate'."""
+        return rate / float(self.fft_size)
+
+class LogBinner(object):
+    """Maps 'bins' FFT magnitude values to 'columns' display columns.
+       Column centers run from bin 'least' to bin 'most', with column N of
+       the display at least + (most - least) * (N / (columns - 1)) ** exponent,
+       so low frequencies get fewer bins per column than high ones. Each
+       column applies a cubic weighting to the bins around its center, with
+       a slight overlap between columns. The weights are in self.matrix,
+       a (columns, last - first) float32 array covering only the bins from
+       self.first to self.last that any column actually uses."""
+
+    def __init__(self, columns, least, most, exponent, bins):
+        self.columns = columns
+        self.bins = bins
+        fracs = np.arange(columns) / float(max(1, columns - 1))  # 0.0 to 1.0
+        centers = least + (most - least) * (fracs ** exponent)
+        # Overlap is a function of distance to the prior column (or, for
+        # the first column, to the next).
+        neighbors = np.roll(centers, 1)
+        neighbors[0] = centers[1] if columns > 1 else centers[0]
+        widths = 0.75 + np.abs(centers - neighbors)  # Cubic curve half-widths
+        lefts = np.maximum(0, (centers - widths).astype(int))
+        rights = np.minimum((centers + widths + 1).astype(int), bins - 1)
+        self.first = int(lefts.min())
+        self.last = max(self.first, int(rights.max()))
+        # Weight of every used bin toward every column; zero outside each
+        # column's own clipped range, so the matrix is banded.
+        positions = np.arange(self.first, self.last) + 0.5
+        weights = self.weight(positions[np.newaxis, :], centers[:, np.newaxis],
+                              widths[:, np.newaxis])
+        bucket = np.arange(self.first, self.last)[np.newaxis, :]
+        weights[(bucket < lefts[:, np.newaxis]) |
+                (bucket >= rights[:, np.newaxis])] = 0.0
+        self.matrix = weights.astype(np.float32)
+        self.sums = self.matrix.sum(axis=1)  # Sum of weights per column
+
+    @staticmethod
+    def weight(pos, center, width):
+        """Used for 'weighting' values from the spectrum output into display
+           columns. Given a position 'pos' along X axis of spectrum out,
+           compute corresponding Y for cubic curve centered on 'center' with
+           range +/- 'width'. Returns 0.0 (outside or at very edge of curve)
+           to 1.0 (peak at center of curve). Works on NumPy arrays too."""
+        dist = 1.0 - np.minimum(np.abs(pos - center) / width, 1.0)
+        return ((3.0 - (dist * 2.0)) * dist) * dist
+
+    def scale(self, factors):
+        """Multiply each column's weights by the corresponding value in
+           factors (sequence or array of length 'columns')."""
+        self.matrix *= np.asarray(factors, dtype=np.float32)[:, np.newaxis]
+
+    def apply(self, spectrum):
+        """Return weighted sum of bins for each column, as an array of
+           length 'columns'. spectrum is an array of at least self.last
+           magnitude values, e.g. from np.fft.rfft()."""
+        return np.dot(self.matrix, spectrum[self.first:self.last])
+
+class OnsetDetector(object):
+    """Incremental onset (beat) detector using spectral flux: the total
+       increase in column levels (e.g. LogBinner output) since the previous
+       spectrum. An onset is reported when flux exceeds its recent mean by
+       'threshold' standard deviations, both tracked as exponential moving
+       averages (weight 'smoothing' per spectrum), and at least 'refractory'
+       seconds have passed since the last onset. Flux below 'floor' never
+       counts (quiet room noise). The first 'warmup' spectra only train
+       the averages. Each process() call is O(columns) with no allocation.
+       Functions passed to subscribe() are called as callback(time,
+       strength) on each onset, strength being standard deviations above
+       the mean flux."""
+
+    def __init__(self, columns, threshold=2.0, smoothing=0.05,
+                 refractory=0.12, floor=1.0, warmup=10):
+        self.threshold = threshold
+        self.smoothing = smoothing
+        self.refractory = refractory
+        self.floor = floor
+        self.warmup = warmup
+        self.prior = np.zeros(columns, dtype=np.float32)  # Last columns
+        self.rise = np.zeros(columns, dtype=np.float32)   # Work buffer
+        self.mean = 0.0         # Moving average of flux
+        self.variance = 0.0     # Moving variance of flux
+        self.last_onset = None  # Time of last onset
+        self.count = 0          # Spectra processed
+        self.onsets = 0         # Onsets detected
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        """Call callback(time, strength) on each onset."""
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        """Stop calling a callback passed to subscribe()."""
+        self.subscribers.remove(callback)
+
+    def process(self, columns, now):
+        """Process one new spectrum's column levels, 'now' being its time
+           in seconds (e.g. sample position / rate, so results don't
+           depend on frame timing). Notifies subscribers and returns
+           strength if it's an onset, else returns 0.0."""
+        np.subtract(columns, self.prior, out=self.rise)
+        np.maximum(self.rise, 0.0, out=self.rise)
+        flux = float(self.rise.sum())
+        self.prior[:] = columns
+        self.count += 1
+        deviation = flux - self.mean
+        spread = self.variance ** 0.5  # Standard deviation
+        # Update moving averages (incremental exponentially-weighted
+        # mean and variance)
+        self.mean += self.smoothing * deviation
+        self.variance = (1.0 - self.smoothing) * (
+            self.variance + self.smoothing * deviation * deviation)
+        if (self.count <= self.warmup or flux < self.floor or
+                deviation <= self.threshold * spread or
+                (self.last_onset is not None and
+                 now - self.last_onset < self.refractory)):
+            return 0.0
+        self.last_onset = now
+        self.onsets += 1
+        strength = deviation / max(spread, 1e-9)
+        for callback in self.subscribers:
+            callback(now, strength)
+        return strength
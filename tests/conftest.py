@@ -0,0 +1,8 @@
+"""Shared pytest setup: the Spectro scripts are top-level modules in the
+repository root rather than a package, so put that on the import path."""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
@@ -0,0 +1,49 @@
+"""Tests for audiosource.py's RingBuffer and generated sources."""
+
+import numpy as np
+import pytest
+from audiosource import RingBuffer, SyntheticSource
+
+def stream(count, start=0):
+    """Samples numbered start, start + 1, ... (as int16, wrapping)."""
+    return (np.arange(start, start + count) % 32768).astype(np.int16)
+
+@pytest.mark.parametrize("block", [1, 7, 100, 101, 250, 1000])
+def test_read_latest_across_wrap(block):
+    ring = RingBuffer(101)
+    written = 0
+    while written < 2000:
+        ring.write(stream(block, written))
+        written += block
+        count = min(written, ring.size)
+        assert (ring.read(written, count) ==
+                stream(count, written - count)).all()
+
+def test_read_before_end():
+    ring = RingBuffer(64)
+    ring.write(stream(150))
+    assert (ring.read(140, 40) == stream(40, 100)).all()
+
+def test_zeros_before_first_sample():
+    ring = RingBuffer(16)
+    ring.write(stream(5, 1))
+    assert ring.read(5, 8).tolist() == [0, 0, 0, 1, 2, 3, 4, 5]
+
+def test_oversized_write_keeps_newest_in_place():
+    ring = RingBuffer(10)
+    ring.write(stream(3))
+    ring.write(stream(25, 3))  # Longer than the ring
+    assert ring.written == 28
+    assert (ring.read(28, 10) == stream(10, 18)).all()
+    ring.write(stream(4, 28))  # And later writes continue after it
+    assert (ring.read(32, 10) == stream(10, 22)).all()
+
+def test_offline_source_is_repeatable():
+    results = []
+    for _ in range(2):
+        source = SyntheticSource(16000, 256, realtime=False, seed=4)
+        for _ in range(10):
+            source.poll()
+        results.append(source.read_latest(2048))
+    assert (results[0] == results[1]).all()
+    assert source.underruns == 0
@@ -0,0 +1,125 @@
+"""Tests for life.py's engines: all three must agree where they overlap."""
+
+import random
+import numpy as np
+import pytest
+import life
+
+SIZE = 64  # Grid is SIZE x SIZE; patterns start in the middle
+
+def soup(seed, size=16):
+    """Random ~50% fill of a size x size square in the middle of the grid,
+       as a list of (column, row)."""
+    rng = random.Random(seed)
+    start = (SIZE - size) // 2
+    return [(start + col, start + row) for row in range(size)
+            for col in range(size) if rng.random() < 0.5]
+
+def start_grid(engine, cells):
+    """Reset a torus engine, then replace its random start with cells."""
+    engine.reset()
+    for row in range(SIZE):
+        for col in range(SIZE):
+            engine.grid_now[row][col] = 0
+    for col, row in cells:
+        engine.grid_now[row][col] = 1
+
+def start_hashlife(engine, cells):
+    """Start a HashLifeEngine with cells (centered on 0, 0) in a viewport
+       showing the same area as the torus engines' grid at zoom 0."""
+    half = SIZE // 2
+    engine.root = engine.build([(col - half, row - half)
+                                for col, row in cells], 7, -64, -64)
+    engine.set_view(0, 0, zoom=0)
+
+def run(engine, generations):
+    for _ in range(generations):
+        engine.step()
+    return sorted(engine.cells())
+
+@pytest.mark.parametrize("seed", range(3))
+def test_engines_agree(seed):
+    # 20 generations can't spread a 16x16 soup to the torus edges, so the
+    # unbounded HashLife plane must match too
+    cells = soup(seed)
+    results = []
+    for name in ("reference", "numpy"):
+        engine = life.ENGINES[name](SIZE, SIZE)
+        start_grid(engine, cells)
+        results.append(run(engine, 20))
+    engine = life.HashLifeEngine(SIZE, SIZE)
+    start_hashlife(engine, cells)
+    results.append(run(engine, 20))
+    assert results[0] == results[1] == results[2]
+    assert results[0]  # Something survived, so it's a real test
+
+@pytest.mark.parametrize("speed", (1, 3, 5))
+def test_hashlife_fast_forward(speed):
+    # Each step advances 2^speed generations, in one memoized jump
+    cells = soup(4)
+    engine = life.NumpyEngine(SIZE, SIZE)
+    start_grid(engine, cells)
+    expected = run(engine, 32)
+    engine = life.HashLifeEngine(SIZE, SIZE, speed=speed)
+    start_hashlife(engine, cells)
+    assert run(engine, 32 >> speed) == expected
+
+def test_hashlife_zoomed_out():
+    # Zoomed-out pixels and the population's bounding box must agree with
+    # the cells seen at zoom 0
+    engine = life.HashLifeEngine(SIZE, SIZE)
+    start_hashlife(engine, soup(5))
+    run(engine, 20)
+    cells = [(col - SIZE // 2, row - SIZE // 2) for col, row in
+             engine.cells()]
+    expected = {}
+    for x, y in cells:
+        pixel = ((x + 2 * SIZE) >> 2, (y + 2 * SIZE) >> 2)
+        expected[pixel] = expected.get(pixel, 0) + 1
+    engine.set_view(0, 0, zoom=2)
+    assert {(col, row): count for col, row, count in
+            engine.pixels()} == expected
+    offset = 1 << (engine.root.k - 1)
+    left, top, right, bottom = engine.bounds(engine.root)
+    assert (left - offset, top - offset, right - offset,
+            bottom - offset) == (min(x for x, _ in cells),
+                                 min(y for _, y in cells),
+                                 max(x for x, _ in cells) + 1,
+                                 max(y for _, y in cells) + 1)
+
+@pytest.mark.parametrize("rule", ("highlife", "B36/S125", "brain",
+                                  "starwars"))
+def test_numpy_matches_reference_rules(rule):
+    cells = soup(7, 24)
+    results = []
+    for name in ("reference", "numpy"):
+        engine = life.ENGINES[name](SIZE, SIZE, life.Rule(rule))
+        start_grid(engine, cells)
+        run(engine, 12)
+        results.append((np.asarray(engine.array()).tolist(),
+                        np.asarray(engine.ages()).tolist()))
+    assert results[0] == results[1]
+
+def test_hashlife_trim_keeps_results(monkeypatch):
+    # Evicting aggressively must only cost time, never change the pattern
+    engine = life.HashLifeEngine(32, 16, soup=64)
+    engine.random.seed(3)
+    engine.reset()
+    for _ in range(200):
+        engine.step()
+    expected = engine.state_hash()
+
+    monkeypatch.setattr(life.HashLifeEngine, "SUCCESSORS", 256)
+    monkeypatch.setattr(life.HashLifeEngine, "NODES_PER_CELL", 1)
+    monkeypatch.setattr(life.HashLifeEngine, "EVICT_MIN", 64)
+    engine = life.HashLifeEngine(32, 16, soup=64)
+    engine.random.seed(3)
+    engine.reset()
+    for _ in range(200):
+        engine.step()
+        assert len(engine.successors) <= 256
+    assert engine.state_hash() == expected
+
+def test_hashlife_rejects_unsupported_rules():
+    with pytest.raises(ValueError):
+        life.HashLifeEngine(32, 16, rule=life.Rule("brain"))
@@ -0,0 +1,107 @@
+"""Tests for pixeldust.py's simulation engines."""
+
+import math
+import zlib
+import numpy as np
+import pytest
+from PIL import Image
+import pixeldust
+
+def turn(dust, iterations, period=200):
+    """Iterate dust with gravity turning once every 'period' iterations."""
+    for i in range(iterations):
+        angle = 2.0 * math.pi * i / period
+        dust.iterate((9.8 * math.sin(angle), 9.8 * math.cos(angle), 1.0))
+
+def checksum(dust):
+    """CRC of grain positions, as printed by 'benchmark.py dust'."""
+    return zlib.crc32(np.array(dust.get_positions(),
+                               dtype=np.float32).tobytes())
+
+def check_bitmap(dust):
+    """Every grain on its own pixel, and the bitmap exactly those pixels."""
+    position_x, position_y = dust.get_positions()
+    cells = (position_y.astype(np.intp) * dust.width +
+             position_x.astype(np.intp))
+    assert np.unique(cells).size == dust.num_grains
+    expected = np.zeros(dust.width * dust.height, dtype=np.uint8)
+    expected[cells] = 1
+    assert (np.asarray(dust.bitmap) == expected).all()
+
+ENGINES = dict(pixeldust.ENGINES, parallel=pixeldust.ParallelPixelDust)
+
+@pytest.mark.parametrize("engine", sorted(ENGINES))
+def test_seeded_runs_repeat(engine):
+    results = []
+    for _ in range(2):
+        dust = ENGINES[engine](32, 16, 0.1, 5)
+        dust.randomize(100)
+        turn(dust, 30)
+        results.append(checksum(dust))
+        dust.close()
+    assert results[0] == results[1]
+
+@pytest.mark.parametrize("engine", ("numpy", "parallel"))
+def test_grains_keep_own_pixels(engine):
+    dust = ENGINES[engine](64, 16, 0.1, 2)
+    dust.randomize(64 * 16 // 2)
+    for _ in range(4):
+        turn(dust, 25)
+        check_bitmap(dust)
+    dust.close()
+
+def test_parallel_single_band_matches_numpy():
+    # Without noise, one band is exactly the NumPy engine's iteration
+    results = []
+    for dust in (pixeldust.NumpyPixelDust(48, 24, 0.1, 1),
+                 pixeldust.ParallelPixelDust(48, 24, 0.1, 1, bands=1)):
+        dust.randomize(400)
+        dust.jitter[:] = 0.0
+        turn(dust, 60)
+        results.append(checksum(dust))
+        dust.close()
+    assert results[0] == results[1]
+
+def test_parallel_independent_of_workers():
+    results = []
+    for workers in (1, 2, 4):
+        dust = pixeldust.ParallelPixelDust(128, 16, 0.1, 9, bands=8,
+                                           workers=workers)
+        dust.randomize(700)
+        turn(dust, 60)
+        results.append(checksum(dust))
+        dust.close()
+    assert len(set(results)) == 1
+
+def test_parallel_close_with_view_held():
+    dust = pixeldust.ParallelPixelDust(32, 16, 0.1, 0, bands=2, workers=1)
+    dust.randomize(50)
+    turn(dust, 2)
+    kept = dust.position_x  # View into shared memory
+    dust.close()
+    assert kept.size == 50
+
+def test_parallel_narrow_bands():
+    # Bands are at least two pixels wide, so crossings of different
+    # edges never touch the same pixels
+    dust = pixeldust.ParallelPixelDust(12, 6, 0.1, 3, bands=12, workers=3)
+    assert dust.edges == [0, 2, 4, 6, 8, 10, 12]
+    dust.randomize(36)
+    for _ in range(4):
+        turn(dust, 25, period=50)
+        check_bitmap(dust)
+    dust.close()
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_dark_colors_are_obstacles(monkeypatch, numpy):
+    """Any non-black pixel in an obstacle image is an obstacle, including
+       colors that round to black in greyscale, with or without NumPy."""
+    if not numpy:
+        monkeypatch.setattr(pixeldust, "np", None)
+    image = Image.new("RGB", (4, 2))
+    image.putpixel((1, 0), (1, 0, 0))
+    image.putpixel((2, 1), (0, 0, 2))
+    expected = bytes([0, 1, 0, 0, 0, 0, 1, 0])
+    assert pixeldust.mask_bytes(image, 4, 2) == expected
+    assert pixeldust.mask_bytes(image.convert("RGBA"), 4, 2) == expected
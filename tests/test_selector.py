@@ -0,0 +1,100 @@
+"""Tests for selector.py, driving mode switches with a SimulatedButton on
+the virtual matrix backend."""
+
+import os
+import signal
+import sys
+import pytest
+import selector
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Done(Exception):
+    """Raised from account() to end Selector.run()'s endless loop."""
+
+@pytest.fixture
+def run_selector(monkeypatch):
+    """Return a function that runs a Selector over the given PROGRAMS with
+       extra command-line arguments until 'modes' modes have ended. It
+       returns the Selector and the list of (program, reason) for each
+       mode, in order."""
+    monkeypatch.chdir(ROOT)
+    monkeypatch.setattr(selector, "PYTHON", sys.executable)
+    selectors = []
+
+    def run(programs, modes, *args):
+        monkeypatch.setattr(selector, "PROGRAMS", programs)
+        monkeypatch.setattr(sys, "argv", ["selector.py"] + list(args))
+        sel = selector.Selector()
+        selectors.append(sel)
+        ended = []
+        account = sel.account
+
+        def count(config, start_time, reason):
+            account(config, start_time, reason)
+            ended.append((config["program"], reason))
+            if len(ended) >= modes:
+                raise Done()
+
+        sel.account = count
+        with pytest.raises(Done):
+            sel.run()
+        return sel, ended
+
+    yield run
+    signal.set_wakeup_fd(-1)
+    signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+    for sel in selectors:
+        if sel.button is not None:
+            sel.button.close()
+        if sel.zygote is not None:
+            sel.zygote.cancel()
+
+def test_button_cycles_modes(run_selector):
+    """Each simulated press advances to the next mode, wrapping around,
+       with hosted and subprocess modes each reaching their first frame."""
+    programs = ({"program": "bargraph.py"},
+                {"program": "life.py", "in_process": False},
+                {"program": "arcade_clock.py"})
+    sel, ended = run_selector(programs, 4, "--led-backend", "virtual",
+                              "--simulate", "1.5")
+    assert ended == [("bargraph.py", "button"), ("life.py", "button"),
+                     ("arcade_clock.py", "button"),
+                     ("bargraph.py", "button")]
+    assert "--led-backend=virtual" in sel.flags
+    assert [program for program, _ in sel.switch_latencies] == [
+        program for program, _ in ended]
+    for config in programs:
+        stats = sel.stats[config["program"]]
+        assert stats["crashes"] == 0
+        assert stats["zygote_failures"] == 0
+    assert sel.stats["bargraph.py"]["launches"] == 2
+    assert sel.stats["life.py"]["cpu"] > 0.0
+
+def test_crashed_mode_restarts(run_selector, tmp_path):
+    """A mode that exits with an error is restarted up to its 'restart'
+       count, then the selector moves on."""
+    script = tmp_path / "crash.py"
+    script.write_text("import sys\nsys.exit(1)\n")
+    programs = ({"program": str(script), "in_process": False,
+                 "restart": 2, "backoff": 0.01},
+                {"program": "bargraph.py"})
+    sel, ended = run_selector(programs, 4, "--led-backend", "virtual",
+                              "--simulate", "1.5", "--no-zygote")
+    assert ended == [(str(script), "crash")] * 3 + [("bargraph.py",
+                                                      "button")]
+    assert sel.stats[str(script)]["crashes"] == 3
+    assert sel.stats[str(script)]["restarts"] == 2
+
+def test_stable_mode_restart_budget(run_selector, tmp_path):
+    """A crash after running longer than 'backoff_max' doesn't count
+       against the 'restart' budget of earlier crashes."""
+    script = tmp_path / "crash.py"
+    script.write_text("import sys, time\ntime.sleep(0.3)\nsys.exit(1)\n")
+    programs = ({"program": str(script), "in_process": False,
+                 "restart": 1, "backoff": 0.01, "backoff_max": 0.1},
+                {"program": "bargraph.py"})
+    sel, ended = run_selector(programs, 4, "--led-backend", "virtual",
+                              "--simulate", "10", "--no-zygote")
+    assert ended == [(str(script), "crash")] * 4
+    assert sel.stats[str(script)]["restarts"] == 3
@@ -0,0 +1,86 @@
+"""Tests for SpectroBase's frame scheduler and run_frames() loop."""
+
+import time
+import pytest
+import spectrobase
+from spectrobase import FrameScheduler, SpectroBase
+
+class FakeClock(object):
+    """Stands in for time.monotonic() and time.sleep()."""
+
+    def __init__(self):
+        self.now = 100.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(spectrobase.time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(spectrobase.time, "sleep", fake.sleep)
+    return fake
+
+def test_sleeps_to_deadlines(clock):
+    scheduler = FrameScheduler(10)
+    scheduler.wait()  # First frame starts at once
+    assert clock.sleeps == []
+    for work in (0.03, 0.0, 0.099):
+        clock.now += work  # Frame takes this long to draw
+        scheduler.wait()
+    # Each frame starts exactly 0.1 s after the last, whatever it took
+    assert clock.sleeps == pytest.approx([0.07, 0.1, 0.001])
+    assert clock.now == pytest.approx(100.3)
+    assert scheduler.dropped == 0
+
+def test_overrun_drops_deadlines(clock):
+    scheduler = FrameScheduler(10)
+    scheduler.wait()
+    clock.now += 0.35  # Missed the deadlines at 0.1, 0.2 and 0.3
+    scheduler.wait()
+    assert clock.sleeps == []
+    assert scheduler.dropped == 2  # 0.1 late frame runs now, 2 skipped
+    scheduler.wait()  # Back on the original grid at 0.4
+    assert clock.now == pytest.approx(100.4)
+
+def test_free_running(clock):
+    scheduler = FrameScheduler(0)
+    for _ in range(3):
+        scheduler.wait()
+    assert clock.sleeps == []
+    scheduler.skip()  # Nothing to draw: poll rather than spin
+    assert clock.sleeps == [scheduler.poll]
+    assert scheduler.skipped == 1
+
+class Counter(SpectroBase):
+    """Script redrawing on change, never changing after its first frame."""
+
+    def __init__(self):
+        super(Counter, self).__init__()
+        self.on_change = True
+        self.checks = 0
+
+    def needs_redraw(self):
+        self.checks += 1
+        if self.checks > 20:  # Long enough, stop
+            self.running = False
+        return self.checks == 1
+
+    def render(self, canvas):
+        canvas.Fill(255, 0, 0)
+
+def test_on_change_at_fps_0_polls():
+    app = Counter()
+    app.args = app.parser.parse_args(["--led-backend=virtual", "--fps=0"])
+    app.matrix = app.create_matrix()
+    start = time.monotonic()
+    app.run()
+    assert app.scheduler.frames == 1
+    assert app.scheduler.skipped == 20
+    assert time.monotonic() - start >= 20 * app.scheduler.poll * 0.9
+    assert (app.matrix.pixels == (255, 0, 0)).all()
@@ -0,0 +1,26 @@
+"""Tests for spectrum.py's analyzer working from an audiosource ring."""
+
+import numpy as np
+import pytest
+from audiosource import RingBuffer, SyntheticSource
+from spectrum import SpectrumAnalyzer
+
+@pytest.mark.parametrize("fft_size, hop, average", [
+    (1024, None, 1), (32768, None, 1), (4096, 4096, 8), (2048, 256, 16)])
+def test_ring_sized_for_analyzer(fft_size, hop, average):
+    analyzer = SpectrumAnalyzer(fft_size, "hann", hop, average)
+    source = SyntheticSource(32000, 512, (1000.0,), noise=0.0,
+                             realtime=False,
+                             buffer_size=analyzer.ring_size(512))
+    # Until every averaged frame is all tone, none the initial silence
+    while source.ring.written < analyzer.span + average * analyzer.hop:
+        analyzer.update(source.ring, source.poll())
+    peak = np.argmax(analyzer.spectrum) * analyzer.bin_frequency(32000)
+    assert abs(peak - 1000.0) <= analyzer.bin_frequency(32000)
+
+def test_ring_too_small():
+    analyzer = SpectrumAnalyzer(32768)
+    ring = RingBuffer(32000)
+    ring.write(np.zeros(40000, dtype=np.int16))
+    with pytest.raises(ValueError):
+        analyzer.update(ring)
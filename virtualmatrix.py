@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""
+Headless stand-in for hzeller's rgbmatrix.RGBMatrix, selected in SpectroBase
+with --led-backend=virtual. Pixels go into NumPy arrays instead of an LED
+panel, so any Spectro script can run (and be benchmarked) on a desktop
+machine without a Pi attached. Only the subset of the RGBMatrix API used by
+the Spectro scripts is provided: CreateFrameCanvas(), SwapOnVSync(),
+SetImage(), SetPixel(), Fill() and Clear().
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, invalid-name
+
+import time
+import numpy as np
+
+class FrameLimitReached(Exception):
+    """Raised by VirtualMatrix.SwapOnVSync() once frame_limit frames have
+       been shown, letting a benchmark break out of a script's run() loop."""
+
+class VirtualCanvas(object):
+    """NumPy-backed equivalent of an RGBMatrix FrameCanvas. Pixel data is
+       a (height, width, 3) uint8 array in self.pixels."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.pixels = np.zeros((height, width, 3), dtype=np.uint8)
+
+    def SetPixel(self, x, y, red, green, blue):
+        """Set one pixel; out-of-bounds coordinates are ignored."""
+        x = int(x)
+        y = int(y)
+        if 0 <= x < self.width and 0 <= y < self.height:
+            self.pixels[y, x] = (max(0, min(int(red), 255)),
+                                 max(0, min(int(green), 255)),
+                                 max(0, min(int(blue), 255)))
+
+    def Fill(self, red, green, blue):
+        """Set every pixel on the canvas to one color."""
+        self.pixels[:] = (red, green, blue)
+
+    def Clear(self):
+        """Set every pixel on the canvas to black."""
+        self.pixels.fill(0)
+
+    def SetImage(self, image, offset_x=0, offset_y=0, unsafe=True):
+        """Copy an RGB PIL image to the canvas at the given offset,
+           clipped to the canvas bounds. The 'unsafe' argument is accepted
+           for compatibility and ignored."""
+        if image.mode != "RGB":
+            raise ValueError("Currently, only RGB mode is supported for "
+                             "SetImage(). Please create images with mode "
+                             "'RGB' or convert first.")
+        source = np.asarray(image)
+        left = max(0, offset_x)
+        top = max(0, offset_y)
+        right = min(self.width, offset_x + image.width)
+        bottom = min(self.height, offset_y + image.height)
+        if right > left and bottom > top:
+            self.pixels[top:bottom, left:right] = source[
+                top - offset_y:bottom - offset_y,
+                left - offset_x:right - offset_x]
+
+class VirtualMatrix(VirtualCanvas):
+    """NumPy-backed equivalent of RGBMatrix. Drawing directly on the matrix
+       affects the currently-displayed canvas, as with the real thing.
+       If frame_limit is set, per-swap wall-clock and CPU timestamps
+       (time.perf_counter() and time.process_time()) are collected in
+       swap_times and swap_cpu_times, and FrameLimitReached is raised once
+       that many frames have been swapped."""
+
+    def __init__(self, width, height, brightness=100):
+        super(VirtualMatrix, self).__init__(width, height)
+        self.brightness = brightness
+        self.frame_count = 0
+        self.frame_limit = None
+        self.swap_times = []
+        self.swap_cpu_times = []
+
+    def CreateFrameCanvas(self):
+        """Return a new offscreen canvas the same size as the matrix."""
+        return VirtualCanvas(self.width, self.height)
+
+    def SwapOnVSync(self, canvas, framerate_fraction=1):
+        """'Display' canvas by exchanging its pixels with the matrix's,
+           returning the canvas (now holding the prior frame) for reuse."""
+        self.pixels, canvas.pixels = canvas.pixels, self.pixels
+        self.frame_count += 1
+        if self.frame_limit is not None:
+            self.swap_times.append(time.perf_counter())
+            self.swap_cpu_times.append(time.process_time())
+            if self.frame_count >= self.frame_limit:
+                raise FrameLimitReached()
+        return canvas
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""
+Pre-warmed "zygote" processes for selector.py. Much of a Python mode's
+startup time on a Pi Zero is the interpreter itself plus importing PIL,
+NumPy and spectrobase. A Zygote is started by the selector ahead of time
+(running this file), does all of that (and compiles the mode's script) in
+the background, then blocks until start() is called on a button press, at
+which point the script runs immediately as __main__ in the already-warm
+process.
+
+Zygote is a subprocess.Popen, so has the usual poll()/terminate()/kill()/
+wait()/returncode interface. The zygote runs under the selector's own
+Python interpreter. Zygote and ReadyPopen (a Popen for cold starts) both
+report the time from mode switch to the script's first frame.
+"""
+
+# Gets code to pass both pylint & pylint3:
+# pylint: disable=bad-option-value, useless-object-inheritance, broad-except
+
+import os
+import sys
+import time
+import select
+import signal
+import importlib
+import traceback
+import subprocess
+
+# Modules imported by each zygote before it's needed
+PRELOAD = ("numpy", "PIL.Image", "PIL.ImageDraw", "PIL.ImageFont",
+           "spectrobase")
+# Environment variable telling SpectroBase which file descriptor to write
+# one byte to when its first frame is shown (for startup latency)
+READY_FD_VARIABLE = "SPECTRO_READY_FD"
+
+def wait_readable(file_descriptor, timeout):
+    """Block until file_descriptor is readable or timeout (seconds, None for
+       no limit) elapses. Returns one byte read, b'' at EOF or None on
+       timeout."""
+    readable, _, _ = select.select([file_descriptor], [], [], timeout)
+    if not readable:
+        return None
+    return os.read(file_descriptor, 1)
+
+class ReadyWatcher(object):
+    """Mixin tracking a child's first frame via the read end of its
+       SPECTRO_READY_FD pipe (self.ready_fd, closed and set None at EOF, so
+       it's safe to include in a select() loop while not None)."""
+
+    start_time = None        # When the mode switch began
+    first_frame_time = None  # When the script showed its first frame
+    ready_fd = None
+
+    def wait_first_frame(self, timeout=None):
+        """Block until the script shows its first frame (timeout 0 just
+           checks). Returns seconds from start to first frame, or None."""
+        while self.first_frame_time is None and self.ready_fd is not None:
+            byte = wait_readable(self.ready_fd, timeout)
+            if byte is None:
+                break
+            elif byte == b"f":
+                self.first_frame_time = time.time()
+            elif byte == b"":  # Process exited or closed pipe
+                self.close_ready()
+        if self.first_frame_time is None:
+            return None
+        return self.first_frame_time - self.start_time
+
+    def switch_latency(self):
+        """Seconds from start to the script's first frame, or None if
+           no frame yet. Doesn't block."""
+        return self.wait_first_frame(0)
+
+    def close_ready(self):
+        """Close the ready pipe (no more first-frame tracking)."""
+        if self.ready_fd is not None:
+            os.close(self.ready_fd)
+            self.ready_fd = None
+
+class ReadyPopen(ReadyWatcher, subprocess.Popen):
+    """subprocess.Popen that passes the child a SPECTRO_READY_FD pipe, for
+       first-frame latency of cold-started modes. start_time (default now)
+       is when the mode switch began."""
+
+    def __init__(self, args, start_time=None, **kwargs):
+        ready_read, ready_write = os.pipe()
+        env = dict(kwargs.pop("env", None) or os.environ)
+        env[READY_FD_VARIABLE] = str(ready_write)
+        super(ReadyPopen, self).__init__(
+            args, env=env, pass_fds=(ready_write,), **kwargs)
+        os.close(ready_write)
+        self.ready_fd = ready_read
+        self.start_time = time.time() if start_time is None else start_time
+
+class Zygote(ReadyWatcher, subprocess.Popen):
+    """A pre-warmed Python process waiting to run one script, started
+       fresh (this file run under the selector's interpreter, with no
+       inherited file descriptors) rather than forked from the selector,
+       so it shares none of its threads, locks or memory. argv is the
+       script's command line (script filename first). The zygote writes
+       b'w' to ready_fd once warm, and the script writes b'f' there when
+       its first frame is shown."""
+
+    def __init__(self, argv):
+        self.argv = list(argv)
+        self.spawn_time = time.time()
+        go_read, go_write = os.pipe()
+        status_read, status_write = os.pipe()
+        super(Zygote, self).__init__(
+            [sys.executable, os.path.abspath(__file__), str(go_read),
+             str(status_write)] + self.argv,
+            close_fds=True, pass_fds=(go_read, status_write))
+        os.close(go_read)
+        os.close(status_write)
+        self.go_fd = go_write
+        self.ready_fd = status_read
+
+    def wait_warm(self, timeout=None):
+        """Block until the zygote has finished warming up. Returns True if
+           it's ready, False on timeout or if it died."""
+        return wait_readable(self.ready_fd, timeout) == b"w"
+
+    def start(self, start_time=None):
+        """Run the script (call once; the zygote needn't be warm yet).
+           start_time (default now) is when the mode switch began, for
+           switch latency reporting. Returns False if the zygote already
+           died (e.g. the script failed to compile or an import crashed
+           it during warmup), in which case it's reaped and returncode
+           holds its exit status (nonzero)."""
+        self.start_time = time.time() if start_time is None else start_time
+        try:
+            os.write(self.go_fd, b"g")
+        except OSError:  # BrokenPipeError, zygote has exited
+            os.close(self.go_fd)
+            self.go_fd = None
+            self.stop()
+            if not self.returncode:
+                self.returncode = 1  # Exited without running the script
+            return False
+        os.close(self.go_fd)
+        self.go_fd = None
+        return True
+
+    def cancel(self):
+        """Discard an unstarted zygote."""
+        if self.go_fd is not None:
+            os.close(self.go_fd)  # Zygote exits when it sees EOF
+            self.go_fd = None
+        self.stop()
+
+    def stop(self, timeout=2.0):
+        """Reap the process, killing it if it hasn't exited within timeout
+           seconds (e.g. still stuck warming up). Returns returncode."""
+        try:
+            self.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.kill()
+            self.wait()
+        self.close_ready()
+        return self.returncode
+
+def zygote_main(go_fd, status_fd, argv):
+    """Zygote process body: warm up, wait for go-ahead, run script."""
+    status = 1
+    try:
+        for name in PRELOAD:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+        with open(argv[0]) as script_file:
+            code = compile(script_file.read(), argv[0], "exec")
+        os.write(status_fd, b"w")  # Warm
+        if os.read(go_fd, 1) != b"g":
+            os._exit(0)  # Cancelled (parent closed the pipe)
+        os.close(go_fd)
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        os.environ[READY_FD_VARIABLE] = str(status_fd)
+        sys.argv = argv
+        sys.path[0] = os.path.dirname(os.path.abspath(argv[0]))
+        exec(code, {"__name__": "__main__",  # pylint: disable=exec-used
+                    "__file__": argv[0],
+                    "__builtins__": __builtins__})
+        status = 0
+    except SystemExit as error:
+        if error.code is None or isinstance(error.code, int):
+            status = error.code or 0
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(status)  # pylint: disable=protected-access
+
+if __name__ == "__main__":
+    zygote_main(int(sys.argv[1]), int(sys.argv[2]), sys.argv[3:])